@@ -0,0 +1,78 @@
+"""
+Compare finding similarly named tasks with the index against comparing with
+every task, for a project with thousands of generated tasks.
+
+Usage::
+
+    python benchmarks/fuzzy.py [--tasks N]
+"""
+
+from argparse import ArgumentParser
+from difflib import SequenceMatcher
+from pathlib import Path
+import random
+import string
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from mo.project import TaskIndex  # noqa: E402
+
+
+def generate_names(count, rng):
+    names = set()
+
+    while len(names) < count:
+        package = ''.join(rng.choice(string.ascii_lowercase)
+                          for _ in range(rng.randint(4, 14)))
+        names.add(f'{rng.choice(["test", "lint", "build"])}:{package}')
+
+    return sorted(names)
+
+
+def make_typo(name, rng):
+    i = rng.randrange(len(name))
+    return name[:i] + rng.choice(string.ascii_lowercase) + name[i + 1:]
+
+
+def full_scan(name, names):
+    return [n for n in names if SequenceMatcher(None, name, n).ratio() >= 0.75]
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--tasks', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=50)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    rng = random.Random(0)
+    names = generate_names(args.tasks, rng)
+    queries = [make_typo(rng.choice(names), rng) for _ in range(args.queries)]
+
+    start = time.perf_counter()
+    index = TaskIndex(names)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = [full_scan(query, names) for query in queries]
+    scan = (time.perf_counter() - start) / len(queries)
+
+    start = time.perf_counter()
+    found = [index.search(query) for query in queries]
+    indexed = (time.perf_counter() - start) / len(queries)
+
+    assert found == expected, 'the index found different tasks'
+
+    print(f'{args.tasks} tasks, index built in {build * 1000:.1f}ms')
+    print(f'full scan: {scan * 1000:.2f}ms per lookup')
+    print(f'indexed:   {indexed * 1000:.2f}ms per lookup')
+
+
+if __name__ == '__main__':
+    main()
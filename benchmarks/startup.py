@@ -0,0 +1,71 @@
+"""
+Measure how long ``mo`` spends importing modules when listing tasks.
+
+The import time of the interpreter on its own is subtracted, leaving only the
+time spent importing M-O and its dependencies. The best of several runs is
+compared against a budget, and the script fails if it is over.
+
+Usage::
+
+    python benchmarks/startup.py [--budget MS] [--runs N]
+"""
+
+from argparse import ArgumentParser
+from pathlib import Path
+import subprocess
+import sys
+
+
+ROOT = Path(__file__).resolve().parent.parent
+MOFILE = ROOT / 'tests' / 'examples' / 'mofile.json'
+
+
+def import_time(*args):
+    """Run Python with ``-X importtime`` and total the time in microseconds."""
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', *args], cwd=ROOT,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True, check=False,
+    )
+
+    total = 0
+
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        self_time = line.split(':', 1)[1].split('|')[0]
+        total += int(self_time)
+
+    return total
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--budget', type=float, default=80,
+                        help='Maximum import time in milliseconds.')
+    parser.add_argument('--runs', type=int, default=5)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    mo_args = ['-m', 'mo', '-f', str(MOFILE), '--frontend', 'json']
+
+    baseline = min(import_time('-c', 'pass') for _ in range(args.runs))
+    mo = min(import_time(*mo_args) for _ in range(args.runs))
+
+    milliseconds = (mo - baseline) / 1000
+
+    print(f'mo help import time: {milliseconds:.1f}ms '
+          f'(budget {args.budget:.1f}ms)')
+
+    if milliseconds > args.budget:
+        print('Over budget!')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+"""
+Benchmarks for loading task files, scheduling and running tasks, running
+commands and rendering events.
+
+Results are printed, and can be saved as JSON to compare against later, for
+example from another commit::
+
+    python benchmarks/suite.py --output before.json
+    git checkout my-branch
+    python benchmarks/suite.py --compare before.json
+
+Benchmarks can be filtered by name with ``--filter``.
+"""
+
+from argparse import ArgumentParser
+from contextlib import contextmanager, redirect_stdout
+from pathlib import Path
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from mo import events, frontends, mofile  # noqa: E402
+from mo.project import Project  # noqa: E402
+from mo.runner import Runner  # noqa: E402
+from mo.steps import _run_command  # noqa: E402
+
+
+registered_benchmarks = {}
+
+
+def benchmark(name, unit):
+    """
+    Register a benchmark.
+
+    The benchmark function returns how many units of work it did, and the
+    result is reported as the time per unit.
+    """
+
+    def decorator(func):
+        registered_benchmarks[name] = (func, unit)
+        return func
+
+    return decorator
+
+
+def measure(func, repeat):
+    """Run a benchmark a number of times, returning the best time per unit."""
+
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        units = func()
+        elapsed = (time.perf_counter() - start) / units
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def generate_config(tasks, steps=1):
+    return {
+        'variables': {
+            'greeting': {'description': 'The greeting.', 'default': 'hi'},
+        },
+        'tasks': {
+            f'task{i}': {
+                'description': f'Task number {i}.',
+                'steps': [{'print': f'{{greeting}} {j}'} for j in range(steps)],
+                'after': [f'task{i - 1}'] if i else [],
+            }
+            for i in range(tasks)
+        },
+    }
+
+
+def write_mofile(directory, format, tasks):
+    import toml
+    import yaml
+
+    config = generate_config(tasks)
+    path = Path(directory) / f'Mofile.{format}'
+
+    with path.open('w') as file:
+        if format == 'yaml':
+            yaml.safe_dump(config, file)
+        elif format == 'json':
+            json.dump(config, file)
+        elif format == 'toml':
+            toml.dump(config, file)
+
+    return path
+
+
+def _timed(func):
+    # for benchmarks with setup they don't want measured, which return the
+    # time taken themselves
+    func.timed = True
+    return func
+
+
+def _register_load_benchmarks():
+    for format in ('yaml', 'json', 'toml'):
+        for tasks in (10, 1000):
+            for cache in (False, True):
+                name = f'load.{format}.{tasks}' + ('.cached' if cache else '')
+
+                def load(format=format, tasks=tasks, cache=cache):
+                    with tempfile.TemporaryDirectory() as directory:
+                        path = write_mofile(directory, format, tasks)
+                        mofile.load(path, cache=cache)
+
+                        start = time.perf_counter()
+                        mofile.load(path, cache=cache)
+                        return time.perf_counter() - start
+
+                benchmark(name, 'load')(_timed(load))
+
+
+_register_load_benchmarks()
+
+
+@contextmanager
+def temporary_project(config):
+    # each run gets a directory of its own, so the history, fingerprints and
+    # logs it writes don't end up in the checkout's .mo directory
+    with tempfile.TemporaryDirectory() as directory:
+        yield Project(config, Path(directory))
+
+
+def _run_tasks(tasks, steps, jobs):
+    with temporary_project(generate_config(tasks, steps)) as project:
+        runner = Runner(project, {}, jobs)
+        runner.queue_task(f'task{tasks - 1}')
+
+        for event in runner.run():
+            pass
+
+
+@benchmark('runner.task', 'task')
+def runner_per_task():
+    _run_tasks(200, 1, 1)
+    return 200
+
+
+@benchmark('runner.step', 'step')
+def runner_per_step():
+    _run_tasks(1, 2000, 1)
+    return 2000
+
+
+@benchmark('runner.task.jobs4', 'task')
+def runner_per_task_concurrently():
+    _run_tasks(200, 1, 4)
+    return 200
+
+
+@benchmark('command.lines', 'line')
+def command_lines():
+    lines = 200000
+    for event in _run_command(f'yes line | head -n {lines}'):
+        pass
+    return lines
+
+
+@benchmark('command.bytes', 'MiB')
+def command_bytes():
+    megabytes = 100
+    command = f'head -c {megabytes * 1024 * 1024} /dev/zero | tr "\\0" x'
+    for event in _run_command(command):
+        pass
+    return megabytes
+
+
+@benchmark('command.spawn', 'command')
+def command_spawn():
+    commands = 50
+    for _ in range(commands):
+        for event in _run_command('true'):
+            pass
+    return commands
+
+
+@benchmark('command.exec.shell', 'command')
+def command_exec_shell():
+    commands = 50
+    for _ in range(commands):
+        for event in _run_command('cat /dev/null'):
+            pass
+    return commands
+
+
+@benchmark('command.exec.direct', 'command')
+def command_exec_direct():
+    commands = 50
+    for _ in range(commands):
+        for event in _run_command('cat /dev/null', argv=['cat', '/dev/null']):
+            pass
+    return commands
+
+
+def _run_commands(command, steps):
+    config = {
+        'tasks': {
+            'commands': {
+                'description': 'Lots of small commands.',
+                'steps': [command] * steps,
+            },
+        },
+    }
+
+    with temporary_project(config) as project:
+        for event in Runner(project, {}).run_task('commands'):
+            pass
+
+    return steps
+
+
+@benchmark('runner.commands', 'step')
+def runner_commands():
+    # split when planned, and run without a shell
+    return _run_commands('cat /dev/null', 200)
+
+
+@benchmark('runner.commands.shell', 'step')
+def runner_commands_shell():
+    # the redirect needs a shell
+    return _run_commands('cat < /dev/null', 200)
+
+
+def _render(name):
+    with temporary_project(generate_config(1)) as project:
+        task = project.tasks['task0']
+
+    stream = [events.running_task(task), events.running_command('make')]
+    stream += [events.command_output('stdout', b'some output from make')
+               for _ in range(20000)]
+    stream += [events.finished_task(task)]
+    stream = [event._replace(task='task0') for event in stream]
+
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        frontend = getattr(frontends, name)()
+        frontend.write = devnull.write
+        frontend.begin()
+        for event in stream:
+            frontend.output(event)
+        frontend.end()
+
+    return len(stream)
+
+
+for _name in ('Human', 'Live', 'Json', 'Debug'):
+    benchmark(f'render.{_name.lower()}', 'event')(
+        lambda name=_name: _render(name)
+    )
+
+
+def run_benchmarks(pattern, repeat):
+    results = {}
+
+    for name, (func, unit) in registered_benchmarks.items():
+        if pattern and pattern not in name:
+            continue
+
+        if getattr(func, 'timed', False):
+            seconds = min(func() for _ in range(repeat))
+        else:
+            seconds = measure(func, repeat)
+
+        results[name] = {'seconds': seconds, 'unit': unit}
+        print(f'{name:<28} {seconds * 1e6:>12.2f}us per {unit}')
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT, universal_newlines=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, filename, threshold):
+    """Compare against saved results, returning whether any regressed."""
+
+    with open(filename) as file:
+        baseline = json.load(file)['results']
+
+    regressed = False
+
+    print()
+    print(f'Compared with {filename}:')
+
+    for name, result in results.items():
+        try:
+            before = baseline[name]['seconds']
+        except KeyError:
+            continue
+
+        change = result['seconds'] / before - 1
+        marker = ''
+        if change > threshold:
+            marker = ' REGRESSION'
+            regressed = True
+
+        print(f'{name:<28} {change:>+8.1%}{marker}')
+
+    return regressed
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--filter', help='Only run benchmarks containing this.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Save the results to this file.')
+    parser.add_argument('--compare', help='Compare with results in this file.')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Slow down, as a fraction, to call a regression.')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    results = run_benchmarks(args.filter, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'time': time.time(),
+                'results': results,
+            }, file, indent=2)
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""Contains the event bus, which fans events out to several frontends."""
+
+from collections import deque
+import threading
+
+from . import events
+
+
+_CLOSE = object()
+
+
+def _join_output(chunks):
+    if all(isinstance(chunk, bytes) for chunk in chunks):
+        return b'\n'.join(chunks)
+    return '\n'.join(events.decode(chunk) for chunk in chunks)
+
+
+class _Coalesced:
+    """
+    Command output from one task and pipe, merged while the queue is full.
+
+    The lines are only joined once, when the writer takes them, so merging
+    each line doesn't copy everything merged before it.
+    """
+
+    __slots__ = ('pipe', 'task', 'chunks', 'size')
+
+    def __init__(self, event):
+        self.pipe = event.pipe
+        self.task = event.task
+        self.chunks = [event.output]
+        self.size = len(event.output)
+
+    def matches(self, event):
+        return self.task == event.task and self.pipe == event.pipe
+
+    def add(self, output):
+        self.chunks.append(output)
+        self.size += len(output) + 1
+
+    def event(self):
+        return events.CommandOutput(self.pipe, _join_output(self.chunks),
+                                    self.task)
+
+
+class Subscriber:
+    """
+    A subscriber passes events to a frontend from its own writer thread, so a
+    slow frontend never holds up the runner.
+
+    Events wait in a bounded queue. When the queue is full, what happens to
+    command output depends on the overflow policy:
+
+    ``block``
+        Wait for the frontend to catch up.
+    ``drop``
+        Throw the output away, the frontend is told how much was dropped.
+    ``coalesce``
+        Merge the output into the last queued output from the same task and
+        pipe, so it's written in one go. Merged output is capped at
+        ``max_coalesced`` bytes, and the queue only goes over ``maxsize`` by
+        as much again when there's nothing to merge with, beyond which output
+        is dropped.
+
+    Any other event always waits for space, so is never lost.
+
+    Parameters
+    ----------
+    frontend : Frontend
+        The frontend to pass events to.
+    maxsize : int
+        The number of events to queue.
+    policy : str
+        What to do with command output when the queue is full.
+    """
+
+    policies = ('block', 'drop', 'coalesce')
+
+    max_coalesced = 1024 * 1024
+    """The most bytes of output to merge into one event."""
+
+    def __init__(self, frontend, maxsize=1024, policy='coalesce'):
+        if policy not in self.policies:
+            raise ValueError(f'Unknown overflow policy: {policy}')
+
+        self.frontend = frontend
+        self.maxsize = maxsize
+        self.policy = policy
+
+        self.dropped = 0
+
+        self._events = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._error = None
+
+    def start(self):
+        """Start the writer thread."""
+
+        self._thread = threading.Thread(target=self._write,
+                                        name='mo-subscriber', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """
+        Wait for every queued event to be written, then stop the writer
+        thread.
+        """
+
+        self._put(_CLOSE)
+        self._thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+    def publish(self, event):
+        """Queue an event for the frontend."""
+
+        with self._condition:
+            if self._error is not None:
+                return
+
+            full = len(self._events) >= self.maxsize
+
+            if full and event.tag == events.CommandOutput.tag:
+                if self.policy == 'drop':
+                    self.dropped += 1
+                    return
+                elif self.policy == 'coalesce':
+                    self._coalesce(event)
+                    return
+
+        self._put(event)
+
+    def _coalesce(self, event):
+        last = self._events[-1]
+
+        if isinstance(last, events.CommandOutput) and \
+                last.task == event.task and last.pipe == event.pipe:
+            last = self._events[-1] = _Coalesced(last)
+
+        if isinstance(last, _Coalesced) and last.matches(event):
+            if last.size + len(event.output) <= self.max_coalesced:
+                last.add(event.output)
+                return
+        elif len(self._events) < 2 * self.maxsize:
+            # nothing to merge with, so go over the limit rather than wait,
+            # and merge what comes after into it
+            self._events.append(_Coalesced(event))
+            self._condition.notify_all()
+            return
+
+        self.dropped += 1
+
+    def _put(self, item):
+        with self._condition:
+            while (len(self._events) >= self.maxsize and
+                   self._error is None):
+                self._condition.wait()
+
+            self._events.append(item)
+            self._condition.notify_all()
+
+    def _take(self):
+        with self._condition:
+            while not self._events:
+                self._condition.wait()
+
+            item = self._events.popleft()
+            dropped, self.dropped = self.dropped, 0
+
+            self._condition.notify_all()
+
+        # once taken, merged output is no longer added to, so it can be
+        # joined outside the lock
+        if isinstance(item, _Coalesced):
+            item = item.event()
+
+        return item, dropped
+
+    def _write(self):
+        try:
+            self.frontend.begin()
+
+            try:
+                while True:
+                    item, dropped = self._take()
+
+                    if dropped:
+                        self.frontend.output(events.dropped_output(dropped))
+
+                    if item is _CLOSE:
+                        break
+
+                    self.frontend.output(item)
+            finally:
+                self.frontend.end()
+        except BaseException as e:
+            with self._condition:
+                self._error = e
+                self._events.clear()
+                self._condition.notify_all()
+
+
+class EventBus:
+    """
+    An event bus publishes each event to several subscribers at once.
+
+    Parameters
+    ----------
+    subscribers : list
+        The subscribers to publish to.
+    """
+
+    def __init__(self, subscribers):
+        self.subscribers = subscribers
+
+    def publish(self, event):
+        """Publish an event to every subscriber."""
+
+        for subscriber in self.subscribers:
+            subscriber.publish(event)
+
+    def __enter__(self):
+        for subscriber in self.subscribers:
+            subscriber.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        for subscriber in self.subscribers:
+            subscriber.close()
@@ -0,0 +1,341 @@
+"""
+Contains the artifact cache, which shares the outputs of tasks between
+machines.
+
+The outputs of a task are archived under a key made from its definition, its
+variables and the contents of its inputs, so a task whose inputs match a
+previous run anywhere can have its outputs restored instead of being run.
+Archives are streamed to and from the cache, so outputs never have to fit in
+memory.
+"""
+
+from pathlib import Path, PurePosixPath
+import os
+
+from .fingerprint import state_directory
+
+
+CACHE_VERSION = 1
+
+
+class CacheError(Exception):
+    """The cache cannot be read from or written to."""
+
+    pass
+
+
+def cache_key(fingerprints, task, variables, steps):
+    """
+    Make the key a task's outputs are cached under.
+
+    Parameters
+    ----------
+    fingerprints : FingerprintStore
+        The fingerprints of the project's files.
+    task : Task
+        The task.
+    variables : dict
+        The task's variables.
+    steps : list
+        The task's steps, with their templates filled in.
+    """
+
+    definition = {
+        'version': CACHE_VERSION,
+        'task': task.name,
+        'steps': [list(step) for step in steps],
+        'variables': variables,
+        'outputs': list(task.outputs),
+        'directory': task.directory,
+    }
+
+    return fingerprints.fingerprint(task.inputs, definition)
+
+
+def archive(paths, root, file):
+    """
+    Write files to a gzipped tar archive, as a stream.
+
+    Parameters
+    ----------
+    paths : list
+        The files to archive.
+    root : Path
+        The directory the files are stored relative to.
+    file : file
+        Where to write the archive.
+    """
+
+    import tarfile
+
+    with tarfile.open(fileobj=file, mode='w|gz') as tar:
+        for path in paths:
+            tar.add(str(path), arcname=Path(path).relative_to(root).as_posix(),
+                    recursive=False)
+
+
+def _check_member(member):
+    path = PurePosixPath(member.name)
+
+    if path.is_absolute() or '..' in path.parts:
+        raise CacheError(f'Refusing to restore {member.name}')
+
+    if not (member.isfile() or member.isdir()):
+        raise CacheError(f'Refusing to restore {member.name}')
+
+
+def restore(file, root):
+    """
+    Extract a gzipped tar archive made by ``archive``, as a stream.
+
+    Raises
+    ------
+    CacheError
+        If the archive contains anything other than files beneath the root.
+    """
+
+    import tarfile
+
+    # extraction filters are only in newer versions of Python
+    options = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+
+    try:
+        with tarfile.open(fileobj=file, mode='r|gz') as tar:
+            for member in tar:
+                _check_member(member)
+                tar.extract(member, str(root), **options)
+    except (tarfile.TarError, EOFError) as e:
+        raise CacheError(f'Invalid archive: {e}')
+
+
+class LocalCache:
+    """
+    A cache kept in a directory, which may be shared over the network.
+
+    Parameters
+    ----------
+    directory : Path
+        The directory archives are kept in.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def _path(self, key):
+        return self.directory / key[:2] / f'{key}.tar.gz'
+
+    def get(self, key):
+        """
+        Open the archive cached under a key.
+
+        Returns
+        -------
+        file
+            The archive, or ``None`` if nothing is cached under the key.
+        """
+
+        try:
+            return self._path(key).open('rb')
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            raise CacheError(str(e))
+
+    def put(self, key, file):
+        """Cache an archive under a key, reading it from a file."""
+
+        import shutil
+        import tempfile
+
+        path = self._path(key)
+
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+            # write beside the final path, so readers never see half an
+            # archive
+            with tempfile.NamedTemporaryFile(dir=str(path.parent),
+                                             delete=False) as temporary:
+                try:
+                    shutil.copyfileobj(file, temporary)
+                except BaseException:
+                    os.unlink(temporary.name)
+                    raise
+
+            os.replace(temporary.name, path)
+        except OSError as e:
+            raise CacheError(str(e))
+
+
+class HttpCache:
+    """
+    A cache kept by an HTTP server, which archives are fetched from with
+    ``GET`` and stored to with ``PUT``, at ``<url>/<key>.tar.gz``.
+
+    Parameters
+    ----------
+    url : str
+        The URL archives are kept beneath.
+    timeout : float
+        How long to wait for the server, in seconds.
+    """
+
+    def __init__(self, url, timeout=30):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _url(self, key):
+        return f'{self.url}/{key}.tar.gz'
+
+    def get(self, key):
+        """
+        Open the archive cached under a key.
+
+        Returns
+        -------
+        file
+            The response, or ``None`` if nothing is cached under the key.
+        """
+
+        from urllib.error import HTTPError, URLError
+        from urllib.request import urlopen
+
+        try:
+            return urlopen(self._url(key), timeout=self.timeout)
+        except HTTPError as e:
+            if e.code == 404:
+                return None
+            raise CacheError(f'{self.url}: {e.code} {e.reason}')
+        except (URLError, OSError) as e:
+            raise CacheError(f'{self.url}: {e}')
+
+    def put(self, key, file):
+        """Cache an archive under a key, reading it from a file."""
+
+        from urllib.error import HTTPError, URLError
+        from urllib.request import Request, urlopen
+
+        size = os.fstat(file.fileno()).st_size - file.tell()
+
+        request = Request(self._url(key), data=file, method='PUT', headers={
+            'Content-Type': 'application/gzip',
+            'Content-Length': str(size),
+        })
+
+        try:
+            with urlopen(request, timeout=self.timeout):
+                pass
+        except HTTPError as e:
+            raise CacheError(f'{self.url}: {e.code} {e.reason}')
+        except (URLError, OSError) as e:
+            raise CacheError(f'{self.url}: {e}')
+
+
+def create_cache(location):
+    """
+    Create a cache from its location, an HTTP URL or a directory.
+
+    Returns
+    -------
+    LocalCache or HttpCache
+        The cache, or ``None`` if there's no location.
+    """
+
+    if not location:
+        return None
+
+    if location.startswith(('http://', 'https://')):
+        return HttpCache(location)
+
+    return LocalCache(location)
+
+
+class ArtifactCache:
+    """
+    Stores and restores the outputs of tasks using a cache backend.
+
+    Parameters
+    ----------
+    backend : LocalCache or HttpCache
+        Where archives are kept.
+    fingerprints : FingerprintStore
+        The fingerprints of the project's files.
+    """
+
+    def __init__(self, backend, fingerprints):
+        self.backend = backend
+        self.fingerprints = fingerprints
+        self.root = fingerprints.project_path
+
+    def _directory(self, task):
+        # outputs are archived relative to the task's own directory, which
+        # for tasks from an included task file may be outside the project
+        if task.directory is None:
+            return self.root
+        return Path(os.path.normpath(self.root / task.directory))
+
+    def restore(self, key, task):
+        """
+        Restore the outputs of a task cached under a key.
+
+        Returns
+        -------
+        bool
+            Whether anything was cached under the key.
+
+        Raises
+        ------
+        CacheError
+            If the cache or the archive cannot be read.
+        """
+
+        file = self.backend.get(key)
+        if file is None:
+            return False
+
+        with file:
+            restore(file, self._directory(task))
+
+        return True
+
+    def store(self, key, task):
+        """
+        Archive the outputs of a task, and cache them under a key.
+
+        The archive is written to a temporary file in the state directory
+        first, so it is never held in memory. Outputs outside the task's
+        directory couldn't be restored, so tasks with any aren't cached.
+
+        Returns
+        -------
+        bool
+            Whether the outputs were cached.
+
+        Raises
+        ------
+        CacheError
+            If the cache cannot be written to.
+        """
+
+        import tempfile
+
+        base = self._directory(task)
+        paths = [Path(os.path.normpath(path))
+                 for path in self.fingerprints.expand(task.outputs)]
+
+        if any(os.path.commonpath([str(base), str(path)]) != str(base)
+               for path in paths):
+            return False
+
+        directory = state_directory(self.root)
+
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            with tempfile.TemporaryFile(dir=str(directory)) as file:
+                archive(paths, base, file)
+                file.seek(0)
+                self.backend.put(key, file)
+        except OSError as e:
+            raise CacheError(str(e))
+
+        return True
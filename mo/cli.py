@@ -1,17 +1,34 @@
 """Utilities for working with the command line interface."""
 
 from argparse import ArgumentParser
+import os
+import sys
 
-from . import events, frontends, mofile
-from .runner import Runner
+from . import events, mofile
 
 
+# frontends are named rather than imported, so that only the one in use is
+# ever loaded
 available_frontends = {
-    'human': frontends.Human,
-    'debug': frontends.Debug,
-    'json': frontends.Json
+    'human': 'Human',
+    'live': 'Live',
+    'debug': 'Debug',
+    'json': 'Json',
+    'json-framed': 'JsonFramed',
 }
 
+coalescing_frontends = {'human', 'live'}
+"""The frontends which, for people reading a terminal, merge output they
+fall behind on by default, while the others get every event."""
+
+
+def get_frontend(name, stream=None):
+    """Import and create a frontend by name."""
+
+    from . import frontends
+
+    return getattr(frontends, available_frontends[name])(stream)
+
 
 def parse_variables(args):
     """
@@ -42,10 +59,59 @@ def parse_args():
     parser = ArgumentParser()
     parser.add_argument('-f', '--file', default='Mofile')
     parser.add_argument('-v', '--var', dest='variables', nargs='*')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of independent tasks to run at once.')
     parser.add_argument('--frontend', default='human',
                         choices=available_frontends.keys())
+    parser.add_argument('--overflow', choices=('block', 'drop', 'coalesce'),
+                        help='What to do with output the frontend cannot '
+                             'keep up with, by default coalesce for the '
+                             'human and live frontends and block otherwise.')
+    parser.add_argument('--log', metavar='FILE',
+                        help='Also write every event to a file as JSON.')
+    parser.add_argument('--watch', action='store_true',
+                        help='Rerun tasks whenever the files they read '
+                             'change.')
+    parser.add_argument('--plan', action='store_true',
+                        help='Show how the tasks would be run, without '
+                             'running them.')
+    parser.add_argument('--cache', metavar='LOCATION',
+                        default=os.environ.get('MO_CACHE'),
+                        help='Share the outputs of tasks through a cache, '
+                             'a directory or an HTTP URL.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Show how long each task and step took.')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Write how long each task and step took to a '
+                             'file, in the Chrome trace event format.')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Serve task runs over a Unix socket.')
+    parser.add_argument('--client', action='store_true',
+                        help='Run tasks through the daemon, output is JSON.')
+    parser.add_argument('--socket', help='The socket the daemon listens on.')
+    parser.add_argument('--coordinator', metavar='ADDRESS',
+                        help='Listen for workers on HOST:PORT, and send them '
+                             'the tasks to run.')
+    parser.add_argument('--worker', metavar='ADDRESS',
+                        help='Run tasks sent by the coordinator at '
+                             'HOST:PORT.')
+    parser.add_argument('--token', default=os.environ.get('MO_TOKEN'),
+                        help='The token workers give the coordinator, one is '
+                             'generated by the coordinator if not given.')
     parser.add_argument('tasks', metavar='task', nargs='*')
-    return parser.parse_args()
+
+    args = parser.parse_args()
+
+    if args.watch and not args.tasks:
+        parser.error('--watch needs at least one task')
+
+    if args.watch and args.coordinator:
+        parser.error('--watch cannot be used with --coordinator')
+
+    if args.worker and not args.token:
+        parser.error('--worker needs the coordinator\'s --token')
+
+    return args
 
 
 def run(args):
@@ -54,15 +120,47 @@ def run(args):
     except FileNotFoundError:
         yield events.invalid_mofile(args.file)
         return
-    except mofile.InvalidMofileFormat:
-        yield events.invalid_mofile(args.file)
+    except mofile.InvalidMofileFormat as e:
+        yield events.invalid_mofile(args.file, str(e))
         return
 
+    yield from run_project(project, args)
+
+
+def run_project(project, args):
+    """Run the tasks given on the command line from a loaded project."""
+
+    from .cache import create_cache
+
     variables = parse_variables(args.variables)
+    cache = create_cache(getattr(args, 'cache', None))
+
+    if getattr(args, 'coordinator', None):
+        from .distributed import (Coordinator, DistributedRunner,
+                                  generate_token, parse_address)
+
+        address = parse_address(args.coordinator)
+        token = getattr(args, 'token', None) or generate_token()
+
+        with Coordinator(address, token) as coordinator:
+            host, port = coordinator.address
+            print(f'Listening for workers on {host}:{port}, with token '
+                  f'{token}', file=sys.stderr)
+
+            runner = DistributedRunner(project, variables, args.jobs,
+                                       coordinator)
+            yield from _run_runner(runner, args)
+    else:
+        from .runner import Runner
+
+        runner = Runner(project, variables, args.jobs, cache)
+        yield from _run_runner(runner, args)
 
-    runner = Runner(project, variables)
 
-    if args.tasks:
+def _run_runner(runner, args):
+    if args.tasks and getattr(args, 'plan', False):
+        yield from runner.plan(args.tasks)
+    elif args.tasks:
         for task in args.tasks:
             runner.queue_task(task)
 
@@ -71,17 +169,111 @@ def run(args):
         yield from runner.help()
 
 
-def main():
-    """Run the CLI."""
+def watch(args):
+    """Run the tasks given on the command line, and again as files change."""
 
-    args = parse_args()
+    from .cache import create_cache
+    from .watch import Watch
+
+    return Watch(args.file, parse_variables(args.variables), args.jobs,
+                 args.tasks, create_cache(getattr(args, 'cache', None)))
+
+
+def run_client(args):
+    """
+    Run through the daemon, printing its JSON output.
 
-    frontend = available_frontends[args.frontend]()
+    If the daemon isn't running, the tasks are run directly instead.
+    """
+
+    from . import daemon
+
+    received = False
+
+    try:
+        for line in daemon.request(args, args.socket):
+            received = True
+            sys.stdout.write(line)
+            sys.stdout.flush()
+    except OSError:
+        if received:
+            raise
+    else:
+        return
+
+    args.frontend = 'json'
+    run_frontend(args)
+
+
+def overflow_policy(args):
+    """Get what the frontend does with output it falls behind on."""
+
+    policy = getattr(args, 'overflow', None)
+    if policy is not None:
+        return policy
+    elif args.frontend in coalescing_frontends:
+        return 'coalesce'
+    return 'block'
+
+
+def run_frontend(args):
+    """
+    Run, displaying events through the chosen frontend, and logging and
+    profiling them if asked to.
+    """
+
+    from . import frontends
+    from .bus import EventBus, Subscriber
+
+    subscribers = [
+        Subscriber(get_frontend(args.frontend), policy=overflow_policy(args)),
+    ]
+
+    files = []
 
-    frontend.begin()
+    if args.log:
+        files.append(open(args.log, 'w'))
+        subscribers.append(
+            Subscriber(get_frontend('json', files[-1]), policy='block')
+        )
+
+    if args.profile:
+        subscribers.append(Subscriber(frontends.Profile(), policy='block'))
+
+    if args.trace:
+        files.append(open(args.trace, 'w'))
+        subscribers.append(
+            Subscriber(frontends.Trace(files[-1]), policy='block')
+        )
 
     try:
-        for event in run(args):
-            frontend.output(event)
+        with EventBus(subscribers) as bus:
+            for event in watch(args) if args.watch else run(args):
+                bus.publish(event)
     finally:
-        frontend.end()
+        for file in files:
+            file.close()
+
+
+def main():
+    """Run the CLI."""
+
+    args = parse_args()
+
+    if args.daemon:
+        from . import daemon
+        daemon.serve(args.socket)
+    elif args.client:
+        run_client(args)
+    elif args.worker:
+        from . import distributed
+        from .cache import create_cache
+        distributed.serve(distributed.parse_address(args.worker), args.file,
+                          args.token, create_cache(args.cache))
+    elif args.watch:
+        try:
+            run_frontend(args)
+        except KeyboardInterrupt:
+            pass
+    else:
+        run_frontend(args)
@@ -0,0 +1,293 @@
+"""
+Contains the daemon, which keeps projects loaded and serves task runs over a
+Unix socket.
+
+Each request is a single JSON object on one line, and the response is the
+stream of events from the run, one JSON object per line.
+
+Requests run commands as the daemon's user, so the socket is only accessible
+to that user, and connections from any other user are refused.
+"""
+
+from argparse import Namespace
+from pathlib import Path
+import errno
+import json
+import os
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import tempfile
+import threading
+
+from . import events, mofile
+
+
+def default_socket_path():
+    """Get the path of the socket the daemon listens on by default."""
+
+    try:
+        return os.environ['MO_SOCKET']
+    except KeyError:
+        directory = os.environ.get('XDG_RUNTIME_DIR', tempfile.gettempdir())
+        return str(Path(directory) / f'mo-{os.getuid()}.sock')
+
+
+def _remove_stale_socket(path):
+    # only remove a socket left behind by a daemon which is no longer
+    # running, never another file or a daemon which is
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(errno.EEXIST, 'Not a socket', path)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except ConnectionRefusedError:
+            pass
+        except FileNotFoundError:
+            return
+        else:
+            raise OSError(errno.EADDRINUSE, 'A daemon is already listening',
+                          path)
+
+    os.unlink(path)
+
+
+def _peer_uid(sock):
+    # the user of the process at the other end of the socket, where the
+    # platform can tell, otherwise the socket's permissions have to do
+    try:
+        credentials = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                      struct.calcsize('3i'))
+    except (AttributeError, OSError):
+        return None
+
+    pid, uid, gid = struct.unpack('3i', credentials)
+    return uid
+
+
+class ProjectCache:
+    """
+    A cache of loaded projects, which are reloaded when their task file
+    changes.
+    """
+
+    def __init__(self):
+        self._projects = {}
+        self._lock = threading.Lock()
+
+    def load(self, filename):
+        """
+        Load a project, reusing the previously loaded one if its task file,
+        and any it includes, are unchanged.
+
+        Raises
+        ------
+        FileNotFoundError
+            If the task file does not exist.
+        InvalidMofileFormat
+            If the task file cannot be loaded.
+        """
+
+        path = str(Path(filename).resolve())
+
+        with self._lock:
+            try:
+                cached_key, project = self._projects[path]
+            except KeyError:
+                pass
+            else:
+                if cached_key == self._key([path] + project.files[1:]):
+                    return project
+
+            project = mofile.load(path)
+            self._projects[path] = (self._key(project.files), project)
+
+        return project
+
+    @staticmethod
+    def _key(files):
+        # the task file and those it includes, as they were when loaded
+        key = []
+
+        for filename in files:
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                key.append(None)
+            else:
+                key.append((stat.st_mtime_ns, stat.st_size))
+
+        return key
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles a single run request, in a process forked from the daemon.
+
+    The request has already been read, and its project loaded, by the daemon
+    before forking so that the loaded project stays cached.
+    """
+
+    def handle(self):
+        from . import cli
+        from .frontends import Json
+
+        message, project = self.server.pending
+
+        os.chdir(message['cwd'])
+        os.environ.clear()
+        os.environ.update(message['env'])
+
+        args = Namespace(**message['args'])
+
+        if isinstance(project, FileNotFoundError):
+            stream = iter([events.invalid_mofile(args.file)])
+        elif isinstance(project, Exception):
+            stream = iter([events.invalid_mofile(args.file, str(project))])
+        else:
+            stream = cli.run_project(project, args)
+
+        serialise = Json().serialise
+
+        for event in stream:
+            line = json.dumps(serialise(event)) + '\n'
+            self.wfile.write(line.encode())
+
+
+class Daemon(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """
+    The daemon listens on a Unix socket, and runs each request in a forked
+    process so that the interpreter, imports and loaded projects are all
+    already warm.
+
+    Only the daemon's user can connect to the socket.
+
+    Parameters
+    ----------
+    path : str
+        The path of the socket to listen on.
+
+    Raises
+    ------
+    OSError
+        If something else is at the path, or another daemon is listening on
+        it.
+    """
+
+    def __init__(self, path):
+        _remove_stale_socket(path)
+
+        super().__init__(path, RequestHandler)
+
+        self.projects = ProjectCache()
+        self.pending = None
+
+    def server_bind(self):
+        # the socket is created without any permissions for other users,
+        # rather than changed afterwards, so they can never connect
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+        os.chmod(self.server_address, 0o600)
+
+    def verify_request(self, request, client_address):
+        uid = _peer_uid(request)
+        return uid is None or uid == os.getuid()
+
+    def process_request(self, request, client_address):
+        request.settimeout(5)
+
+        try:
+            with request.makefile('rb') as file:
+                message = json.loads(file.readline().decode())
+        except (OSError, ValueError):
+            self.shutdown_request(request)
+            return
+
+        request.settimeout(None)
+
+        try:
+            project = self.projects.load(message['args']['file'])
+        except (FileNotFoundError, mofile.InvalidMofileFormat) as e:
+            project = e
+
+        self.pending = (message, project)
+
+        super().process_request(request, client_address)
+
+    def server_close(self):
+        super().server_close()
+
+        try:
+            os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+
+
+def serve(path=None):
+    """Run the daemon until interrupted."""
+
+    path = path or default_socket_path()
+
+    try:
+        daemon = Daemon(path)
+    except OSError as e:
+        sys.exit(f'Cannot listen on {path}: {e.strerror or e}')
+
+    with daemon:
+        print(f'Listening on {path}', file=sys.stderr)
+
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def request(args, path=None):
+    """
+    Send a run request to the daemon.
+
+    Yields
+    ------
+    str
+        Each line of JSON sent back by the daemon.
+
+    Raises
+    ------
+    OSError
+        If the daemon cannot be reached.
+    """
+
+    path = path or default_socket_path()
+
+    message = {
+        'cwd': os.getcwd(),
+        'env': dict(os.environ),
+        'args': {
+            'file': os.path.abspath(args.file),
+            'variables': args.variables,
+            'jobs': args.jobs,
+            'tasks': args.tasks,
+            'plan': getattr(args, 'plan', False),
+            'cache': getattr(args, 'cache', None),
+        },
+    }
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(message).encode() + b'\n')
+
+        with sock.makefile('rb') as file:
+            for line in file:
+                yield line.decode()
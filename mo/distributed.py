@@ -0,0 +1,489 @@
+"""
+Contains the coordinator and workers, which spread the tasks of a run over
+several machines.
+
+Workers connect to the coordinator over TCP. Every message is a single JSON
+object on one line. The coordinator sends a task, with its variables already
+resolved, to an idle worker, and the worker sends back each event as the task
+runs, followed by whether it succeeded.
+
+Workers run commands in their own checkout of the project, so the coordinator
+and every worker should have the same files. A worker has to give the
+coordinator's token when it connects, before it is sent anything.
+"""
+
+from queue import Empty, Queue
+import hmac
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+from . import events, mofile
+from .history import TaskStatistics
+from .plan import Compiler, PlannedTask
+from .profile import Timing
+from .project import Step, Task
+from .runner import Runner
+from .steps import StopTask
+
+
+def parse_address(address):
+    """
+    Parse an address given as ``host:port``, where the host may be left out
+    to mean this machine only.
+
+    Returns
+    -------
+    tuple
+        The host and port.
+    """
+
+    host, _, port = address.rpartition(':')
+
+    try:
+        return host or '127.0.0.1', int(port)
+    except ValueError:
+        raise ValueError(f'Invalid address: {address}')
+
+
+def generate_token():
+    """Generate a token for workers to give the coordinator."""
+
+    import secrets
+
+    return secrets.token_urlsafe(16)
+
+
+def _listen(address):
+    host, port = address
+
+    family, type, proto, _, sockaddr = socket.getaddrinfo(
+        host or None, port, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE,
+    )[0]
+
+    server = socket.socket(family, type, proto)
+
+    try:
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(sockaddr)
+        server.listen()
+    except OSError:
+        server.close()
+        raise
+
+    return server
+
+
+def _send(file, message):
+    file.write(json.dumps(message).encode() + b'\n')
+    file.flush()
+
+
+def _receive(file):
+    line = file.readline()
+    if not line:
+        raise ConnectionError('Connection closed')
+    return json.loads(line.decode())
+
+
+def _task_message(planned):
+    task = planned.task
+    return {
+        'type': 'task',
+        'task': {
+            'name': task.name,
+            'description': task.description,
+            'steps': [list(step) for step in task.steps],
+            'inputs': list(task.inputs),
+            'outputs': list(task.outputs),
+            'directory': task.directory,
+            'shell': task.shell,
+        },
+        'variables': planned.variables,
+    }
+
+
+def _load_task(message):
+    task = message['task']
+    steps = [Step(type, args) for type, args in task['steps']]
+    return Task(task['name'], task['description'], {}, steps, [],
+                task['inputs'], task['outputs'], task['directory'],
+                task.get('shell'))
+
+
+# how to turn the serialised fields of an event back into objects, other
+# fields are used as they are
+_field_loaders = {
+    'step': lambda step: Step(step['type'], step['args']),
+    'timing': lambda timing: Timing(**timing),
+    'slowest': lambda stats: [TaskStatistics(**s) for s in stats],
+    'variable': lambda stats: [TaskStatistics(**s) for s in stats],
+    'similarities': lambda tasks: [Task(**t) for t in tasks],
+}
+
+_event_types = {cls.name: cls for cls in events.event_types}
+
+
+def _load_event(data, task):
+    cls = _event_types[data['name']]
+
+    values = []
+    for field in cls.fields:
+        value = data['args'][field]
+
+        if field == 'task':
+            value = task
+        elif field in _field_loaders and value is not None:
+            value = _field_loaders[field](value)
+
+        values.append(value)
+
+    return cls(*values)
+
+
+class WorkerLost(Exception):
+    """A worker disconnected, or sent something unexpected."""
+
+    pass
+
+
+class RemoteWorker:
+    """
+    The coordinator's end of the connection to a worker.
+
+    Parameters
+    ----------
+    connection : socket
+        The connection to the worker.
+    file : file
+        The connection, as a file.
+    name : str
+        The name the worker gave itself.
+    """
+
+    def __init__(self, connection, file, name):
+        self.connection = connection
+        self.name = name
+
+        self._file = file
+
+    def run(self, planned, local_task):
+        """
+        Run a task on the worker.
+
+        Yields
+        ------
+        Event
+            The events from the worker.
+
+        Returns
+        -------
+        tuple
+            Whether the task ran, rather than being up to date, and how long
+            it took.
+
+        Raises
+        ------
+        StopTask
+            If the task failed.
+        WorkerLost
+            If the worker was lost.
+        """
+
+        timing = None
+
+        try:
+            _send(self._file, _task_message(planned))
+
+            while True:
+                message = _receive(self._file)
+
+                if message['type'] == 'event':
+                    event = _load_event(message['event'], local_task)
+                    if event.tag == events.TaskTiming.tag:
+                        timing = event.timing
+                    yield event
+                elif message['type'] == 'done':
+                    break
+                else:
+                    raise ValueError(message['type'])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.close()
+            raise WorkerLost(str(e))
+
+        if not message['ok']:
+            raise StopTask
+
+        return message['ran'], timing
+
+    def close(self):
+        try:
+            self._file.close()
+            self.connection.close()
+        except OSError:
+            pass
+
+
+class Coordinator:
+    """
+    The coordinator listens for workers, keeping track of those which are
+    idle.
+
+    Parameters
+    ----------
+    address : tuple
+        The host and port to listen on, the port may be 0 to pick any free
+        one.
+    token : str
+        The token workers have to give when they connect.
+    """
+
+    def __init__(self, address, token):
+        self.token = token
+        self.server = _listen(address)
+        self.address = self.server.getsockname()[:2]
+
+        self.idle = Queue()
+        self.workers = []
+
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._accept,
+                                        name='mo-coordinator', daemon=True)
+        self._thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, address = self.server.accept()
+            except OSError:
+                return
+
+            threading.Thread(target=self._greet, args=(connection, address),
+                             daemon=True).start()
+
+    def _greet(self, connection, address):
+        connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        connection.settimeout(5)
+
+        file = connection.makefile('rwb')
+
+        try:
+            hello = _receive(file)
+            name = hello['name']
+            token = str(hello.get('token', ''))
+
+            if not hmac.compare_digest(token.encode(), self.token.encode()):
+                _send(file, {'type': 'rejected'})
+                raise ValueError('Wrong token')
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            file.close()
+            connection.close()
+            return
+
+        connection.settimeout(None)
+
+        worker = RemoteWorker(connection, file, name)
+
+        with self._lock:
+            self.workers.append(worker)
+
+        self.idle.put(worker)
+
+    def acquire(self, timeout):
+        """
+        Wait for an idle worker.
+
+        Returns
+        -------
+        RemoteWorker
+            The worker, or ``None`` if none became idle before the timeout.
+        """
+
+        try:
+            return self.idle.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def release(self, worker):
+        """Mark a worker as idle again."""
+
+        self.idle.put(worker)
+
+    def close(self):
+        """Stop listening, and disconnect every worker."""
+
+        self.server.close()
+
+        with self._lock:
+            for worker in self.workers:
+                worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class DistributedRunner(Runner):
+    """
+    A runner which sends each task to be run by a worker, rather than running
+    it itself.
+
+    Up to ``jobs`` tasks are sent to workers at once. If a worker is lost
+    while running a task, the task is sent to another worker, up to
+    ``attempts`` times.
+
+    Parameters
+    ----------
+    coordinator : Coordinator
+        The coordinator the workers connect to.
+    """
+
+    attempts = 3
+
+    poll_interval = 0.5
+
+    def __init__(self, project, variables, jobs, coordinator):
+        super().__init__(project, variables, jobs)
+
+        self.coordinator = coordinator
+
+    def _acquire(self):
+        while True:
+            if self.scheduler is not None and self.scheduler.cancelled:
+                raise StopTask
+
+            worker = self.coordinator.acquire(self.poll_interval)
+            if worker is not None:
+                return worker
+
+    def run_task_steps(self, planned):
+        task = planned.task
+
+        for attempt in range(self.attempts):
+            worker = self._acquire()
+
+            yield events.sent_to_worker(worker.name)
+
+            try:
+                ran, timing = yield from worker.run(planned, task)
+            except WorkerLost:
+                yield events.worker_lost(worker.name)
+                continue
+            except StopTask:
+                self.coordinator.release(worker)
+                raise
+
+            self.coordinator.release(worker)
+
+            if ran and timing is not None:
+                self.history.record(task, None, timing.wall)
+
+            return
+
+        raise StopTask
+
+
+def _drive(stream, callback):
+    # pass every event of a stream to a callback, returning its result
+    while True:
+        try:
+            callback(next(stream))
+        except StopIteration as e:
+            return e.value
+
+
+def work(address, filename, token, cache=None, timeout=30):
+    """
+    Connect to a coordinator and run the tasks it sends, until it
+    disconnects.
+
+    Parameters
+    ----------
+    address : tuple
+        The host and port of the coordinator.
+    filename : str
+        The task file of the worker's checkout of the project.
+    token : str
+        The coordinator's token.
+    cache : LocalCache or HttpCache
+        Where to share the outputs of tasks, if anywhere.
+    timeout : float
+        How long to keep trying to connect, in seconds.
+
+    Raises
+    ------
+    PermissionError
+        If the coordinator rejects the token.
+    """
+
+    from .frontends import Json
+
+    project = mofile.load(filename)
+    serialise = Json().serialise
+
+    deadline = time.monotonic() + timeout
+
+    while True:
+        try:
+            connection = socket.create_connection(address)
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+    name = f'{socket.gethostname()}:{os.getpid()}'
+
+    with connection, connection.makefile('rwb') as file:
+        _send(file, {'type': 'hello', 'name': name, 'token': token})
+
+        while True:
+            try:
+                message = _receive(file)
+            except ConnectionError:
+                return
+
+            if message['type'] == 'rejected':
+                raise PermissionError('The coordinator rejected the token')
+
+            task = _load_task(message)
+            variables = message['variables']
+            runner = Runner(project, variables, cache=cache)
+
+            def send(event):
+                _send(file, {'type': 'event', 'event': serialise(event)})
+
+            try:
+                compiler = Compiler(project, variables)
+                stream = compiler.compile_steps(task.steps, variables)
+                steps = _drive(stream, send)
+                if compiler.failed:
+                    raise StopTask
+
+                planned = PlannedTask(task.name, task, [], variables, steps)
+                ran = _drive(runner.run_task_steps(planned), send)
+            except StopTask:
+                _send(file, {'type': 'done', 'ok': False, 'ran': True})
+            else:
+                _send(file, {'type': 'done', 'ok': True, 'ran': ran})
+
+            runner.history.save()
+
+
+def serve(address, filename, token, cache=None):
+    """Run a worker, printing where it is connecting to."""
+
+    host, port = address
+    print(f'Working for {host}:{port}', file=sys.stderr)
+
+    try:
+        work(address, filename, token, cache)
+    except OSError as e:
+        sys.exit(f'Cannot connect to {host}:{port}: {e.strerror or e}')
+    except KeyboardInterrupt:
+        pass
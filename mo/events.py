@@ -1,7 +1,15 @@
-"""Contains all the events that may come from steps."""
+"""
+Contains all the events that may come from steps.
+
+Each type of event is its own class, built on a named tuple so an event is a
+single small allocation. The name, kind and an integer tag are shared by the
+class, so frontends can dispatch on the tag through a table rather than
+comparing names.
+"""
 
 from collections import namedtuple
 from enum import Enum
+import sys
 
 
 class EventKind(Enum):
@@ -10,74 +18,243 @@ class EventKind(Enum):
     output = 'output'
 
 
-Event = namedtuple('Event', ['name', 'kind', 'args'])
+class Event:
+    """
+    The base class of all events.
+
+    Every event has the ``name``, ``kind`` and ``args`` of its type, and the
+    name of the ``task`` it came from, if any.
+    """
+
+    __slots__ = ()
+
+    name = None
+    kind = None
+    tag = None
+    fields = ()
+
+    @property
+    def args(self):
+        """The fields of the event, as a dictionary."""
+
+        return dict(zip(self.fields, self))
+
+    def _asdict(self):
+        return {
+            'name': self.name, 'kind': self.kind, 'args': self.args,
+            'task': self.task,
+        }
 
 
-def invalid_mofile(filename):
-    return Event('InvalidMofile', EventKind.error, {
-        'filename': filename
+event_types = []
+"""Every type of event, indexed by tag."""
+
+
+# arguments whose names clash with the attributes every event has are stored
+# under different attribute names, they keep their names in args
+_renamed_fields = {'task': 'subject', 'name': 'task_name'}
+
+
+def _event_type(name, kind, *fields):
+    attributes = tuple(_renamed_fields.get(f, f) for f in fields)
+
+    base = namedtuple(name, attributes + ('task',))
+    base.__new__.__defaults__ = (None,)
+
+    cls = type(name, (Event, base), {
+        '__slots__': (),
+        'name': sys.intern(name),
+        'kind': kind,
+        'tag': len(event_types),
+        'fields': fields,
     })
 
+    event_types.append(cls)
+
+    return cls
+
+
+InvalidMofile = _event_type('InvalidMofile', EventKind.error, 'filename',
+                            'reason')
+UndefinedVariable = _event_type('UndefinedVariable', EventKind.error,
+                                'variable')
+UnknownStepType = _event_type('UnknownStepType', EventKind.error, 'step')
+FindingTask = _event_type('FindingTask', EventKind.other, 'name')
+StartingTask = _event_type('StartingTask', EventKind.other, 'task')
+RunningTask = _event_type('RunningTask', EventKind.other, 'task')
+SkippingTask = _event_type('SkippingTask', EventKind.other, 'name')
+UpToDate = _event_type('UpToDate', EventKind.other, 'task')
+RunningStep = _event_type('RunningStep', EventKind.other, 'step')
+FinishedTask = _event_type('FinishedTask', EventKind.other, 'task')
+Help = _event_type('Help', EventKind.output, 'tasks')
+HelpOutput = _event_type('HelpOutput', EventKind.output, 'output')
+CommandOutput = _event_type('CommandOutput', EventKind.output, 'pipe',
+                            'output')
+DroppedOutput = _event_type('DroppedOutput', EventKind.error, 'count')
+CommandFailed = _event_type('CommandFailed', EventKind.error, 'command',
+                            'code', 'description')
+RunningCommand = _event_type('RunningCommand', EventKind.other, 'command')
+TaskNotFound = _event_type('TaskNotFound', EventKind.error, 'name',
+                           'similarities')
+TaskTiming = _event_type('TaskTiming', EventKind.other, 'task', 'timing')
+StepTiming = _event_type('StepTiming', EventKind.other, 'step', 'timing')
+Scheduled = _event_type('Scheduled', EventKind.other, 'estimates', 'jobs')
+Statistics = _event_type('Statistics', EventKind.output, 'slowest',
+                         'variable')
+Watching = _event_type('Watching', EventKind.other, 'files')
+FilesChanged = _event_type('FilesChanged', EventKind.other, 'files')
+RunCancelled = _event_type('RunCancelled', EventKind.other)
+DependencyCycle = _event_type('DependencyCycle', EventKind.error, 'tasks')
+InvalidStep = _event_type('InvalidStep', EventKind.error, 'step', 'reason')
+Plan = _event_type('Plan', EventKind.output, 'tasks')
+SentToWorker = _event_type('SentToWorker', EventKind.other, 'worker')
+WorkerLost = _event_type('WorkerLost', EventKind.other, 'worker')
+RestoredFromCache = _event_type('RestoredFromCache', EventKind.other, 'task')
+StoredInCache = _event_type('StoredInCache', EventKind.other, 'task')
+CacheUnavailable = _event_type('CacheUnavailable', EventKind.other, 'reason')
+LoggedOutput = _event_type('LoggedOutput', EventKind.output, 'run', 'source',
+                           'step', 'pipe', 'output')
+
+
+def decode(output):
+    """
+    Decode command output into text.
+
+    Output from commands is kept as bytes until a frontend needs it as text.
+    """
+
+    if isinstance(output, bytes):
+        return output.decode(errors='replace')
+    return output
+
+
+def invalid_mofile(filename, reason=None):
+    return InvalidMofile(filename, reason)
+
 
 def undefined_variable(variable):
-    return Event('UndefinedVariable', EventKind.error, {
-        'variable': variable
-    })
+    return UndefinedVariable(variable)
 
 
 def unknown_step_type(step):
-    return Event('UnknownStepType', EventKind.error, {'step': step})
+    return UnknownStepType(step)
 
 
 def finding_task(name):
-    return Event('FindingTask', EventKind.other, {'name': name})
+    return FindingTask(name)
 
 
 def starting_task(task):
-    return Event('StartingTask', EventKind.other, {'task': task})
+    return StartingTask(task)
 
 
 def running_task(task):
-    return Event('RunningTask', EventKind.other, {'task': task})
+    return RunningTask(task)
 
 
 def skipping_task(name):
-    return Event('SkippingTask', EventKind.other, {'name': name})
+    return SkippingTask(name)
+
+
+def up_to_date(task):
+    return UpToDate(task)
 
 
 def running_step(step):
-    return Event('RunningStep', EventKind.other, {'step': step})
+    return RunningStep(step)
 
 
 def finished_task(task):
-    return Event('FinishedTask', EventKind.other, {'task': task})
+    return FinishedTask(task)
 
 
 def help(project):
-    return Event('Help', EventKind.output, {'tasks': project.tasks})
+    return Help(project.tasks)
 
 
 def help_output(output):
-    return Event('HelpOutput', EventKind.output, {'output': output})
+    return HelpOutput(output)
 
 
 def command_output(pipe, output):
-    return Event('CommandOutput', EventKind.output, {
-        'pipe': pipe, 'output': output
-    })
+    return CommandOutput(pipe, output)
+
+
+def dropped_output(count):
+    return DroppedOutput(count)
 
 
 def command_failed(command, code, description):
-    return Event('CommandFailed', EventKind.error, {
-        'command': command, 'code': code, 'description': description,
-    })
+    return CommandFailed(command, code, description)
 
 
 def running_command(command):
-    return Event('RunningCommand', EventKind.other, {'command': command})
+    return RunningCommand(command)
 
 
 def task_not_found(name, similarities):
-    return Event('TaskNotFound', EventKind.error, {
-        'name': name, 'similarities': similarities
-    })
+    return TaskNotFound(name, similarities)
+
+
+def task_timing(task, timing):
+    return TaskTiming(task, timing)
+
+
+def step_timing(step, timing):
+    return StepTiming(step, timing)
+
+
+def scheduled(estimates, jobs):
+    return Scheduled(estimates, jobs)
+
+
+def statistics(slowest, variable):
+    return Statistics(slowest, variable)
+
+
+def watching(files):
+    return Watching(files)
+
+
+def files_changed(files):
+    return FilesChanged(files)
+
+
+def run_cancelled():
+    return RunCancelled()
+
+
+def dependency_cycle(tasks):
+    return DependencyCycle(tasks)
+
+
+def invalid_step(step, reason):
+    return InvalidStep(step, reason)
+
+
+def plan(tasks):
+    return Plan(tasks)
+
+
+def sent_to_worker(worker):
+    return SentToWorker(worker)
+
+
+def worker_lost(worker):
+    return WorkerLost(worker)
+
+
+def restored_from_cache(task):
+    return RestoredFromCache(task)
+
+
+def stored_in_cache(task):
+    return StoredInCache(task)
+
+
+def cache_unavailable(reason):
+    return CacheUnavailable(reason)
+
+
+def logged_output(run, source, step, pipe, output):
+    return LoggedOutput(run, source, step, pipe, output)
@@ -0,0 +1,586 @@
+"""Contains the executor which runs commands on an asyncio event loop."""
+
+import asyncio
+import errno
+import os
+import shutil
+import signal
+import threading
+
+
+def descendants(pid):
+    """
+    Find the processes descended from a process, using ``/proc``.
+
+    Returns
+    -------
+    list
+        The process IDs, empty if they can't be found on this platform.
+    """
+
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return []
+
+    children = {}
+
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as file:
+                stat = file.read()
+        except OSError:
+            continue
+
+        # the command name is in brackets and may contain spaces
+        ppid = int(stat.rsplit(b')', 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+
+    found = []
+    pending = [pid]
+
+    while pending:
+        for child in children.get(pending.pop(), ()):
+            found.append(child)
+            pending.append(child)
+
+    return found
+
+
+class LineSplitter:
+    """
+    Splits chunks of bytes into lines.
+
+    A line which grows longer than ``max_line_length`` without a newline is
+    split into pieces of that length, so memory use is capped however long
+    the line is.
+
+    Parameters
+    ----------
+    max_line_length : int
+        The longest line, in bytes, to hold on to.
+    """
+
+    def __init__(self, max_line_length):
+        self.max_line_length = max_line_length
+        self._partial = bytearray()
+
+    def _split(self, line):
+        for start in range(0, len(line), self.max_line_length):
+            yield bytes(line[start:start + self.max_line_length])
+
+    def feed(self, chunk):
+        """
+        Feed a chunk of bytes in.
+
+        Returns
+        -------
+        list
+            The lines completed by this chunk, without their newlines.
+        """
+
+        lines = []
+        view = memoryview(chunk)
+        start = 0
+
+        while True:
+            end = chunk.find(b'\n', start)
+            if end == -1:
+                break
+
+            if self._partial:
+                self._partial += view[start:end]
+                lines.extend(self._split(self._partial))
+                self._partial.clear()
+            elif end - start <= self.max_line_length:
+                lines.append(bytes(view[start:end]))
+            else:
+                lines.extend(self._split(view[start:end]))
+
+            start = end + 1
+
+        self._partial += view[start:]
+
+        while len(self._partial) >= self.max_line_length:
+            lines.append(bytes(self._partial[:self.max_line_length]))
+            del self._partial[:self.max_line_length]
+
+        return lines
+
+    def flush(self):
+        """Get the final line, if it wasn't terminated by a newline."""
+
+        lines = [bytes(self._partial)] if self._partial else []
+        self._partial.clear()
+        return lines
+
+
+def _terminate_tree(process):
+    if process is None or process.returncode is not None:
+        return
+
+    # the shell doesn't pass the signal on, and its children would otherwise
+    # keep the pipes open
+    for pid in descendants(process.pid) + [process.pid]:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+class Process:
+    """
+    A command running in an executor.
+
+    Iterating over a process yields ``(pipe, line)`` tuples as soon as each
+    line is written by the command, where each line is the raw bytes without
+    the newline. Once iteration finishes, the exit code is available as
+    ``returncode``.
+
+    Output is read in chunks, and at most ``maxsize`` chunks worth of lines are
+    held before reading pauses until they are consumed, which bounds the
+    memory used however much the command writes.
+
+    Parameters
+    ----------
+    executor : Executor
+        The executor running the process.
+    command_line : str
+        The command to run, through the shell.
+    cwd : str
+        The directory to run the command in, defaults to the current one.
+    argv : list
+        The arguments of the command, to run it directly rather than through
+        the shell.
+    """
+
+    def __init__(self, executor, command_line, cwd=None, argv=None):
+        self.executor = executor
+        self.loop = executor.loop
+        self.command_line = command_line
+        self.cwd = cwd
+        self.argv = argv
+        self.returncode = None
+
+        # the thread which started the command
+        self.thread = None
+
+        self._queue = asyncio.Queue(executor.maxsize)
+        self._task = None
+        self._process = None
+        self._error = None
+
+    async def _spawn(self):
+        if self.argv is None:
+            return await asyncio.create_subprocess_shell(
+                self.command_line,
+                cwd=self.cwd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+
+        if '/' in self.argv[0]:
+            # a path is relative to the command's directory, not ours
+            executable = os.path.abspath(
+                os.path.join(self.cwd or '', self.argv[0])
+            )
+
+            if not (os.path.isfile(executable) and
+                    os.access(executable, os.X_OK)):
+                # leave the shell to say why it can't be run
+                self.argv = None
+                return await self._spawn()
+        else:
+            executable = shutil.which(self.argv[0])
+            if executable is None:
+                raise FileNotFoundError(errno.ENOENT, 'not found')
+
+        # Python only uses posix_spawn, rather than fork and exec, when file
+        # descriptors aren't closed, which is safe as it never lets them be
+        # inherited anyway
+        try:
+            return await asyncio.create_subprocess_exec(
+                *self.argv,
+                executable=executable,
+                cwd=self.cwd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                close_fds=False,
+            )
+        except OSError as e:
+            if e.errno != errno.ENOEXEC:
+                raise
+
+            # a script without a shebang, which the shell runs itself
+            self.argv = None
+            return await self._spawn()
+
+    async def _start(self):
+        try:
+            try:
+                self._process = await self._spawn()
+            except OSError as e:
+                if self.argv is None:
+                    raise
+
+                # as the shell would say
+                message = f'{self.argv[0]}: {e.strerror}'.encode()
+                await self._queue.put([('stderr', message)])
+                self.returncode = 127 if e.errno == errno.ENOENT else 126
+                return
+
+            await asyncio.gather(
+                self._read('stdout', self._process.stdout),
+                self._read('stderr', self._process.stderr),
+            )
+
+            self.returncode = await self._process.wait()
+        except Exception as e:
+            self._error = e
+        finally:
+            self.executor._processes.discard(self)
+            await self._queue.put(None)
+
+    async def _read(self, pipe, stream):
+        splitter = LineSplitter(self.executor.max_line_length)
+
+        while True:
+            chunk = await stream.read(self.executor.chunk_size)
+
+            lines = splitter.feed(chunk) if chunk else splitter.flush()
+            if lines:
+                await self._queue.put([(pipe, line) for line in lines])
+
+            if not chunk:
+                break
+
+    async def _next_batches(self):
+        batches = [await self._queue.get()]
+        while not self._queue.empty():
+            batches.append(self._queue.get_nowait())
+        return batches
+
+    def __iter__(self):
+        while True:
+            future = asyncio.run_coroutine_threadsafe(self._next_batches(),
+                                                      self.loop)
+
+            for batch in future.result():
+                if batch is None:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                yield from batch
+
+    def terminate(self):
+        """
+        Terminate the command, if it is still running, along with any
+        processes it started.
+        """
+
+        self.loop.call_soon_threadsafe(lambda: _terminate_tree(self._process))
+
+
+class ShellCommand(Process):
+    """
+    A command running in a persistent shell, which is iterated over just like
+    a process.
+
+    Parameters
+    ----------
+    shell : Shell
+        The shell running the command.
+    command_line : str
+        The command to run.
+    """
+
+    def __init__(self, shell, command_line):
+        super().__init__(shell.executor, command_line)
+        self.shell = shell
+
+    async def _start(self):
+        try:
+            self.returncode = await self.shell._execute(self.command_line,
+                                                        self._queue)
+        except Exception as e:
+            self._error = e
+        finally:
+            self.executor._processes.discard(self)
+            await self._queue.put(None)
+
+    def terminate(self):
+        """Terminate the command, which also terminates its shell."""
+
+        self.shell.terminate()
+
+
+class Shell:
+    """
+    A shell which runs commands one after another, so the directory,
+    variables and anything else a command changes carry over to the next.
+
+    Each command is written to the shell's stdin, quoted and run through
+    ``eval``, followed by commands which write a sentinel line to each pipe,
+    the one on stdout carrying the exit code, which mark where the command's
+    output ends. Commands read their stdin from ``/dev/null``, and one which
+    doesn't parse just fails, so they can't swallow the ones after them.
+
+    The shell is started when the first command is run. If a command makes
+    it exit, the next command is run in a new shell.
+
+    Parameters
+    ----------
+    executor : Executor
+        The executor running the shell.
+    cwd : str
+        The directory to start the shell in, defaults to the current one.
+    """
+
+    close_timeout = 5
+
+    def __init__(self, executor, cwd=None):
+        self.executor = executor
+        self.loop = executor.loop
+        self.cwd = cwd
+
+        self._process = None
+        self._sentinel = f'__mo_{os.urandom(8).hex()}__'.encode()
+        self._splitters = {}
+        self._pending = {}
+
+    async def _spawn(self):
+        self._process = await asyncio.create_subprocess_exec(
+            '/bin/sh',
+            cwd=self.cwd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+
+        for pipe in ('stdout', 'stderr'):
+            self._splitters[pipe] = LineSplitter(self.executor.max_line_length)
+            self._pending[pipe] = []
+
+    async def _execute(self, command_line, queue):
+        if self._process is None:
+            await self._spawn()
+
+        process = self._process
+        sentinel = self._sentinel
+
+        # quoted and run through eval, so that a command which doesn't parse,
+        # such as one with an unbalanced quote, fails on its own rather than
+        # swallowing the sentinels, and ``command`` stops the error exiting
+        # the shell
+        quoted = command_line.replace("'", "'\\''")
+
+        script = b''.join([
+            b"command eval '", quoted.encode(), b"' < /dev/null\n",
+            b'printf "\\n%s %d\\n" ', sentinel, b' $?\n',
+            b'printf "\\n%s\\n" ', sentinel, b' >&2\n',
+        ])
+
+        try:
+            process.stdin.write(script)
+            await process.stdin.drain()
+        except ConnectionError:
+            pass
+
+        statuses = await asyncio.gather(
+            self._read('stdout', process.stdout, queue),
+            self._read('stderr', process.stderr, queue),
+        )
+
+        try:
+            return int(statuses[0])
+        except (TypeError, ValueError):
+            # the shell exited, so its exit code is the command's
+            self._process = None
+            return await process.wait()
+
+    async def _read(self, pipe, stream, queue):
+        # pass on lines until the sentinel, keeping any which come after it
+        # for the next command
+        splitter = self._splitters[pipe]
+        lines, self._pending[pipe] = self._pending[pipe], []
+
+        while True:
+            for index, line in enumerate(lines):
+                if line.startswith(self._sentinel):
+                    self._pending[pipe] = lines[index + 1:]
+                    if index:
+                        await queue.put([(pipe, l) for l in lines[:index]])
+                    return line[len(self._sentinel):].strip()
+
+            if lines:
+                await queue.put([(pipe, line) for line in lines])
+
+            chunk = await stream.read(self.executor.chunk_size)
+            if not chunk:
+                lines = splitter.flush()
+                if lines:
+                    await queue.put([(pipe, line) for line in lines])
+                return None
+
+            lines = splitter.feed(chunk)
+
+    def run(self, command_line):
+        """
+        Start running a command in the shell, once the previous one has
+        finished.
+
+        Returns
+        -------
+        ShellCommand
+            The running command.
+        """
+
+        thread = threading.get_ident()
+
+        async def spawn():
+            command = ShellCommand(self, command_line)
+            command.thread = thread
+            self.executor._processes.add(command)
+            command._task = self.loop.create_task(command._start())
+            return command
+
+        return asyncio.run_coroutine_threadsafe(spawn(), self.loop).result()
+
+    def terminate(self):
+        """Terminate the shell, along with any command it is running."""
+
+        self.loop.call_soon_threadsafe(lambda: _terminate_tree(self._process))
+
+    async def _close(self):
+        process, self._process = self._process, None
+        if process is None:
+            return
+
+        process.stdin.close()
+
+        try:
+            await asyncio.wait_for(process.wait(), self.close_timeout)
+        except asyncio.TimeoutError:
+            _terminate_tree(process)
+            await process.wait()
+
+    def close(self):
+        """Close the shell's stdin, and wait for it to exit."""
+
+        asyncio.run_coroutine_threadsafe(self._close(), self.loop).result()
+
+
+class Executor:
+    """
+    An executor runs commands as child processes, driving all of them from
+    one asyncio event loop in a background thread.
+
+    Parameters
+    ----------
+    maxsize : int
+        The maximum number of chunks of output each process may buffer before
+        reading is paused until they are consumed.
+    chunk_size : int
+        The most bytes to read from a pipe at once.
+    max_line_length : int
+        The longest line to hold on to, longer lines are split.
+    """
+
+    def __init__(self, maxsize=64, chunk_size=64 * 1024,
+                 max_line_length=1024 * 1024):
+        self.maxsize = maxsize
+        self.chunk_size = chunk_size
+        self.max_line_length = max_line_length
+
+        self._loop = None
+        self._lock = threading.Lock()
+        self._processes = set()
+
+        # the loop's thread doesn't survive a fork, so start a fresh one
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._loop = None
+        self._lock = threading.Lock()
+        self._processes = set()
+
+    @property
+    def loop(self):
+        """The event loop, which is started on first use."""
+
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._loop.run_forever,
+                                          name='mo-executor', daemon=True)
+                thread.start()
+
+        return self._loop
+
+    def run(self, command_line, cwd=None, argv=None):
+        """
+        Start running a command, optionally in another directory, and directly
+        rather than through the shell if its arguments are given.
+
+        Returns
+        -------
+        Process
+            The running process.
+        """
+
+        loop = self.loop
+        thread = threading.get_ident()
+
+        async def spawn():
+            process = Process(self, command_line, cwd, argv)
+            process.thread = thread
+            self._processes.add(process)
+            process._task = loop.create_task(process._start())
+            return process
+
+        return asyncio.run_coroutine_threadsafe(spawn(), loop).result()
+
+    def shell(self, cwd=None):
+        """
+        Create a persistent shell, which runs commands one after another,
+        optionally in another directory.
+
+        Returns
+        -------
+        Shell
+            The shell, which is started when it runs its first command.
+        """
+
+        return Shell(self, cwd)
+
+    def terminate_all(self):
+        """Terminate every command which is still running."""
+
+        if self._loop is None:
+            return
+
+        def terminate_all():
+            for process in list(self._processes):
+                process.terminate()
+
+        self._loop.call_soon_threadsafe(terminate_all)
+
+    def terminate_threads(self, threads):
+        """Terminate every running command started by some threads."""
+
+        if self._loop is None:
+            return
+
+        def terminate_threads():
+            for process in list(self._processes):
+                if process.thread in threads:
+                    process.terminate()
+
+        self._loop.call_soon_threadsafe(terminate_threads)
+
+
+default_executor = Executor()
@@ -0,0 +1,190 @@
+"""Utilities for fingerprinting the inputs and outputs of tasks."""
+
+from hashlib import sha256
+from pathlib import Path
+import json
+import os
+import threading
+
+
+STATE_DIRECTORY = '.mo'
+
+
+def state_directory(project_path):
+    """Get the directory that M-O keeps its state in for a project."""
+
+    return Path(project_path) / STATE_DIRECTORY
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """Hash the contents of a file."""
+
+    digest = sha256()
+
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class FingerprintStore:
+    """
+    A store of the fingerprints of the inputs and outputs of tasks.
+
+    Files are only hashed when their modification time or size has changed
+    since they were last seen, so fingerprinting a large tree is mostly a
+    matter of calling ``stat``.
+
+    Parameters
+    ----------
+    project_path : Path
+        The directory of the project, which globs are relative to.
+    filename : Path
+        Where the fingerprints are stored, defaults to a file in the state
+        directory of the project.
+    """
+
+    def __init__(self, project_path, filename=None):
+        self.project_path = Path(project_path)
+
+        if filename is None:
+            filename = state_directory(project_path) / 'fingerprints.json'
+
+        self.filename = Path(filename)
+
+        self._lock = threading.RLock()
+        self._files = None
+        self._tasks = None
+
+    def _load(self):
+        if self._files is not None:
+            return
+
+        try:
+            with self.filename.open() as file:
+                state = json.load(file)
+        except (FileNotFoundError, ValueError):
+            state = {}
+
+        self._files = state.get('files', {})
+        self._tasks = state.get('tasks', {})
+
+    def save(self):
+        """Write the fingerprints to disk."""
+
+        with self._lock:
+            self._load()
+
+            self.filename.parent.mkdir(parents=True, exist_ok=True)
+
+            temporary = self.filename.with_suffix('.tmp')
+            with temporary.open('w') as file:
+                json.dump({'files': self._files, 'tasks': self._tasks}, file)
+
+            os.replace(temporary, self.filename)
+
+    def expand(self, patterns):
+        """Expand a list of globs into a sorted list of files."""
+
+        paths = set()
+
+        for pattern in patterns:
+            for path in self.project_path.glob(pattern):
+                if path.is_file():
+                    paths.add(path)
+
+        return sorted(paths)
+
+    def hash_file(self, path):
+        """Hash a file, using the cached hash if it hasn't changed."""
+
+        key = str(path.relative_to(self.project_path))
+        stat = path.stat()
+
+        with self._lock:
+            self._load()
+            cached = self._files.get(key)
+
+        if cached is not None and cached[:2] == [stat.st_mtime_ns, stat.st_size]:
+            return cached[2]
+
+        digest = hash_file(path)
+
+        with self._lock:
+            self._files[key] = [stat.st_mtime_ns, stat.st_size, digest]
+
+        return digest
+
+    def fingerprint(self, patterns, extra=None):
+        """
+        Fingerprint the files matching some globs.
+
+        Parameters
+        ----------
+        patterns : list
+            The globs to match files with.
+        extra : object
+            Anything else to include in the fingerprint, must be JSON
+            serialisable.
+
+        Returns
+        -------
+        str
+            The fingerprint, or ``None`` if no files match.
+        """
+
+        paths = self.expand(patterns)
+
+        if not paths and extra is None:
+            return None
+
+        digest = sha256(json.dumps(extra, sort_keys=True).encode())
+
+        for path in paths:
+            digest.update(str(path.relative_to(self.project_path)).encode())
+            digest.update(self.hash_file(path).encode())
+
+        return digest.hexdigest()
+
+    def _fingerprints(self, task, variables):
+        definition = {
+            'steps': [list(step) for step in task.steps],
+            'variables': variables,
+        }
+
+        inputs = self.fingerprint(task.inputs, definition)
+        outputs = self.fingerprint(task.outputs) if task.outputs else None
+
+        return {'inputs': inputs, 'outputs': outputs}
+
+    def is_up_to_date(self, task, variables):
+        """
+        Check whether a task's inputs and outputs are unchanged since it was
+        last run.
+        """
+
+        if not task.inputs:
+            return False
+
+        fingerprints = self._fingerprints(task, variables)
+
+        if task.outputs and fingerprints['outputs'] is None:
+            return False
+
+        with self._lock:
+            self._load()
+            return self._tasks.get(task.name) == fingerprints
+
+    def update(self, task, variables):
+        """Record the fingerprints of a task which has just been run."""
+
+        if not task.inputs:
+            return
+
+        fingerprints = self._fingerprints(task, variables)
+
+        with self._lock:
+            self._load()
+            self._tasks[task.name] = fingerprints
+            self.save()
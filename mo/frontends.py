@@ -1,16 +1,60 @@
 """Contains all the frontends available."""
 
+from collections import deque
+from enum import Enum
 import json
+import sys
+import threading
+import time
 
-import colorama
-from colorama import Fore, Style
+from . import events
+from .events import Event, EventKind, decode
+from .history import TaskStatistics
+from .plan import PlannedTask
+from .profile import Timing
+from .project import (Step, StepCollection, Task, TaskCollection, Variable,
+                      VariableCollection)
+from .steps import ParallelSteps, nested_steps
 
-from .events import Event, EventKind
-from .project import Step, StepCollection, Task, Variable, VariableCollection
+
+def _format_seconds(seconds):
+    if seconds >= 60:
+        minutes, seconds = divmod(seconds, 60)
+        return f'{int(minutes)}m{seconds:04.1f}s'
+    elif seconds >= 1:
+        return f'{seconds:.2f}s'
+    return f'{seconds * 1000:.1f}ms'
+
+
+def _step_name(step):
+    name = f'{step.type}: {step.args}' if step.args else step.type
+    if len(name) > 40:
+        name = name[:39] + '…'
+    return name
 
 
 class Frontend:
-    """A frontend takes output from the runner and displays it to the user."""
+    """
+    A frontend takes output from the runner and displays it to the user.
+
+    Parameters
+    ----------
+    stream : file
+        Where to write output to, defaults to standard out.
+    """
+
+    def __init__(self, stream=None):
+        self._stream = stream
+
+    @property
+    def stream(self):
+        # looked up each time, as colorama may replace standard out
+        return self._stream or sys.stdout
+
+    def print(self, *args):
+        """Print a line of output."""
+
+        print(*args, file=self.stream)
 
     def begin(self):
         """Begin processing output."""
@@ -29,17 +73,21 @@ class Debug(Frontend):
     """The debug frontend simply prints the raw events."""
 
     def output(self, event):
-        print(event)
+        self.print(event)
 
 
 class Human(Frontend):
     """
     The human frontend provides colourful textual output useful for humans
     to read.
+
+    Colorama is only imported by this frontend, so that the other frontends
+    don't pay for importing it.
     """
 
     ignored_events = (
-        'FindingTask', 'StartingTask', 'RunningStep', 'FinishedTask'
+        events.FindingTask, events.StartingTask, events.RunningStep,
+        events.TaskTiming, events.StepTiming,
     )
 
     def indent(self, string, n=1):
@@ -50,105 +98,504 @@ class Human(Frontend):
 
         return '\n'.join(new_lines)
 
+    def __init__(self, stream=None):
+        super().__init__(stream)
+
+        from colorama import Fore, Style
+
+        self.fore = Fore
+        self.style = Style
+
+        self.current_task = None
+
+        self.estimates = {}
+        self.jobs = 1
+        self.tasks_started = 0
+        self.tasks_finished = set()
+
+        # indexed by event tag
+        self._ignored = [cls in self.ignored_events for cls in events.event_types]
+        self._formatters = [self.formatters.get(cls)
+                            for cls in events.event_types]
+
+        # the character and styles only depend on the type of event, which
+        # has its name and kind too, so they are worked out once for each
+        self._decorations = [
+            (self.get_character_style(cls), self.get_character(cls),
+             self.get_text_style(cls))
+            for cls in events.event_types
+        ]
+
     def begin(self):
+        import colorama
+
         colorama.init()
-        print()
+        self.print()
 
     def end(self):
-        print()
+        self.print()
 
     def get_character(self, event):
         if event.kind is EventKind.output:
             return ' '
         elif event.kind is EventKind.error:
             return '!'
-        elif 'Task' in event.name:
+        elif 'Task' in event.name or event.name == 'UpToDate':
             return 'λ'
         elif 'Command' in event.name:
             return '>'
+        elif event.name in ('Watching', 'FilesChanged', 'RunCancelled'):
+            return '~'
+        elif 'Worker' in event.name:
+            return '@'
+        elif 'Cache' in event.name:
+            return '#'
 
     def get_character_style(self, event):
-        if event.name == 'SkippingTask':
-            return Fore.YELLOW
+        if event.name in ('SkippingTask', 'UpToDate', 'WorkerLost',
+                          'RestoredFromCache', 'CacheUnavailable'):
+            return self.fore.YELLOW
         elif event.kind is EventKind.error:
-            return Fore.RED
+            return self.fore.RED
 
-        return Fore.BLUE
+        return self.fore.BLUE
 
     def get_text_style(self, event):
         if event.name == 'RunningTask':
-            return Style.BRIGHT
-        elif event.name == 'SkippingTask':
-            return Style.DIM
+            return self.style.BRIGHT
+        elif event.name in ('SkippingTask', 'UpToDate', 'RestoredFromCache'):
+            return self.style.DIM
         elif event.name == 'RunningCommand':
-            return Style.BRIGHT
+            return self.style.BRIGHT
         elif event.kind is EventKind.output:
-            return Style.DIM
+            return self.style.DIM
         elif event.kind is EventKind.error:
-            return Style.BRIGHT + Fore.RED
+            return self.style.BRIGHT + self.fore.RED
+
+        return self.style.NORMAL
+
+    def _format_scheduled(self, event):
+        self.estimates = event.estimates
+        self.jobs = event.jobs
+        self.tasks_started = 0
+        self.tasks_finished = set()
+
+    def _format_finished_task(self, event):
+        self.tasks_finished.add(event.task)
+
+    def progress(self):
+        """
+        Describe how many tasks have started, and how long the rest should
+        take going by how long they took before.
+        """
+
+        if len(self.estimates) < 2:
+            return ''
+
+        text = f'{self.tasks_started}/{len(self.estimates)}'
+
+        remaining = [
+            estimate for name, estimate in self.estimates.items()
+            if name not in self.tasks_finished
+        ]
+
+        if None not in remaining:
+            seconds = max(sum(remaining) / self.jobs, max(remaining))
+            text += f', about {_format_seconds(seconds)} left'
+
+        return f' {self.style.DIM}({text})'
+
+    def _format_running_task(self, event):
+        self.tasks_started += 1
+        return (f'Running task: {self.style.NORMAL}{event.subject.name}' +
+                self.progress())
+
+    def _format_skipping_task(self, event):
+        return f'Skipping task: {self.style.NORMAL}{event.task_name}'
+
+    def _format_up_to_date(self, event):
+        return f'Up to date: {self.style.NORMAL}{event.subject.name}'
+
+    def _format_running_command(self, event):
+        return f'Executing: {self.style.NORMAL}{event.command}'
+
+    def _format_command_output(self, event):
+        # coalesced output may span several lines
+        text = decode(event.output).replace('\n', '\n   ')
+        if event.pipe == 'stderr':
+            text = self.fore.RED + text
+        return text
+
+    def _format_command_failed(self, event):
+        # the command says which failed when several run at once, such as
+        # the labelled steps of a parallel step
+        text = (f'Command failed with exit code {event.code}: '
+                f'{self.style.NORMAL}{event.command}')
+        if event.description:
+            text += f'{self.style.NORMAL}\n{self.indent(event.description, 3)}'
+        return text
+
+    def _format_dropped_output(self, event):
+        return f'Dropped {event.count} lines of output'
+
+    def _format_invalid_mofile(self, event):
+        text = f'Invalid task file: {self.style.NORMAL}{event.filename}'
+        if event.reason:
+            text += f'\n{self.indent(event.reason, 3)}'
+        return text
+
+    def _format_undefined_variable(self, event):
+        return f'Undefined variable: {self.style.NORMAL}{event.variable}'
+
+    def _format_task_not_found(self, event):
+        text = f'No such task: {self.style.NORMAL}{event.task_name}'
+        if event.similarities:
+            similarities_str = ', '.join(
+                task.name for task in event.similarities
+            )
+            text += f' Did you mean? {similarities_str}'
+        return text
+
+    def _format_help_output(self, event):
+        self.print()
+        for line in event.output.splitlines():
+            self.print('', line)
+
+    def _format_dependency_cycle(self, event):
+        return (f'Dependency cycle: {self.style.NORMAL}'
+                f'{" -> ".join(event.tasks)}')
+
+    def _format_invalid_step(self, event):
+        return (f'Invalid {event.step.type} step: {self.style.NORMAL}'
+                f'{event.reason}')
+
+    def _print_steps(self, steps, indent):
+        for step in steps:
+            if step.type in nested_steps:
+                self.print(f'{indent}{step.type}:')
+                self._print_steps(step.args.steps, indent + '  ')
+            else:
+                self.print(f'{indent}{step.type}:', step.args)
+
+    def _format_plan(self, event):
+        for number, planned in enumerate(event.tasks, 1):
+            self.print(f'{number}. {planned.name}')
+
+            if planned.dependencies:
+                self.print('   after:', ', '.join(planned.dependencies))
+            if planned.task.directory is not None:
+                self.print('   in:', planned.task.directory)
+
+            self._print_steps(planned.steps, '   ')
+
+    def _format_sent_to_worker(self, event):
+        return f'Sent to worker: {self.style.NORMAL}{event.worker}'
+
+    def _format_worker_lost(self, event):
+        return (f'Lost worker: {self.style.NORMAL}{event.worker}'
+                f'{self.style.DIM}, trying again')
+
+    def _format_restored_from_cache(self, event):
+        return f'Restored from cache: {self.style.NORMAL}{event.subject.name}'
+
+    def _format_stored_in_cache(self, event):
+        return f'Stored in cache: {self.style.NORMAL}{event.subject.name}'
+
+    def _format_cache_unavailable(self, event):
+        return f'Cache unavailable: {self.style.NORMAL}{event.reason}'
+
+    def _format_logged_output(self, event):
+        when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event.run))
+
+        source = event.source or ''
+        if event.step is not None:
+            source += f' #{event.step + 1}'
+
+        text = f'{self.style.DIM}{when} {source}{self.style.NORMAL} '
+        if event.pipe == 'stderr':
+            text += self.fore.RED
+        return text + event.output
+
+    def _format_watching(self, event):
+        files = 'file' if event.files == 1 else 'files'
+        return f'Watching {event.files} {files} for changes'
+
+    def _format_files_changed(self, event):
+        import os
+
+        names = [os.path.relpath(name) for name in event.files[:5]]
+        if len(event.files) > 5:
+            names.append(f'and {len(event.files) - 5} more')
+
+        return f'Changed: {self.style.NORMAL}{", ".join(names)}'
+
+    def _format_run_cancelled(self, event):
+        return 'Cancelled, as files changed'
+
+    def _format_statistics(self, event):
+        self.print('Slowest tasks:')
+        self.print()
+        for task in event.slowest:
+            self.print(f'{task.task} - {_format_seconds(task.mean)}'
+                       f' over {task.runs} runs')
+
+        self.print()
+        self.print('Most variable tasks:')
+        self.print()
+        for task in event.variable:
+            self.print(f'{task.task} - {_format_seconds(task.mean)}'
+                       f' ± {_format_seconds(task.stdev)}')
+
+    def _format_help(self, event):
+        self.print('Available tasks:')
+        self.print()
+        for name, task in event.tasks.items():
+            self.print(name, '-', task.description)
+
+    formatters = {
+        events.Scheduled: _format_scheduled,
+        events.FinishedTask: _format_finished_task,
+        events.RunningTask: _format_running_task,
+        events.SkippingTask: _format_skipping_task,
+        events.UpToDate: _format_up_to_date,
+        events.RunningCommand: _format_running_command,
+        events.CommandOutput: _format_command_output,
+        events.CommandFailed: _format_command_failed,
+        events.DroppedOutput: _format_dropped_output,
+        events.InvalidMofile: _format_invalid_mofile,
+        events.UndefinedVariable: _format_undefined_variable,
+        events.TaskNotFound: _format_task_not_found,
+        events.HelpOutput: _format_help_output,
+        events.Help: _format_help,
+        events.Statistics: _format_statistics,
+        events.Watching: _format_watching,
+        events.FilesChanged: _format_files_changed,
+        events.RunCancelled: _format_run_cancelled,
+        events.DependencyCycle: _format_dependency_cycle,
+        events.InvalidStep: _format_invalid_step,
+        events.Plan: _format_plan,
+        events.SentToWorker: _format_sent_to_worker,
+        events.WorkerLost: _format_worker_lost,
+        events.RestoredFromCache: _format_restored_from_cache,
+        events.StoredInCache: _format_stored_in_cache,
+        events.CacheUnavailable: _format_cache_unavailable,
+        events.LoggedOutput: _format_logged_output,
+    }
+    """
+    Mapping event type to a method which formats it as text, or prints it
+    itself and returns ``None``.
+    """
 
     def output(self, event):
-        if event.name in self.ignored_events:
+        if self._ignored[event.tag]:
             return
 
-        character_style = self.get_character_style(event)
-        character = self.get_character(event)
-        text_style = self.get_text_style(event)
+        Fore, Style = self.fore, self.style
 
-        if event.name == 'RunningTask':
-            text = f'Running task: {Style.NORMAL}{event.args["task"].name}'
-        elif event.name == 'SkippingTask':
-            text = f'Skipping task: {Style.NORMAL}{event.args["name"]}'
-        elif event.name == 'RunningCommand':
-            text = f'Executing: {Style.NORMAL}{event.args["command"]}'
-        elif event.name == 'CommandOutput':
-            text = event.args['output']
-            if event.args['pipe'] == 'stderr':
-                text_style += Fore.RED
-        elif event.name == 'CommandFailed':
-            text = f'Command failed with exit code {event.args["code"]}'
-            if event.args['description']:
-                text += f'{Style.NORMAL}\n{self.indent(event.args["description"], 3)}'
-        elif event.name == 'InvalidMofile':
-            text = f'Invalid task file: {Style.NORMAL}{event.args["filename"]}'
-        elif event.name == 'UndefinedVariable':
-            text = f'Undefined variable: {Style.NORMAL}{event.args["variable"]}'
-        elif event.name == 'TaskNotFound':
-            text = f'No such task: {Style.NORMAL}{event.args["name"]}'
-            if event.args['similarities']:
-                similarities_str = ', '.join(event.args['similarities'])
-                text += f' Did you mean? {similarities_str}'
-        elif event.name == 'HelpOutput':
-            print()
-            for line in event.args['output'].splitlines():
-                print('', line)
-            return
-        elif event.name == 'Help':
-            print('Available tasks:')
-            print()
-            for name, task in event.args['tasks'].items():
-                print(name, '-', task.description)
-            return
-        else:
+        formatter = self._formatters[event.tag]
+
+        if formatter is None:
             character = '?'
             character_style = Fore.YELLOW
             text = f'Unknown event: {Style.NORMAL}{event}'
             text_style = Fore.YELLOW
+        else:
+            text = formatter(self, event)
+            if text is None:
+                return
+
+            character_style, character, text_style = \
+                self._decorations[event.tag]
 
         character_style += Style.BRIGHT
 
-        print(
+        if event.task is not None and event.task != self.current_task:
+            # output from concurrent tasks is interleaved, so mark each switch
+            if self.current_task is not None and event.name != 'RunningTask':
+                self.print(
+                    f' {Fore.BLUE}{Style.BRIGHT}λ{Style.RESET_ALL}' +
+                    f' {Style.DIM}{event.task}{Style.RESET_ALL}'
+                )
+            self.current_task = event.task
+
+        self.print(
             f' {character_style}{character}{Style.RESET_ALL}' +
             f' {text_style}{text}{Style.RESET_ALL}'
         )
 
 
+class Live(Human):
+    """
+    The live frontend is the human frontend, redrawn at a capped rate so
+    that rendering costs the same however much commands print.
+
+    Lines are collected and written once per frame. While a command runs
+    only the last ``tail_lines`` lines of its output are shown, replaced as
+    more arrives, and once it succeeds they are cleared away. If it fails,
+    the last ``kept_output`` pieces of its output are shown, so a command
+    which prints without end doesn't use up memory.
+
+    Output that isn't to a terminal can't be redrawn, so only the output of
+    failed commands is shown there.
+    """
+
+    refresh_rate = 15
+    """The most frames to draw each second."""
+
+    tail_lines = 5
+    """How many lines of output to show for each running command."""
+
+    kept_output = 1000
+    """How many pieces of output to keep for each running command, to show
+    if it fails."""
+
+    def __init__(self, stream=None):
+        super().__init__(stream)
+
+        self._lines = []
+        self._output = {}
+        self._dropped = {}
+        self._drawn = 0
+        self._next_frame = 0
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def print(self, *args):
+        self._lines.append(' '.join(str(arg) for arg in args))
+
+    def output(self, event):
+        with self._lock:
+            if event.tag == events.CommandOutput.tag:
+                self._keep(event)
+            else:
+                if event.tag == events.CommandFailed.tag:
+                    # show what the failed command printed
+                    dropped = self._dropped.get(event.task)
+                    if dropped:
+                        super().output(events.dropped_output(dropped))
+
+                    for output in self._output.get(event.task, ()):
+                        super().output(output)
+
+                if event.tag in self._finishes_output:
+                    self._output.pop(event.task, None)
+                    self._dropped.pop(event.task, None)
+
+                super().output(event)
+
+            self._schedule()
+
+    def _keep(self, event):
+        outputs = self._output.get(event.task)
+        if outputs is None:
+            outputs = self._output[event.task] = deque(maxlen=self.kept_output)
+
+        if len(outputs) == outputs.maxlen:
+            # the oldest is pushed out, so count the lines it had, which may
+            # be text rather than bytes, such as from print steps
+            output = outputs[0].output
+            newline = b'\n' if isinstance(output, bytes) else '\n'
+            lines = output.count(newline) + 1
+            self._dropped[event.task] = \
+                self._dropped.get(event.task, 0) + lines
+
+        outputs.append(event)
+
+    _finishes_output = frozenset({
+        events.RunningCommand.tag, events.CommandFailed.tag,
+        events.FinishedTask.tag,
+    })
+
+    def _schedule(self):
+        now = time.monotonic()
+
+        if now >= self._next_frame:
+            self._draw(now)
+        elif self._timer is None:
+            self._timer = threading.Timer(self._next_frame - now, self.redraw)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def redraw(self):
+        """Draw a frame now."""
+
+        with self._lock:
+            self._draw(time.monotonic())
+
+    def _draw(self, now, live=True):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        self._next_frame = now + 1 / self.refresh_rate
+
+        stream = self.stream
+        tty = stream.isatty()
+        frame = []
+
+        if self._drawn:
+            # move back up over the last frame's tails, and clear them
+            frame.append(f'\r\x1b[{self._drawn}A\x1b[J')
+            self._drawn = 0
+
+        for line in self._lines:
+            frame.append(line + '\n')
+        self._lines = []
+
+        if live and tty:
+            for line in self._tails():
+                frame.append(line + '\n')
+                self._drawn += 1
+
+        if frame:
+            stream.write(''.join(frame))
+            stream.flush()
+
+    def _tails(self):
+        import shutil
+
+        Style = self.style
+        width = shutil.get_terminal_size().columns - 1
+        several = len(self._output) > 1
+
+        for task, outputs in self._output.items():
+            if several:
+                yield f' {Style.DIM}λ {task}{Style.RESET_ALL}'
+
+            # walk backwards, so only the last few events are decoded
+            tail = []
+            for output in reversed(outputs):
+                tail[:0] = decode(output.output).splitlines()
+                if len(tail) >= self.tail_lines:
+                    break
+
+            for line in tail[-self.tail_lines:]:
+                # long lines are cut short, as wrapping would throw off how
+                # many lines to clear
+                yield f'   {Style.DIM}{line[:width - 3]}{Style.RESET_ALL}'
+
+    def end(self):
+        super().end()
+
+        with self._lock:
+            self._draw(time.monotonic(), live=False)
+
+
 class SerialisingFrontend(Frontend):
     """
     A serialising frontend first serialises events into dictionaries before
     outputting.
+
+    How to serialise each type is worked out the first time it is seen, and
+    then cached, so serialising doesn't repeat a chain of ``isinstance``
+    checks for every object.
     """
 
+    def __init__(self, stream=None):
+        super().__init__(stream)
+
+        self._serialisers = {}
+
     def serialise(self, obj):
         """
         Take an object from the project or the runner and serialise it into a
@@ -165,22 +612,256 @@ class SerialisingFrontend(Frontend):
             A serialised version of the input object.
         """
 
-        if isinstance(obj, (list, VariableCollection, StepCollection)):
-            return [self.serialise(element) for element in obj]
-        elif isinstance(obj, dict):
-            return {k: self.serialise(v) for k, v in obj.items()}
-        elif isinstance(obj, str):
-            return obj
-        elif isinstance(obj, (Event, Task, Variable, Step)):
-            return self.serialise(obj._asdict())
-        elif obj is None:
-            return None
+        try:
+            serialiser = self._serialisers[type(obj)]
+        except KeyError:
+            serialiser = self._serialisers[type(obj)] = \
+                self._create_serialiser(type(obj))
+
+        return serialiser(obj)
+
+    def _create_serialiser(self, cls):
+        serialise = self.serialise
+
+        if issubclass(cls, (list, VariableCollection, StepCollection)):
+            return lambda obj: [serialise(element) for element in obj]
+        elif issubclass(cls, (dict, TaskCollection)):
+            return lambda obj: {k: serialise(v) for k, v in obj.items()}
+        elif issubclass(cls, (str, int, float)):
+            return lambda obj: obj
+        elif issubclass(cls, bytes):
+            return decode
+        elif issubclass(cls, Enum):
+            return lambda obj: obj.value
+        elif issubclass(cls, Event):
+            name, kind, fields = cls.name, cls.kind.value, cls.fields
+            return lambda obj: {
+                'name': name,
+                'kind': kind,
+                'args': {
+                    field: serialise(value)
+                    for field, value in zip(fields, obj)
+                },
+                'task': obj.task,
+            }
+        elif issubclass(cls, (Task, Variable, Step, Timing, TaskStatistics,
+                               PlannedTask, ParallelSteps)):
+            fields = cls._fields
+            return lambda obj: {
+                field: serialise(value) for field, value in zip(fields, obj)
+            }
+        elif issubclass(cls, tuple):
+            return lambda obj: [serialise(element) for element in obj]
+        elif cls is type(None):
+            return lambda obj: None
         else:
-            raise TypeError(type(obj))
+            raise TypeError(cls)
 
 
 class Json(SerialisingFrontend):
-    """Display the output as line terminated JSON objects."""
+    """
+    Display the output as line terminated JSON objects.
+
+    Output is buffered and written in batches, at most ``flush_interval``
+    seconds after an event arrives and straight away at task and command
+    boundaries.
+    """
+
+    flush_interval = 0.1
+
+    flush_events = frozenset({
+        'RunningTask', 'FinishedTask', 'RunningCommand', 'Help', 'HelpOutput',
+    })
+
+    empty = ''
+
+    def __init__(self, stream=None):
+        super().__init__(stream)
+
+        self._chunks = []
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def encode(self, event):
+        """Encode an event into a chunk of output."""
+
+        return json.dumps(self.serialise(event)) + '\n'
+
+    def write(self, data):
+        """Write a batch of output."""
+
+        self.stream.write(data)
+        self.stream.flush()
+
+    def output(self, event):
+        chunk = self.encode(event)
+
+        with self._lock:
+            self._chunks.append(chunk)
+
+            if event.name in self.flush_events or event.kind is EventKind.error:
+                self._flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write any buffered output."""
+
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if self._chunks:
+            chunks, self._chunks = self._chunks, []
+            self.write(self.empty.join(chunks))
+
+    def end(self):
+        self.flush()
+
+
+class JsonFramed(Json):
+    """
+    Display the output as compact JSON objects, each framed by its length as
+    a four byte big endian integer.
+    """
+
+    empty = b''
+
+    def encode(self, event):
+        data = json.dumps(self.serialise(event), separators=(',', ':'))
+        data = data.encode()
+        return len(data).to_bytes(4, 'big') + data
+
+    def write(self, data):
+        stream = getattr(self.stream, 'buffer', self.stream)
+        stream.write(data)
+        stream.flush()
+
+
+class Profile(Frontend):
+    """
+    Collects timing events, and prints a table of them once finished.
+
+    Parameters
+    ----------
+    stream : file
+        Where to write the table to, defaults to standard error so that it
+        doesn't get mixed up with machine readable output.
+    """
+
+    columns = ('Wall', 'CPU', 'Children user', 'Children system')
+
+    def __init__(self, stream=None):
+        super().__init__(stream or sys.stderr)
+
+        self.rows = []
+        self._steps = {}
+
+    def output(self, event):
+        if event.tag == events.StepTiming.tag:
+            row = ('  ' + _step_name(event.step), event.timing)
+            self._steps.setdefault(event.task, []).append(row)
+        elif event.tag == events.TaskTiming.tag:
+            self.rows.append((event.subject.name, event.timing))
+            self.rows += self._steps.pop(event.task, [])
+
+    def end(self):
+        if not self.rows:
+            return
+
+        table = [('Task',) + self.columns]
+        for name, timing in self.rows:
+            table.append((name,) + tuple(
+                _format_seconds(seconds) for seconds in timing[1:]
+            ))
+
+        widths = [max(len(row[i]) for row in table)
+                  for i in range(len(table[0]))]
+
+        self.print()
+        for row in table:
+            cells = [row[0].ljust(widths[0])]
+            cells += [cell.rjust(width)
+                      for cell, width in zip(row[1:], widths[1:])]
+            self.print('  '.join(cells))
+
+
+class Trace(Frontend):
+    """
+    Collects timing events, and writes them once finished in the Chrome
+    trace event format, to be opened in ``chrome://tracing`` or Perfetto.
+
+    Tasks which ran at the same time are put on separate rows, with their
+    steps nested beneath them.
+
+    Parameters
+    ----------
+    stream : file
+        Where to write the trace to.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(stream)
+
+        self.tasks = []
+        self._steps = {}
 
     def output(self, event):
-        print(json.dumps(self.serialise(event)))
+        if event.tag == events.StepTiming.tag:
+            self._steps.setdefault(event.task, []).append(
+                (_step_name(event.step), event.timing)
+            )
+        elif event.tag == events.TaskTiming.tag:
+            self.tasks.append((event.subject.name, event.timing,
+                               self._steps.pop(event.task, [])))
+
+    def _trace_event(self, name, category, timing, origin, row):
+        return {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (timing.start - origin) * 1e6,
+            'dur': timing.wall * 1e6,
+            'pid': 1,
+            'tid': row,
+            'args': {
+                'cpu': timing.cpu,
+                'children_user': timing.children_user,
+                'children_system': timing.children_system,
+            },
+        }
+
+    def end(self):
+        tasks = sorted(self.tasks, key=lambda task: task[1].start)
+        origin = tasks[0][1].start if tasks else 0
+
+        trace_events = []
+        row_ends = []
+
+        for name, timing, steps in tasks:
+            # the first row that is free by the time this task started
+            for row, end in enumerate(row_ends):
+                if end <= timing.start:
+                    break
+            else:
+                row = len(row_ends)
+                row_ends.append(0)
+
+            row_ends[row] = timing.start + timing.wall
+
+            trace_events.append(
+                self._trace_event(name, 'task', timing, origin, row)
+            )
+            trace_events += [
+                self._trace_event(step, 'step', step_timing, origin, row)
+                for step, step_timing in steps
+            ]
+
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'},
+                  self.stream)
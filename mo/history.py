@@ -0,0 +1,253 @@
+"""Utilities for remembering how long tasks took to run in the past."""
+
+from collections import namedtuple
+from contextlib import closing
+from hashlib import sha256
+from pathlib import Path
+import json
+import math
+import threading
+import time
+
+from .fingerprint import state_directory
+
+
+TaskStatistics = namedtuple('TaskStatistics', ['task', 'runs', 'mean',
+                                               'stdev'])
+
+
+def task_revision(task):
+    """
+    Get the revision of a task's definition, which changes whenever its
+    steps or dependencies do.
+    """
+
+    definition = {
+        'steps': [list(step) for step in task.steps],
+        'dependencies': list(task.dependencies),
+    }
+
+    return sha256(json.dumps(definition, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class Duration:
+    """
+    Rolling statistics of how long something takes, using Welford's
+    algorithm.
+
+    Once there are ``window`` runs, older runs are given less weight so the
+    statistics follow any trend.
+    """
+
+    window = 20
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, seconds):
+        """Add the duration of a run."""
+
+        if self.count >= self.window:
+            self.m2 *= (self.window - 1) / self.count
+            self.count = self.window - 1
+
+        self.count += 1
+        delta = seconds - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (seconds - self.mean)
+
+    @property
+    def stdev(self):
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(self.m2 / (self.count - 1))
+
+
+class History:
+    """
+    A store of how long tasks and their steps took in the past, kept in a
+    SQLite database.
+
+    Durations are kept for each revision of a task, so changing a task
+    starts its statistics afresh, and only the latest few revisions of each
+    task are kept. New durations are kept in memory until saved.
+
+    The history is only a guide, so if the database cannot be read or
+    written then it is treated as empty.
+
+    Parameters
+    ----------
+    project_path : Path
+        The directory of the project.
+    filename : Path
+        Where the history is stored, defaults to a file in the state
+        directory of the project.
+    """
+
+    revisions = 3
+    """How many revisions of each task to keep durations for."""
+
+    def __init__(self, project_path, filename=None):
+        if filename is None:
+            filename = state_directory(project_path) / 'history.sqlite3'
+
+        self.filename = Path(filename)
+
+        self._lock = threading.Lock()
+        self._tasks = None
+        self._pending = []
+
+    def _connect(self):
+        import sqlite3
+
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+
+        connection = sqlite3.connect(str(self.filename), timeout=5)
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS durations ('
+            ' task TEXT, revision TEXT, step INTEGER,'
+            ' count INTEGER, mean REAL, m2 REAL, updated REAL,'
+            ' PRIMARY KEY (task, revision, step))'
+        )
+
+        return connection
+
+    def _load(self):
+        # mapping task name to a list of (revision, updated, duration), the
+        # most recently updated first
+        if self._tasks is not None:
+            return
+
+        import sqlite3
+
+        self._tasks = {}
+
+        try:
+            with closing(self._connect()) as connection:
+                rows = connection.execute(
+                    'SELECT task, revision, updated, count, mean, m2'
+                    ' FROM durations WHERE step = -1 ORDER BY updated DESC'
+                ).fetchall()
+        except (OSError, sqlite3.Error):
+            return
+
+        for task, revision, updated, *duration in rows:
+            self._tasks.setdefault(task, []).append(
+                (revision, updated, Duration(*duration))
+            )
+
+    def estimate(self, task):
+        """
+        Estimate how long a task will take, from the latest revision of it
+        that has been run.
+
+        Returns
+        -------
+        float
+            The estimate in seconds, or ``None`` if it has never been run.
+        """
+
+        with self._lock:
+            self._load()
+            revisions = self._tasks.get(task.name)
+
+        if not revisions:
+            return None
+
+        revision = task_revision(task)
+
+        for candidate, updated, duration in revisions:
+            if candidate == revision:
+                return duration.mean
+
+        return revisions[0][2].mean
+
+    def record(self, task, step, seconds):
+        """
+        Record how long a task, or one of its steps, took to run.
+
+        Parameters
+        ----------
+        task : Task
+            The task that was run.
+        step : int
+            The index of the step, or ``None`` for the whole task.
+        seconds : float
+            How long it took.
+        """
+
+        with self._lock:
+            self._pending.append((task, -1 if step is None else step, seconds))
+
+    def save(self):
+        """Write the recorded durations to disk."""
+
+        import sqlite3
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._tasks = None
+
+        if not pending:
+            return
+
+        now = time.time()
+
+        try:
+            with closing(self._connect()) as connection, connection:
+                self._save(connection, pending, now)
+        except (OSError, sqlite3.Error):
+            pass
+
+    def _save(self, connection, pending, now):
+        revisions = {}
+
+        for task, step, seconds in pending:
+            revision = revisions.get(task.name)
+            if revision is None:
+                revision = revisions[task.name] = task_revision(task)
+
+            key = (task.name, revision, step)
+
+            row = connection.execute(
+                'SELECT count, mean, m2 FROM durations'
+                ' WHERE task = ? AND revision = ? AND step = ?', key
+            ).fetchone()
+
+            duration = Duration(*row) if row else Duration()
+            duration.add(seconds)
+
+            connection.execute(
+                'INSERT OR REPLACE INTO durations VALUES (?, ?, ?, ?, ?, ?, ?)',
+                key + (duration.count, duration.mean, duration.m2, now)
+            )
+
+        for name in revisions:
+            connection.execute(
+                'DELETE FROM durations WHERE task = ? AND revision NOT IN ('
+                ' SELECT revision FROM durations WHERE task = ?'
+                ' GROUP BY revision ORDER BY MAX(updated) DESC LIMIT ?)',
+                (name, name, self.revisions)
+            )
+
+    def statistics(self):
+        """
+        Get the statistics of the latest revision of every task that has
+        been run.
+
+        Returns
+        -------
+        list
+            A list of ``TaskStatistics``.
+        """
+
+        with self._lock:
+            self._load()
+            tasks = self._tasks
+
+        return [
+            TaskStatistics(name, duration.count, duration.mean, duration.stdev)
+            for name, ((revision, updated, duration), *_) in tasks.items()
+        ]
@@ -0,0 +1,393 @@
+"""
+Contains the run logs, which keep the events of past runs so that their
+output can be searched afterwards.
+
+Events are kept in blocks, each holding the events from one step of one
+task. Blocks are written together as frames, a compressed JSON list of
+blocks, each a list of events as their name and their fields. Frames are
+appended to segment files in ``.mo/logs``, and each segment has an index
+beside it recording the byte offset of every frame along with the run, task
+and step of each of its blocks, so reading the logs of a task only
+decompresses the frames holding its blocks, and skips segments which have
+none. Segments are memory mapped when read, and once they and their indexes
+grow past a limit the oldest are removed.
+"""
+
+from collections import namedtuple
+from collections.abc import Iterable, Mapping
+from enum import Enum
+from pathlib import Path
+import json
+import time
+
+from . import events
+from .events import decode
+from .fingerprint import state_directory
+
+
+LogEntry = namedtuple('LogEntry', ['run', 'task', 'step', 'segment',
+                                   'offset', 'length', 'block'])
+"""Where a block is, in the frame of ``length`` bytes at ``offset`` in the
+segment and at position ``block`` within it."""
+
+
+def logs_directory(project_path):
+    """Get the directory the logs of a project are kept in."""
+
+    return state_directory(project_path) / 'logs'
+
+
+def _segment_path(directory, segment):
+    return directory / f'{segment:08d}.log'
+
+
+def _index_path(directory, segment):
+    return directory / f'{segment:08d}.idx'
+
+
+def _segments(directory):
+    # the numbers of the segments, oldest first
+    return sorted(
+        int(path.stem) for path in directory.glob('*.log')
+        if path.stem.isdigit()
+    )
+
+
+def read_index(directory):
+    """
+    Read the index of the logs in a directory.
+
+    Returns
+    -------
+    list
+        A ``LogEntry`` for every block, in the order they were written.
+    """
+
+    entries = []
+
+    for segment in _segments(directory):
+        entries.extend(_read_segment_index(directory, segment))
+
+    return entries
+
+
+def _read_segment_index(directory, segment, task=None):
+    # each line of a segment's index is a frame, as its run, offset, length
+    # and the task and step of each of its blocks
+    try:
+        with open(_index_path(directory, segment), 'rb') as file:
+            data = file.read()
+    except OSError:
+        return []
+
+    # the task's name appears in every line with one of its blocks, so lines,
+    # and whole segments, without it are skipped without being parsed
+    needle = None if task is None else json.dumps(task).encode()
+    if needle is not None and needle not in data:
+        return []
+
+    entries = []
+
+    for line in data.splitlines():
+        if needle is not None and needle not in line:
+            continue
+
+        # a line may be cut short if a run was killed while writing it
+        try:
+            run, offset, length, blocks = json.loads(line)
+            for block, (name, step) in enumerate(blocks):
+                if task is None or name == task:
+                    entries.append(LogEntry(run, name, step, segment, offset,
+                                            length, block))
+        except (ValueError, TypeError):
+            continue
+
+    return entries
+
+
+def _encode(obj):
+    # named tuples, such as events, are written as lists of their fields by
+    # the JSON encoder itself, which is much quicker than serialising them
+    # first, so only what it can't write is turned into something it can
+    if isinstance(obj, bytes):
+        return decode(obj)
+    elif isinstance(obj, Enum):
+        return obj.value
+    elif isinstance(obj, Mapping):
+        return dict(obj)
+    elif isinstance(obj, Iterable):
+        return list(obj)
+
+    return str(obj)
+
+
+_encoder = json.JSONEncoder(separators=(',', ':'), default=_encode)
+
+
+class RunLog:
+    """
+    Writes the events of a run to the logs.
+
+    Events are buffered for each step of each task, and a block is finished
+    when a task moves on to its next step or the buffer reaches
+    ``block_size`` bytes. Finished blocks are compressed and written together
+    as a frame, once they add up to ``block_size`` bytes or the log is
+    closed, so a run with many short steps doesn't compress or touch the disk
+    for each. A new segment is started once the current one reaches
+    ``segment_size`` bytes, and the oldest segments are removed while they,
+    with their indexes, take up more than ``max_size`` bytes.
+
+    The logs are only a record, so if they cannot be written then events are
+    simply not logged.
+
+    Parameters
+    ----------
+    project_path : Path
+        The directory of the project.
+    directory : Path
+        Where the logs are kept, defaults to the logs directory of the
+        project.
+    """
+
+    block_size = 64 * 1024
+
+    segment_size = 4 * 1024 * 1024
+
+    max_size = 64 * 1024 * 1024
+
+    ignored = frozenset({events.LoggedOutput.tag})
+    """The types of event which aren't logged, to not log the logs."""
+
+    def __init__(self, project_path, directory=None):
+        if directory is None:
+            directory = logs_directory(project_path)
+
+        self.directory = Path(directory)
+        self.run = time.time()
+
+        self._blocks = {}
+        self._sizes = {}
+        self._finished = []
+        self._finished_size = 0
+        self._steps = {}
+        self._failed = False
+
+    def write(self, event):
+        """Log an event."""
+
+        if self._failed or event.tag in self.ignored:
+            return
+
+        task = event.task
+
+        if event.tag == events.RunningStep.tag and task is not None:
+            step = self._steps.get(task)
+            self._finish((task, step))
+            self._steps[task] = 0 if step is None else step + 1
+
+        key = (task, self._steps.get(task))
+
+        # roughly, as events are only encoded once their block is finished
+        size = 64
+        if event.tag == events.CommandOutput.tag:
+            size += len(event.output)
+
+        self._blocks.setdefault(key, []).append((event.name, event))
+        self._sizes[key] = self._sizes.get(key, 0) + size
+
+        if self._sizes[key] >= self.block_size:
+            self._finish(key)
+
+    def close(self):
+        """Write any buffered events."""
+
+        for key in list(self._blocks):
+            self._finish(key)
+
+        self._write()
+
+    def _finish(self, key):
+        block = self._blocks.pop(key, None)
+        size = self._sizes.pop(key, 0)
+
+        if not block:
+            return
+
+        self._finished.append((key, block))
+        self._finished_size += size
+
+        if self._finished_size >= self.block_size:
+            self._write()
+
+    def _write(self):
+        import zlib
+
+        finished, self._finished = self._finished, []
+        self._finished_size = 0
+
+        if not finished or self._failed:
+            return
+
+        keys = [key for key, block in finished]
+        frame = _encoder.encode([block for key, block in finished])
+
+        try:
+            self._append(keys, zlib.compress(frame.encode()))
+        except OSError:
+            self._failed = True
+
+    def _append(self, keys, frame):
+        import fcntl
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # other runs of the project may be writing to the logs too
+        with open(self.directory / 'lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            segments = _segments(self.directory) or [1]
+            segment = segments[-1]
+            path = _segment_path(self.directory, segment)
+
+            try:
+                size = path.stat().st_size
+            except FileNotFoundError:
+                size = 0
+
+            if size and size + len(frame) > self.segment_size:
+                segment += 1
+                segments.append(segment)
+                path = _segment_path(self.directory, segment)
+                self._prune(segments)
+                size = 0
+
+            with open(path, 'ab') as file:
+                file.write(frame)
+
+            line = json.dumps([self.run, size, len(frame), keys])
+
+            with open(_index_path(self.directory, segment), 'a') as file:
+                file.write(line + '\n')
+
+    def _prune(self, segments):
+        # remove the oldest segments, never the newest, with their indexes,
+        # while they are too big
+        paths = {
+            segment: (_segment_path(self.directory, segment),
+                      _index_path(self.directory, segment))
+            for segment in segments
+        }
+
+        sizes = {}
+        for segment in segments:
+            sizes[segment] = 0
+            for path in paths[segment]:
+                try:
+                    sizes[segment] += path.stat().st_size
+                except FileNotFoundError:
+                    pass
+
+        total = sum(sizes.values()) + self.segment_size
+
+        for segment in segments[:-1]:
+            if total <= self.max_size:
+                break
+
+            for path in paths[segment]:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+            total -= sizes[segment]
+
+
+def search(project_path, task=None, pattern=None, directory=None):
+    """
+    Search the logs for the output of commands.
+
+    Only the frames holding blocks of the task are decompressed, read from
+    memory mapped segments, and segments without any are skipped.
+
+    Parameters
+    ----------
+    project_path : Path
+        The directory of the project.
+    task : str
+        The name of the task to search the output of, or ``None`` for every
+        task.
+    pattern : str
+        A regular expression lines of output should match, or ``None`` for
+        every line.
+    directory : Path
+        Where the logs are kept, defaults to the logs directory of the
+        project.
+
+    Yields
+    ------
+    tuple
+        The ``LogEntry`` of the block, the pipe and the line of output.
+
+    Raises
+    ------
+    re.error
+        If the pattern is not a valid regular expression.
+    """
+
+    import mmap
+    import re
+
+    if directory is None:
+        directory = logs_directory(project_path)
+
+    directory = Path(directory)
+    regex = re.compile(pattern) if pattern else None
+
+    for segment in _segments(directory):
+        entries = _read_segment_index(directory, segment, task)
+        if not entries:
+            continue
+
+        try:
+            with open(_segment_path(directory, segment), 'rb') as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # removed since its index was read, or empty
+            continue
+
+        try:
+            yield from _search_segment(data, entries, regex)
+        finally:
+            data.close()
+
+
+def _search_segment(data, entries, regex):
+    import zlib
+
+    # the blocks of a frame are next to each other in the index, so only the
+    # last frame is kept
+    frame_key = frame = None
+
+    for entry in entries:
+        if frame_key != entry.offset:
+            frame_key = entry.offset
+            frame = None
+
+            end = entry.offset + entry.length
+
+            if end <= len(data):
+                try:
+                    frame = json.loads(zlib.decompress(data[entry.offset:end]))
+                except (zlib.error, ValueError):
+                    pass
+
+        if frame is None or entry.block >= len(frame):
+            continue
+
+        for name, fields in frame[entry.block]:
+            if name != events.CommandOutput.name:
+                continue
+
+            pipe, output = fields[:2]
+            if regex is None or regex.search(output):
+                yield entry, pipe, output
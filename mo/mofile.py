@@ -1,54 +1,432 @@
 """Utilities for working with M-O task files."""
 
-from pathlib import Path
+from hashlib import sha256
+from pathlib import Path, PurePosixPath
 import json
+import os
 
-import toml
-import yaml
-
-from .project import Project
+from . import __version__
+from .fingerprint import state_directory
+from .project import (InvalidProjectError, InvalidTaskError, Project,
+                      TaskCollection)
 
 
 class InvalidMofileFormat(ValueError):
     pass
 
 
+class IncludeError(InvalidMofileFormat):
+    """An included task file cannot be loaded."""
+
+    pass
+
+
+# the parsers are imported when first used, as importing them is a large part
+# of the start up time and most task files only ever need one of them
+
+
+def _load_yaml(data):
+    import yaml
+
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+    try:
+        return yaml.load(data, Loader=loader)
+    except yaml.YAMLError as e:
+        raise InvalidMofileFormat(f'Unable to load task file: {e}')
+
+
+def _load_json(data):
+    try:
+        return json.loads(data)
+    except json.JSONDecodeError as e:
+        raise InvalidMofileFormat(f'Unable to load task file: {e}')
+
+
+def _load_toml(data):
+    import toml
+
+    try:
+        return toml.loads(data)
+    except toml.TomlDecodeError as e:
+        raise InvalidMofileFormat(f'Unable to load task file: {e}')
+
+
 formats = {
-    'yaml': (yaml.safe_load, yaml.YAMLError),
-    'json': (json.loads, json.JSONDecodeError),
-    'toml': (toml.loads, toml.TomlDecodeError),
+    'yaml': _load_yaml,
+    'json': _load_json,
+    'toml': _load_toml,
+}
+
+extensions = {
+    '.yaml': 'yaml',
+    '.yml': 'yaml',
+    '.json': 'json',
+    '.toml': 'toml',
 }
 
 
 def _load_autodetect(data):
-    for loader, error_class in formats.values():
+    for loader in formats.values():
         try:
             return loader(data)
-        except error_class:
+        except InvalidMofileFormat:
             pass
     else:
         raise InvalidMofileFormat('Cannot detect file format.')
 
 
-def load(filename: str, format: str = None):
-    """Load a task file and get a ``Project`` back."""
+def _cache_filename(path):
+    return state_directory(path.parent) / 'cache' / f'{path.name}.json'
 
-    path = Path(filename).resolve()
 
-    with path.open() as file:
-        data = file.read()
+def _config_cache_filename(root, path):
+    # every file's config is cached in the state directory of the root file
+    digest = sha256(str(path).encode()).hexdigest()[:16]
+    return (state_directory(root.parent) / 'cache' / 'configs' /
+            f'{path.name}-{digest}.json')
+
+
+def _cache_key(path, stat, digest, format):
+    return [__version__, str(path), stat.st_mtime_ns, stat.st_size, digest,
+            format]
+
+
+def _stat_key(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [str(path), stat.st_mtime_ns, stat.st_size]
+
+
+def _is_plain(value):
+    # whether a value is only made of what JSON can hold, so it is cached as
+    # it is rather than changed by being written
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return True
+    elif isinstance(value, list):
+        return all(_is_plain(item) for item in value)
+    elif isinstance(value, dict):
+        return all(isinstance(k, str) and _is_plain(v)
+                   for k, v in value.items())
+    return False
+
+
+# caches are JSON, so a cache written by someone else can't run any code, as
+# its key on the first line and its value on the second, which is only
+# decoded if the key matches
+
+
+def _read_cache(filename, key):
+    try:
+        with filename.open('rb') as file:
+            if file.readline().rstrip(b'\n') != json.dumps(key).encode():
+                return None
+            return json.loads(file.readline())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(filename, key, value):
+    if not _is_plain(value):
+        return
+
+    temporary = filename.with_suffix('.tmp')
+
+    try:
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        with temporary.open('w') as file:
+            file.write(json.dumps(key) + '\n' + json.dumps(value) + '\n')
+        os.replace(temporary, filename)
+    except OSError:
+        pass
+
+
+def _read_config_cache(filename, key):
+    config = _read_cache(filename, key)
+    return config if isinstance(config, dict) else None
+
+
+def _read_project_cache(path, key):
+    # the project is only valid if none of the included files have changed
+    cached = _read_cache(_cache_filename(path), ['project', key])
+
+    try:
+        included, config = cached
+
+        for stat_key in included:
+            if _stat_key(stat_key[0]) != stat_key:
+                return None
+
+        project = Project(config, path.parent)
+    except (InvalidProjectError, AttributeError, TypeError, ValueError):
+        return None
+
+    project.files = [path] + [Path(p) for p, *_ in included]
+    return project
+
+
+def parse(data: str, format: str = None):
+    """
+    Parse the contents of a task file.
+
+    Raises
+    ------
+    InvalidMofileFormat
+        If the contents cannot be parsed.
+    """
 
     if format is None:
-        loader, error_class = _load_autodetect, InvalidMofileFormat
+        loader = _load_autodetect
     else:
         try:
-            loader, error_class = formats[format]
+            loader = formats[format]
         except KeyError:
             raise InvalidMofileFormat(f'Unknown file format: {format}')
 
+    return loader(data)
+
+
+def _read(path):
+    with path.open('rb') as file:
+        stat = os.fstat(file.fileno())
+        return file.read(), stat
+
+
+def _join(directory, path):
+    if directory is None:
+        return path
+    elif path is None:
+        return directory
+    return str(PurePosixPath(directory) / path)
+
+
+def _namespace(config, namespace, directory):
+    """
+    Move the tasks from an included task file into a namespace, and make
+    their paths relative to the including file.
+    """
+
+    tasks = {}
+
+    for name, task in (config.get('tasks') or {}).items():
+        if not isinstance(task, dict):
+            raise InvalidTaskError(name, 'is invalid.')
+
+        task = dict(task)
+
+        # the default descriptions are for the task's own name, which is lost
+        # once it is namespaced
+        default = TaskCollection.default_descriptions.get(name)
+        if default is not None:
+            task.setdefault('description', default)
+
+        dependencies = task.get('after', [])
+        if isinstance(dependencies, str):
+            dependencies = [dependencies]
+        task['after'] = [f'{namespace}:{d}' for d in dependencies]
+
+        for key in ('inputs', 'outputs'):
+            globs = task.get(key, [])
+            if isinstance(globs, str):
+                globs = [globs]
+            task[key] = [_join(directory, glob) for glob in globs]
+
+        task['directory'] = _join(directory, task.get('directory'))
+
+        tasks[f'{namespace}:{name}'] = task
+
+    return tasks
+
+
+class _Loader:
+    """
+    Loads a task file and everything it includes into a single config.
+
+    The config of each file is cached on its own, so when one file changes
+    only that file is parsed again.
+    """
+
+    def __init__(self, root, cache):
+        self.root = root
+        self.cache = cache
+        self.included = []
+
+    def parse_file(self, path, raw, stat, format):
+        if format is None:
+            format = extensions.get(path.suffix.lower())
+
+        key = ['config', _cache_key(path, stat, sha256(raw).hexdigest(),
+                                    format)]
+        filename = _config_cache_filename(self.root, path)
+
+        if self.cache:
+            config = _read_config_cache(filename, key)
+            if config is not None:
+                return config
+
+        config = parse(raw.decode(), format)
+
+        if not isinstance(config, dict):
+            raise InvalidMofileFormat(f'{path} does not contain a mapping.')
+
+        if self.cache:
+            _write_cache(filename, key, config)
+
+        return config
+
+    def load(self, path, raw, stat, format, including=()):
+        """
+        Load a task file, merging in the files it includes.
+
+        Parameters
+        ----------
+        including : tuple
+            The files including this one, to detect cycles.
+        """
+
+        config = self.parse_file(path, raw, stat, format)
+
+        includes = config.get('include')
+        if not includes:
+            return config
+
+        config = dict(config)
+        tasks = dict(config.get('tasks') or {})
+        variables = {}
+        origins = {name: path for name in tasks}
+
+        for namespace, filename in self._includes(path, includes):
+            included_path = (path.parent / filename).resolve()
+
+            chain = including + (path,)
+            if included_path in chain:
+                cycle = ' -> '.join(str(p) for p in chain + (included_path,))
+                raise IncludeError(f'Include cycle: {cycle}')
+
+            try:
+                included_raw, included_stat = _read(included_path)
+            except FileNotFoundError:
+                raise IncludeError(
+                    f'{path} includes {filename}, which does not exist.'
+                )
+
+            self.included.append(_stat_key(included_path))
+
+            included = self.load(included_path, included_raw, included_stat,
+                                 None, chain)
+
+            directory = os.path.relpath(included_path.parent, path.parent)
+            directory = None if directory == '.' else Path(directory).as_posix()
+
+            for name, task in _namespace(included, namespace,
+                                         directory).items():
+                if name in tasks:
+                    raise IncludeError(
+                        f'Task {name} from {included_path} is already '
+                        f'defined in {origins[name]}.'
+                    )
+
+                tasks[name] = task
+                origins[name] = included_path
+
+            variables.update(included.get('variables') or {})
+
+        # variables in the including file take precedence
+        variables.update(config.get('variables') or {})
+
+        config['tasks'] = tasks
+        config['variables'] = variables
+        del config['include']
+
+        return config
+
+    @staticmethod
+    def _includes(path, includes):
+        # yields (namespace, filename), includes are either a list of files,
+        # namespaced by their directory, or a mapping of namespace to file
+        if isinstance(includes, str):
+            includes = [includes]
+
+        if isinstance(includes, list):
+            files, includes = includes, {}
+
+            for filename in files:
+                if not isinstance(filename, str):
+                    raise IncludeError(f'{path} has an invalid include.')
+
+                namespace = Path(os.path.abspath(path.parent / filename))
+                namespace = namespace.parent.name
+
+                if namespace in includes:
+                    raise IncludeError(
+                        f'{path} includes {includes[namespace]} and '
+                        f'{filename}, which are both named {namespace}, '
+                        f'use a mapping to name them.'
+                    )
+
+                includes[namespace] = filename
+
+        if not isinstance(includes, dict):
+            raise IncludeError(f'{path} has an invalid include.')
+
+        for namespace, filename in includes.items():
+            if not namespace or ':' in namespace:
+                raise IncludeError(
+                    f'{path} has an invalid include namespace: {namespace!r}'
+                )
+            if not isinstance(filename, str):
+                raise IncludeError(f'{path} has an invalid include.')
+
+            yield namespace, filename
+
+
+def load(filename: str, format: str = None, cache: bool = True):
+    """
+    Load a task file and get a ``Project`` back.
+
+    If no format is given, it is guessed from the file extension, falling back
+    to trying each format in turn. Loaded projects are cached in the state
+    directory, keyed on the path, modification time and contents of the file.
+
+    Other task files can be included, and their tasks are named after the
+    namespace they are included under, like ``namespace:task``. Each file is
+    also cached on its own, so changing one included file only parses that
+    file again.
+
+    Raises
+    ------
+    InvalidMofileFormat
+        If a task file cannot be parsed, or the includes are invalid.
+    """
+
+    path = Path(filename).resolve()
+
+    raw, stat = _read(path)
+
+    if format is None:
+        format = extensions.get(path.suffix.lower())
+
+    key = _cache_key(path, stat, sha256(raw).hexdigest(), format)
+
+    if cache:
+        project = _read_project_cache(path, key)
+        if project is not None:
+            return project
+
+    loader = _Loader(path, cache)
+
     try:
-        config = loader(data)
-    except error_class as e:
-        raise InvalidMofileFormat(f'Unable to load task file: {e}')
+        config = loader.load(path, raw, stat, format)
+    except InvalidTaskError as e:
+        raise IncludeError(f'Invalid included task: {e}')
+
+    project = Project(config, path.parent)
+    project.files = [path] + [Path(p) for p, *_ in loader.included]
+
+    if cache:
+        _write_cache(_cache_filename(path), ['project', key],
+                     [loader.included, config])
 
-    return Project(config, path.parent)
+    return project
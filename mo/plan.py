@@ -0,0 +1,219 @@
+"""
+Contains the compiler, which works out how to run some tasks before any of
+them are run.
+"""
+
+from collections import OrderedDict, namedtuple
+
+from . import events
+from .project import InvalidStepError, NoSuchTaskError
+from .steps import (StopTask, nested_steps, prepared_steps, registered_steps,
+                    templated_steps)
+
+
+PlannedTask = namedtuple('PlannedTask', ['name', 'task', 'dependencies',
+                                         'variables', 'steps'])
+"""
+A task ready to be run, with the names of the tasks it depends on, the
+values of its variables and its steps with their templates filled in.
+"""
+
+
+def resolve_variables(project, task, values):
+    """
+    Resolve task variables based on input variables and the default values.
+
+    Raises
+    ------
+    LookupError
+        If a variable is missing.
+    """
+
+    variables = {**task.variables, **project.variables}
+
+    resolved = {}
+
+    for variable in variables.values():
+        value = values.get(variable.name) or variable.default
+        if value is None:
+            raise LookupError(variable)
+        resolved[variable.name] = value
+
+    return resolved
+
+
+class Compiler:
+    """
+    A compiler turns the names of some tasks into a plan for running them
+    and their dependencies, checking everything which can be checked before
+    anything is run.
+
+    Variables are resolved once for each task, templates are filled in,
+    step types are checked and dependency cycles are found. Every problem is
+    reported, rather than only the first.
+
+    Parameters
+    ----------
+    project : Project
+        The project to run tasks from.
+    variables : dict
+        Mapping variable name to the value.
+    skip : list
+        The names of tasks which have already been run, so are skipped.
+    """
+
+    def __init__(self, project, variables, skip=()):
+        self.project = project
+        self.variables = variables
+        self.skip = skip
+
+        self.failed = False
+
+    def compile(self, names):
+        """
+        Compile a plan for running some tasks.
+
+        Yields
+        ------
+        Event
+            Events for the tasks found, and any problems.
+
+        Returns
+        -------
+        OrderedDict
+            Mapping task name to ``PlannedTask``, in an order where every task
+            comes after its dependencies.
+
+        Raises
+        ------
+        StopTask
+            If there are any problems with the tasks.
+        """
+
+        plan = OrderedDict()
+
+        for name in names:
+            yield from self._add(name, plan, [])
+
+        if self.failed:
+            raise StopTask
+
+        return plan
+
+    def _fail(self, event):
+        self.failed = True
+        return event
+
+    def _add(self, name, plan, path):
+        # add a task and, depth first, its dependencies, path is the tasks
+        # being added which led to this one
+        if name in plan:
+            return
+
+        if name in path:
+            cycle = path[path.index(name):] + [name]
+            yield self._fail(events.dependency_cycle(cycle))
+            return
+
+        if name in self.skip:
+            yield events.skipping_task(name)
+            return
+
+        yield events.finding_task(name)
+
+        try:
+            task = self.project.find_task(name)
+        except NoSuchTaskError as e:
+            yield self._fail(events.task_not_found(name, e.similarities))
+            return
+
+        if task.name != name:
+            yield from self._add(task.name, plan, path)
+            return
+
+        yield events.starting_task(task)
+
+        path.append(name)
+
+        dependencies = []
+        for dependency in task.dependencies:
+            yield from self._add(dependency, plan, path)
+
+            try:
+                dependency = self.project.find_task(dependency).name
+            except NoSuchTaskError:
+                continue
+
+            if dependency in plan:
+                dependencies.append(dependency)
+
+        path.pop()
+
+        planned = yield from self._compile_task(task, dependencies)
+        plan[name] = planned
+
+    def _compile_task(self, task, dependencies):
+        variables = {}
+
+        # a task with nothing to run never needs its variables
+        if task.steps or task.inputs:
+            try:
+                variables = resolve_variables(self.project, task,
+                                              self.variables)
+            except LookupError as e:
+                yield self._fail(events.undefined_variable(e.args[0]))
+                variables = None
+
+        steps = yield from self.compile_steps(task.steps, variables)
+
+        return PlannedTask(task.name, task, dependencies, variables, steps)
+
+    def compile_steps(self, steps, variables):
+        """
+        Compile some steps, filling in their templates from the variables.
+
+        Yields
+        ------
+        Event
+            Any problems with the steps, which also mark the compiler as
+            ``failed``.
+
+        Returns
+        -------
+        list
+            The compiled steps.
+        """
+
+        compiled = []
+
+        for step in steps:
+            if step.type not in registered_steps:
+                yield self._fail(events.unknown_step_type(step))
+                continue
+
+            if step.type in nested_steps:
+                try:
+                    args = nested_steps[step.type](step.args)
+                except InvalidStepError as e:
+                    yield self._fail(events.invalid_step(step, str(e)))
+                    continue
+
+                inner = yield from self.compile_steps(args.steps, variables)
+                step = step._replace(args=args._replace(steps=inner))
+            elif step.type in templated_steps and variables is not None:
+                try:
+                    step = step._replace(args=step.args.format(**variables))
+                except KeyError as e:
+                    reason = f'Undefined variable: {e.args[0]}'
+                    yield self._fail(events.invalid_step(step, reason))
+                    continue
+                except (IndexError, ValueError, AttributeError) as e:
+                    yield self._fail(events.invalid_step(step, str(e)))
+                    continue
+
+            if step.type in prepared_steps and variables is not None:
+                step = step._replace(args=prepared_steps[step.type](step.args))
+
+            compiled.append(step)
+
+        return compiled
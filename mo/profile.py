@@ -0,0 +1,95 @@
+"""Utilities for timing tasks and steps."""
+
+from collections import namedtuple
+import time
+
+from .steps import StopTask
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# the CPU time of the current thread, where the platform can measure it,
+# otherwise of the whole process
+_cpu_time = getattr(time, 'thread_time', time.process_time)
+
+
+Timing = namedtuple('Timing', ['start', 'wall', 'cpu', 'children_user',
+                               'children_system'])
+"""
+How long something took to run.
+
+``start`` is when it started, as seconds since the epoch. ``wall`` is the
+elapsed time, ``cpu`` the time spent on the CPU by the thread running it, and
+``children_user`` and ``children_system`` the CPU time of the commands it ran,
+all in seconds.
+"""
+
+
+def _children_usage():
+    if resource is None:
+        return 0.0, 0.0
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime, usage.ru_stime
+
+
+class Stopwatch:
+    """
+    A stopwatch measures the time taken from when it is created until it is
+    stopped.
+
+    The time taken by commands is measured from the resources used by every
+    child process which has finished, so when tasks run concurrently a
+    command's time is counted towards any task running when it finished.
+    """
+
+    def __init__(self):
+        self.start = time.time()
+
+        self._wall = time.perf_counter()
+        self._cpu = _cpu_time()
+        self._children = _children_usage()
+
+    def stop(self):
+        """Stop the stopwatch, returning the timing."""
+
+        wall = time.perf_counter() - self._wall
+        cpu = _cpu_time() - self._cpu
+        user, system = _children_usage()
+
+        return Timing(self.start, wall, cpu, user - self._children[0],
+                      system - self._children[1])
+
+
+def timed(stream, timing_event):
+    """
+    Time a stream of events, yielding a timing event once it is finished,
+    even if it stopped its task.
+
+    Parameters
+    ----------
+    stream : iterable
+        The events to time.
+    timing_event : callable
+        Called with the timing, returns the event to yield.
+
+    Returns
+    -------
+    tuple
+        What the stream returned, and the timing.
+    """
+
+    stopwatch = Stopwatch()
+
+    try:
+        result = yield from stream
+    except StopTask:
+        yield timing_event(stopwatch.stop())
+        raise
+
+    timing = stopwatch.stop()
+    yield timing_event(timing)
+
+    return result, timing
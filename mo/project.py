@@ -1,7 +1,6 @@
 """Utilities for working with projects."""
 
-from collections import namedtuple, UserDict, UserList
-from difflib import SequenceMatcher
+from collections import Counter, defaultdict, namedtuple, UserDict, UserList
 
 
 class InvalidProjectError(ValueError):
@@ -53,7 +52,9 @@ class Variable(_Variable):
 
 
 Task = namedtuple('Task', ['name', 'description', 'variables', 'steps',
-                  'dependencies'])
+                  'dependencies', 'inputs', 'outputs', 'directory',
+                  'shell'])
+Task.__new__.__defaults__ = ((), (), None, None)
 
 Step = namedtuple('Step', ['type', 'args'])
 
@@ -193,12 +194,134 @@ class TaskCollection(UserDict):
 
         dependencies = config.get('after', [])
 
-        return Task(name, description, variables, steps, dependencies)
+        inputs = TaskCollection._load_globs_from_config(name, 'inputs', config)
+        outputs = TaskCollection._load_globs_from_config(name, 'outputs', config)
+
+        directory = config.get('directory')
+        if directory is not None and not isinstance(directory, str):
+            raise InvalidTaskError(name, 'has an invalid directory.')
+
+        shell = config.get('shell')
+        if shell not in (None, 'persistent'):
+            raise InvalidTaskError(name, 'has an invalid shell.')
+
+        return Task(name, description, variables, steps, dependencies,
+                    inputs, outputs, directory, shell)
+
+    @staticmethod
+    def _load_globs_from_config(name, key, config):
+        globs = config.get(key, [])
+
+        if isinstance(globs, str):
+            globs = [globs]
+
+        if not all(isinstance(glob, str) for glob in globs):
+            raise InvalidTaskError(name, f'has invalid {key}.')
+
+        return globs
 
     def __str__(self):
         return ', '.join(self.keys())
 
 
+class TaskIndex:
+    """
+    An index of task names, for finding tasks with similar names.
+
+    The candidates are narrowed down before any similarity ratios are
+    calculated, using a bound on their length and the q-gram lemma over
+    bigrams. Neither can reject a name which is similar enough, so the index
+    finds exactly the same tasks as comparing against every task would.
+
+    Parameters
+    ----------
+    names : iterable
+        The names of the tasks to index.
+    """
+
+    # a ratio of at least 3/4
+    threshold = 0.75
+
+    def __init__(self, names):
+        self.names = list(names)
+
+        self.by_length = defaultdict(list)
+        self.postings = defaultdict(list)
+
+        for i, name in enumerate(self.names):
+            self.by_length[len(name)].append(i)
+            for bigram, count in self._bigrams(name).items():
+                self.postings[bigram].append((i, count))
+
+    @staticmethod
+    def _bigrams(name):
+        padded = f'\0{name}\0'
+        return Counter(padded[i:i + 2] for i in range(len(padded) - 1))
+
+    @staticmethod
+    def _min_shared_bigrams(a, b):
+        # the ratio is 2M / T, where M is the number of matching characters,
+        # so M >= 3T / 8 and the edit distance is at most T - 2M; each edit
+        # destroys at most two of the max(a, b) + 1 padded bigrams
+        total = a + b
+        matches = -(-3 * total // 8)
+        edits = total - 2 * matches
+        return max(a, b) + 1 - 2 * edits
+
+    def candidates(self, name):
+        """Find the indices of the names which might be similar enough."""
+
+        shared = defaultdict(int)
+
+        for bigram, count in self._bigrams(name).items():
+            for i, other_count in self.postings.get(bigram, ()):
+                shared[i] += min(count, other_count)
+
+        candidates = []
+
+        for length, indices in self.by_length.items():
+            total = len(name) + length
+
+            # the ratio can be no more than 2 * min(a, b) / (a + b)
+            if 8 * min(len(name), length) < 3 * total:
+                continue
+
+            minimum = self._min_shared_bigrams(len(name), length)
+
+            if minimum <= 0:
+                candidates.extend(indices)
+            else:
+                candidates.extend(i for i in indices if shared[i] >= minimum)
+
+        return sorted(candidates)
+
+    def search(self, name):
+        """
+        Find the names similar to a name.
+
+        Returns
+        -------
+        list
+            The similar names, in the order they were indexed.
+        """
+
+        from difflib import SequenceMatcher
+
+        matcher = SequenceMatcher()
+        matcher.set_seq1(name)
+
+        similar = []
+
+        for i in self.candidates(name):
+            matcher.set_seq2(self.names[i])
+            if (matcher.real_quick_ratio() >= self.threshold and
+                    matcher.quick_ratio() >= self.threshold and
+                    matcher.ratio() >= self.threshold):
+                similar.append(self.names[i])
+
+        return similar
+
+
 class Project:
     """
     A project contains variables and tasks.
@@ -214,6 +337,9 @@ class Project:
         self.config = config
         self.path = path
 
+        # the task files the project was loaded from, set when loaded
+        self.files = []
+
         try:
             self.name = config['name']
         except KeyError:
@@ -227,6 +353,14 @@ class Project:
 
         self.tasks['help'] = self._create_help_task()
 
+        if 'stats' not in self.tasks:
+            self.tasks['stats'] = self._create_stats_task()
+
+        if 'logs' not in self.tasks:
+            self.tasks['logs'] = self._create_logs_task()
+
+        self._index = None
+
     def find_task(self, name):
         """
         Find a task by name.
@@ -250,12 +384,10 @@ class Project:
         except KeyError:
             pass
 
-        similarities = []
+        if self._index is None:
+            self._index = TaskIndex(self.tasks)
 
-        for task_name, task in self.tasks.items():
-            ratio = SequenceMatcher(None, name, task_name).ratio()
-            if ratio >= 0.75:
-                similarities.append(task)
+        similarities = [self.tasks[n] for n in self._index.search(name)]
 
         if len(similarities) == 1:
             return similarities[0]
@@ -273,6 +405,28 @@ class Project:
 
         return Task('help', 'Get help about a task.', variables, steps, [])
 
+    @staticmethod
+    def _create_stats_task():
+        steps = StepCollection()
+        steps.append(Step('stats', None))
+
+        return Task('stats', 'Show the slowest and most variable tasks.',
+                    VariableCollection(), steps, [])
+
+    @staticmethod
+    def _create_logs_task():
+        variables = VariableCollection()
+        variables['task'] = Variable('task', 'Which task to show the logs of.',
+                                     '')
+        variables['grep'] = Variable('grep', 'Only show lines matching this.',
+                                     '')
+
+        steps = StepCollection()
+        steps.append(Step('logs', None))
+
+        return Task('logs', 'Show or search the output of past runs.',
+                    variables, steps, [])
+
     def __str__(self):
         return '{} ({})'.format(self.name, self.tasks)
 
@@ -1,30 +1,159 @@
 """Contains the runner class."""
 
-from . import events
-from .project import NoSuchTaskError, Step
-from .steps import registered_steps
-
-
+from collections import OrderedDict
 
-class StopTask(StopIteration):
-    pass
+from . import events
+from .cache import ArtifactCache, CacheError, cache_key
+from .fingerprint import FingerprintStore
+from .history import History
+from .logs import RunLog
+from .plan import Compiler, resolve_variables
+from .profile import timed
+from .scheduler import Scheduler
+from .steps import StopTask, package_managers, registered_steps, shell_steps
 
 
 class Runner:
-    """A runner takes a project and some variables and runs it."""
-
-    def __init__(self, project, variables):
+    """
+    A runner takes a project and some variables and runs it.
+
+    Parameters
+    ----------
+    project : Project
+        The project to run tasks from.
+    variables : dict
+        Mapping variable name to the value.
+    jobs : int
+        The maximum number of independent tasks to run at once.
+    cache : LocalCache or HttpCache
+        Where to share the outputs of tasks, if anywhere.
+    """
+
+    def __init__(self, project, variables, jobs=1, cache=None):
         self.project = project
         self.variables = variables
+        self.jobs = jobs
+
+        self.fingerprints = FingerprintStore(project.path)
+        self.history = History(project.path)
+
+        self.artifacts = None
+        if cache is not None:
+            self.artifacts = ArtifactCache(cache, self.fingerprints)
 
         self.tasks_run = []
         self.task_queue = []
 
+        self.scheduler = None
+
     def run(self):
-        """Run any queued tasks."""
+        """
+        Run any queued tasks.
+
+        The dependency graph of the queued tasks is built first, then tasks
+        are run as soon as all of their dependencies have finished.
+        """
+
+        yield from self.run_tasks(self.task_queue)
+
+    def run_task(self, name):
+        """Run a task, along with any of its dependencies."""
+
+        yield from self.run_tasks([name])
+
+    def run_tasks(self, names):
+        """
+        Run some tasks, along with any of their dependencies, writing every
+        event to the logs.
+
+        Which packages are installed is listed again in each run, as they
+        may have changed since the last, such as between runs when watching.
+        """
+
+        for manager in package_managers.values():
+            manager.forget()
+
+        log = RunLog(self.project.path)
+        stream = self._run_tasks(names)
+
+        try:
+            for event in stream:
+                log.write(event)
+                yield event
+        finally:
+            stream.close()
+            log.close()
+
+    def _run_tasks(self, names):
+        try:
+            plan = yield from self.compile(names)
+        except StopTask:
+            return
+
+        graph = OrderedDict(
+            (name, (planned.task, planned.dependencies))
+            for name, planned in plan.items()
+        )
+
+        estimates = {
+            name: self.history.estimate(task)
+            for name, (task, dependencies) in graph.items()
+        }
+
+        yield events.scheduled(estimates, self.jobs)
+
+        scheduler = self.scheduler = Scheduler(
+            graph, lambda task: self.run_task_steps(plan[task.name]),
+            self.jobs, estimates,
+        )
+
+        try:
+            yield from scheduler.run()
+        finally:
+            self.tasks_run.extend(scheduler.tasks_finished)
+            self.history.save()
+
+    def compile(self, names):
+        """
+        Compile a plan for running some tasks, along with any of their
+        dependencies, skipping tasks which have already been run.
+
+        Returns
+        -------
+        OrderedDict
+            Mapping task name to ``PlannedTask``.
+
+        Raises
+        ------
+        StopTask
+            If there are any problems with the tasks.
+        """
+
+        compiler = Compiler(self.project, self.variables, self.tasks_run)
+        return (yield from compiler.compile(names))
+
+    def plan(self, names):
+        """Show the plan for running some tasks, without running them."""
+
+        try:
+            plan = yield from self.compile(names)
+        except StopTask:
+            return
+
+        yield events.plan(list(plan.values()))
+
+    def cancel(self):
+        """
+        Cancel the tasks being run, from another thread, terminating any
+        commands they are running.
+        """
+
+        from .executor import default_executor
+
+        if self.scheduler is not None:
+            self.scheduler.cancel()
 
-        for name in self.task_queue:
-            yield from self.run_task(name)
+        default_executor.terminate_all()
 
     def help(self):
         """Run a help event."""
@@ -52,57 +181,91 @@ class Runner:
             If a variable is missing.
         """
 
-        variables = {**task.variables, **self.project.variables}
+        return resolve_variables(self.project, task, self.variables)
 
-        values = {}
+    def run_task_steps(self, planned):
+        """
+        Run the steps of a planned task, unless its inputs and outputs show it
+        is already up to date.
 
-        for variable in variables.values():
-            value = self.variables.get(variable.name) or variable.default
-            if value is None:
-                raise LookupError(variable)
-            values[variable.name] = value
+        The task and each of its steps are timed, and the durations of those
+        which ran successfully are kept in the history.
+        """
 
-        return values
+        task = planned.task
 
-    def run_task_steps(self, task):
-        for step in task.steps:
-            yield events.running_step(step)
+        ran, timing = yield from timed(
+            self._run_task_steps(planned),
+            lambda timing: events.task_timing(task, timing),
+        )
 
-            try:
-                variables = self.resolve_variables(task)
-            except LookupError as e:
-                yield events.undefined_variable(e.args[0])
-                raise StopTask
+        if ran:
+            self.history.record(task, None, timing.wall)
 
-            try:
-                step_function = registered_steps[step.type]
-            except KeyError:
-                yield events.unknown_step_type(step)
-                raise StopTask
-            else:
-                yield from step_function(self.project, task, step, variables)
+    def _run_task_steps(self, planned):
+        task, variables = planned.task, planned.variables
 
-    def run_task(self, name):
-        """Run a task."""
+        if task.inputs and self.fingerprints.is_up_to_date(task, variables):
+            yield events.up_to_date(task)
+            return False
 
-        if name in self.tasks_run:
-            yield events.skipping_task(name)
-        else:
-            yield events.finding_task(name)
+        key = None
+        if self.artifacts is not None and task.inputs and task.outputs:
+            key = cache_key(self.fingerprints, task, variables, planned.steps)
 
             try:
-                task = self.find_task(name)
-            except NoSuchTaskError as e:
-                yield events.task_not_found(name, e.similarities)
-                raise StopTask
-
-            yield events.starting_task(task)
-
-            for name in task.dependencies:
-                yield from self.run_task(name)
-
-            self.tasks_run.append(name)
+                restored = self.artifacts.restore(key, task)
+            except CacheError as e:
+                yield events.cache_unavailable(str(e))
+                restored = False
+
+            if restored:
+                yield events.restored_from_cache(task)
+                self.fingerprints.update(task, variables)
+                return False
+
+        shell = None
+        if task.shell == 'persistent':
+            from .executor import default_executor
+
+            cwd = None
+            if task.directory is not None:
+                cwd = self.project.path / task.directory
+
+            shell = default_executor.shell(cwd)
+
+        try:
+            for index, step in enumerate(planned.steps):
+                yield events.running_step(step)
+
+                if shell is not None and step.type in shell_steps:
+                    stream = shell_steps[step.type](
+                        shell, self.project, task, step, variables,
+                    )
+                else:
+                    stream = registered_steps[step.type](
+                        self.project, task, step, variables,
+                    )
+
+                _, timing = yield from timed(
+                    stream, lambda timing: events.step_timing(step, timing),
+                )
+
+                self.history.record(task, index, timing.wall)
+        finally:
+            if shell is not None:
+                shell.close()
+
+        if task.inputs:
+            self.fingerprints.update(task, variables)
+
+        if key is not None:
+            try:
+                stored = self.artifacts.store(key, task)
+            except CacheError as e:
+                yield events.cache_unavailable(str(e))
+            else:
+                if stored:
+                    yield events.stored_in_cache(task)
 
-            yield events.running_task(task)
-            yield from self.run_task_steps(task)
-            yield events.finished_task(task)
+        return True
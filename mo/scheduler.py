@@ -0,0 +1,184 @@
+"""Contains the scheduler which runs a graph of tasks."""
+
+from queue import Queue
+import heapq
+
+from . import events
+from .steps import StopTask
+
+
+# the messages worker threads send back over the queue, which the parallel
+# step sends too
+EVENT = 'event'
+FINISHED = 'finished'
+FAILED = 'failed'
+CRASHED = 'crashed'
+
+
+class Scheduler:
+    """
+    A scheduler runs a graph of tasks, running independent tasks concurrently
+    on a bounded pool of worker threads.
+
+    When there is a choice of task to start, the one with the longest
+    estimated path through the tasks that depend on it is started first, so
+    that the slowest chain of tasks isn't left until last.
+
+    Parameters
+    ----------
+    graph : dict
+        Mapping task name to a ``(task, dependencies)`` tuple, where
+        dependencies is a list of task names in the graph. The graph must be
+        in topological order.
+    run_task : callable
+        Called with a task, returns a generator of events for its steps.
+    jobs : int
+        The maximum number of tasks to run at once.
+    estimates : dict
+        Mapping task name to how long it is expected to take in seconds, or
+        ``None`` if unknown.
+    """
+
+    def __init__(self, graph, run_task, jobs=1, estimates=None):
+        self.graph = graph
+        self.run_task = run_task
+        self.jobs = max(1, jobs)
+        self.estimates = estimates or {}
+
+        self.tasks_finished = []
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Cancel the run, from any thread. No more tasks are started, and
+        running tasks are stopped at their next event.
+        """
+
+        self.cancelled = True
+
+    def tag(self, name, events):
+        """Tag each event with the name of the task it came from."""
+
+        for event in events:
+            if self.cancelled:
+                raise StopTask
+            if event.task is None:
+                event = event._replace(task=name)
+            yield event
+
+    def run(self):
+        """Run the graph, yielding events as they happen."""
+
+        if self.jobs == 1:
+            yield from self._run_inline()
+        else:
+            yield from self._run_concurrently()
+
+    def _run_inline(self):
+        for name, (task, dependencies) in self.graph.items():
+            if self.cancelled:
+                return
+
+            yield events.running_task(task)._replace(task=name)
+
+            try:
+                yield from self.tag(name, self.run_task(task))
+            except StopTask:
+                return
+
+            self.tasks_finished.append(name)
+            yield events.finished_task(task)._replace(task=name)
+
+    def _work(self, name, task, queue):
+        try:
+            for event in self.tag(name, self.run_task(task)):
+                queue.put((EVENT, name, event))
+        except StopTask:
+            queue.put((FAILED, name, None))
+        except BaseException as e:
+            queue.put((CRASHED, name, e))
+        else:
+            queue.put((FINISHED, name, None))
+
+    def critical_paths(self, dependents):
+        """
+        Get the estimated length of the longest path from each task through
+        the tasks which depend on it, in seconds.
+        """
+
+        lengths = {}
+
+        for name in reversed(self.graph):
+            longest = max((lengths[d] for d in dependents[name]), default=0)
+            lengths[name] = (self.estimates.get(name) or 0) + longest
+
+        return lengths
+
+    def _run_concurrently(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        waiting_on = {
+            name: set(dependencies)
+            for name, (task, dependencies) in self.graph.items()
+        }
+
+        dependents = {name: [] for name in self.graph}
+        for name, dependencies in waiting_on.items():
+            for dependency in dependencies:
+                dependents[dependency].append(name)
+
+        lengths = self.critical_paths(dependents)
+        order = {name: i for i, name in enumerate(self.graph)}
+
+        def make_ready(name):
+            heapq.heappush(ready, (-lengths[name], order[name], name))
+
+        ready = []
+        for name, dependencies in waiting_on.items():
+            if not dependencies:
+                make_ready(name)
+
+        queue = Queue()
+        running = 0
+        failed = False
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            while ready or running:
+                if self.cancelled:
+                    ready.clear()
+                    if not running:
+                        break
+
+                while ready and running < self.jobs:
+                    name = heapq.heappop(ready)[2]
+                    task = self.graph[name][0]
+                    running += 1
+
+                    yield events.running_task(task)._replace(task=name)
+                    pool.submit(self._work, name, task, queue)
+
+                message, name, payload = queue.get()
+
+                if message == EVENT:
+                    yield payload
+                    continue
+
+                running -= 1
+
+                if message == CRASHED:
+                    raise payload
+                elif message == FAILED:
+                    failed = True
+                    ready.clear()
+                elif message == FINISHED:
+                    self.tasks_finished.append(name)
+                    task = self.graph[name][0]
+                    yield events.finished_task(task)._replace(task=name)
+
+                    if failed:
+                        continue
+
+                    for dependent in dependents[name]:
+                        waiting_on[dependent].discard(name)
+                        if not waiting_on[dependent]:
+                            make_ready(dependent)
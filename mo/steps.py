@@ -1,20 +1,40 @@
 """Contains all the steps available."""
 
-import select
-import shlex
-import subprocess
+from collections import namedtuple
+import re
+import threading
 
 from . import events
+from .project import InvalidStepError, NoSuchTaskError, StepCollection
 
 
-class StopTask(StopIteration):
+class StopTask(Exception):
+    """Raised by a step to stop the task it belongs to."""
+
     pass
 
 
 registered_steps = {}
 
+templated_steps = set()
+"""The types of step whose arguments are a template filled in with the
+task's variables, before the task is run."""
+
+nested_steps = {}
+"""Mapping the types of step which contain other steps to a function parsing
+their arguments, into a named tuple with the contained ``steps``."""
+
+prepared_steps = {}
+"""Mapping the types of step to a function preparing their arguments, once
+any template is filled in, before the task is run."""
 
-def step(func=None, name=None):
+shell_steps = {}
+"""Mapping the types of step which can run in a task's persistent shell to
+the function running them there, which is given the shell first."""
+
+
+def step(func=None, name=None, template=False, nested=None, prepare=None,
+         shell=None):
     def decorator(func):
         nonlocal name
 
@@ -23,6 +43,18 @@ def step(func=None, name=None):
 
         registered_steps[name] = func
 
+        if template:
+            templated_steps.add(name)
+
+        if nested is not None:
+            nested_steps[name] = nested
+
+        if prepare is not None:
+            prepared_steps[name] = prepare
+
+        if shell is not None:
+            shell_steps[name] = shell
+
         return func
 
     if func is None:
@@ -31,52 +63,92 @@ def step(func=None, name=None):
         return decorator(func)
 
 
-def _run_command(command_line):
-    yield events.running_command(command_line)
+class CommandLine(str):
+    """
+    A command line which uses no features of the shell, so can be run
+    without one, along with the arguments it splits into.
+    """
+
+    def __new__(cls, command_line, argv):
+        self = super().__new__(cls, command_line)
+        self.argv = argv
+        return self
 
-    process = subprocess.Popen(
-        command_line, shell=True, universal_newlines=True, bufsize=1,
-        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-    )
 
-    streams = ['stdout', 'stderr']
+# characters which mean something to the shell, other than quotes
+_shell_characters = frozenset('|&;<>()$`\\*?[]{}~#!\n\r')
 
-    def send_line(stream, line):
-        line = line.strip()
-        if line:
-            yield events.command_output(stream, line)
+# words which are only understood by the shell
+_shell_words = frozenset({
+    '.', ':', 'alias', 'break', 'case', 'cd', 'command', 'continue', 'do',
+    'done', 'elif', 'else', 'esac', 'eval', 'exec', 'exit', 'export', 'fi',
+    'for', 'function', 'getopts', 'hash', 'if', 'local', 'read', 'readonly',
+    'return', 'set', 'shift', 'source', 'then', 'times', 'trap', 'type',
+    'ulimit', 'umask', 'unalias', 'unset', 'until', 'wait', 'while',
+})
 
-    def flush_line(fd, stream):
-        if fd == getattr(process, stream).fileno():
-            line = getattr(process, stream).readline()
-            yield from send_line(stream, line)
 
-    while True:
-        reads = [getattr(process, stream).fileno() for stream in streams]
-        ret = select.select(reads, [], [])
+def split_command(command_line):
+    """
+    Split a command line into its arguments, if it can be run without a
+    shell.
 
-        for fd in ret[0]:
-            for stream in streams:
-                flush_line(fd, streams)
+    Returns
+    -------
+    str
+        A ``CommandLine`` if it can be run without a shell, otherwise the
+        command line as it was.
+    """
 
-        if process.poll() != None:
-            break
+    import shlex
 
-    def flush_remaining_lines(stream):
-        for line in getattr(process, stream).readlines():
-            yield from send_line(stream, line)
+    if not _shell_characters.isdisjoint(command_line):
+        return command_line
 
-    for stream in streams:
-        yield from flush_remaining_lines(stream)
+    try:
+        argv = shlex.split(command_line)
+    except ValueError:
+        return command_line
+
+    if not argv or argv[0] in _shell_words or '=' in argv[0]:
+        return command_line
+
+    return CommandLine(command_line, argv)
+
+
+def _run_command(command_line, cwd=None, argv=None, shell=None):
+    from .executor import default_executor
+
+    yield events.running_command(command_line)
+
+    if shell is not None:
+        process = shell.run(command_line)
+    else:
+        process = default_executor.run(command_line, cwd, argv)
+
+    try:
+        for pipe, line in process:
+            line = line.strip()
+            if line:
+                yield events.command_output(pipe, line)
+    finally:
+        if process.returncode is None:
+            process.terminate()
 
     exit_code = process.returncode
 
     if exit_code != 0:
-        command_args = shlex.split(command_line)
+        if argv is None:
+            import shlex
+
+            try:
+                argv = shlex.split(command_line)
+            except ValueError:
+                argv = command_line.split()
 
         common_descriptions = {
             1: f'Details on how the command failed should be available above.',
-            127: f'The command cannot be found.\nPerhaps installing {command_args[0]} would help.'
+            127: f'The command cannot be found.\nPerhaps installing {argv[0]} would help.'
         }
 
         description = common_descriptions.get(exit_code)
@@ -86,10 +158,26 @@ def _run_command(command_line):
         raise StopTask
 
 
-@step
+def _command_in_shell(shell, project, task, step, variables):
+    """Run a command step in the task's persistent shell."""
+
+    yield from _run_command(step.args, shell=shell)
+
+
+@step(template=True, prepare=split_command, shell=_command_in_shell)
 def command(project, task, step, variables):
-    command_line = step.args.format(**variables)
-    yield from _run_command(command_line)
+    """
+    Run a command step, without a shell if the command was split when
+    planned.
+    """
+
+    cwd = None
+    if task.directory is not None:
+        cwd = project.path / task.directory
+
+    argv = getattr(step.args, 'argv', None)
+
+    yield from _run_command(step.args, cwd, argv)
 
 
 @step
@@ -114,16 +202,324 @@ def help(project, task, step, variables):
 
 
 @step
-def brew(project, task, step, variables):
-    package = step.args
+def stats(project, task, step, variables):
+    """Run a stats step, showing the slowest and most variable tasks."""
+
+    from .history import History
+
+    statistics = History(project.path).statistics()
+
+    slowest = sorted(statistics, key=lambda s: s.mean, reverse=True)
+
+    variable = sorted(
+        (s for s in statistics if s.runs > 1 and s.mean > 0),
+        key=lambda s: s.stdev / s.mean, reverse=True,
+    )
+
+    limit = 10
+
+    yield events.statistics(slowest[:limit], variable[:limit])
+
+
+@step
+def logs(project, task, step, variables):
+    """
+    Run a logs step, showing the logged output of past runs, optionally only
+    that of one task or the lines matching a regular expression.
+    """
+
+    from .logs import search
+
+    try:
+        results = search(project.path, variables.get('task') or None,
+                         variables.get('grep') or None)
+
+        for entry, pipe, output in results:
+            yield events.logged_output(entry.run, entry.task, entry.step, pipe,
+                                       output)
+    except re.error as e:
+        yield events.invalid_step(step, f'Invalid pattern: {e}')
+        raise StopTask
+
+
+ParallelSteps = namedtuple('ParallelSteps', ['steps', 'jobs', 'fail_fast'])
+
+
+def parse_parallel(args):
+    """
+    Parse the arguments of a parallel step, which are either a list of steps
+    or a mapping with the ``steps``, and optionally the number of ``jobs`` to
+    run at once and whether to ``fail_fast``.
+
+    Raises
+    ------
+    InvalidStepError
+        If the arguments are malformed.
+    """
+
+    if isinstance(args, list):
+        args = {'steps': args}
+    elif not isinstance(args, dict) or 'steps' not in args:
+        raise InvalidStepError('parallel needs a list of steps.')
+
+    unknown = set(args) - {'steps', 'jobs', 'fail_fast'}
+    if unknown:
+        raise InvalidStepError(f'Unknown options: {", ".join(sorted(unknown))}')
+
+    try:
+        steps = list(StepCollection(args['steps']))
+    except TypeError as e:
+        raise InvalidStepError(str(e))
+
+    jobs = args.get('jobs', len(steps) or 1)
+    if not isinstance(jobs, int) or jobs < 1:
+        raise InvalidStepError('jobs should be a positive number.')
+
+    return ParallelSteps(steps, jobs, bool(args.get('fail_fast', True)))
+
+
+def _label(label, event):
+    # mark which of the steps running at once an event came from
+    if event.tag == events.CommandOutput.tag:
+        output = event.output
+        prefix = label.encode() if isinstance(output, bytes) else label
+        return event._replace(output=prefix + output)
+    elif event.tag in (events.RunningCommand.tag, events.CommandFailed.tag):
+        return event._replace(command=label + event.command)
+
+    return event
+
+
+@step(nested=parse_parallel)
+def parallel(project, task, step, variables):
+    """
+    Run a parallel step, running its steps at the same time, at most
+    ``jobs`` at once and by default all of them.
+
+    Output is labelled with the position of the step it came from. If a step
+    fails, the others are stopped when failing fast, otherwise they are all
+    run and then the task stops.
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+    from queue import Queue
+
+    from .executor import default_executor
+    from .scheduler import CRASHED, EVENT, FAILED, FINISHED
+
+    queue = Queue()
+    stopping = threading.Event()
+    threads = set()
+
+    def stop():
+        stopping.set()
+        default_executor.terminate_threads(threads)
+
+    def work(index, sub_step):
+        if stopping.is_set():
+            queue.put((FAILED, None))
+            return
+
+        threads.add(threading.get_ident())
+
+        label = f'[{index}] '
+        stream = registered_steps[sub_step.type](project, task, sub_step,
+                                                 variables)
+
+        try:
+            for event in stream:
+                queue.put((EVENT, _label(label, event)))
+                if stopping.is_set():
+                    raise StopTask
+        except StopTask:
+            queue.put((FAILED, None))
+        except BaseException as e:
+            queue.put((CRASHED, e))
+        else:
+            queue.put((FINISHED, None))
+        finally:
+            stream.close()
+
+    pending = len(step.args.steps)
+    failed = False
+
+    with ThreadPoolExecutor(max_workers=step.args.jobs,
+                            thread_name_prefix='mo-parallel') as pool:
+        try:
+            for index, sub_step in enumerate(step.args.steps, 1):
+                pool.submit(work, index, sub_step)
+
+            while pending:
+                message, payload = queue.get()
+
+                if message == EVENT:
+                    # commands which were stopped haven't really failed
+                    if not (stopping.is_set() and
+                            payload.tag == events.CommandFailed.tag):
+                        yield payload
+                    continue
+
+                pending -= 1
+
+                if message == CRASHED:
+                    raise payload
+                elif message == FAILED:
+                    failed = True
+                    if step.args.fail_fast:
+                        stop()
+        finally:
+            if pending:
+                stop()
+
+    if failed:
+        raise StopTask
+
+
+class PackageManager:
+    """
+    A package manager, which packages are installed with.
+
+    Which packages are installed is only asked for once, and then remembered,
+    so checking many packages doesn't run a command for each.
+
+    Parameters
+    ----------
+    name : str
+        The name of the manager, which is also the name of its step.
+    list_commands : list
+        The commands which list the installed packages, whose output is all
+        parsed.
+    install_command : list
+        The command which installs packages, given after it.
+    parse : callable
+        Parses the output of the list command into package names.
+    normalise : callable
+        Turns a package, as written in a step, into its name as listed.
+    """
+
+    def __init__(self, name, list_commands, install_command, parse,
+                 normalise=str):
+        self.name = name
+        self.list_commands = list_commands
+        self.install_command = install_command
+        self.parse = parse
+        self.normalise = normalise
+
+        self._installed = None
+        self._lock = threading.Lock()
+
+    def installed(self):
+        """Get the names of the installed packages, asking only once."""
+
+        import subprocess
+
+        with self._lock:
+            if self._installed is None:
+                self._installed = set()
+
+                for command in self.list_commands:
+                    try:
+                        output = subprocess.run(
+                            command, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL,
+                            universal_newlines=True,
+                        ).stdout
+                    except OSError:
+                        output = ''
+
+                    self._installed.update(self.parse(output))
+
+            return self._installed
+
+    def missing(self, packages):
+        """Get the packages which aren't installed."""
+
+        installed = self.installed()
+        return [p for p in packages if self.normalise(p) not in installed]
+
+    def mark_installed(self, packages):
+        """Remember that packages have been installed."""
+
+        with self._lock:
+            if self._installed is not None:
+                self._installed.update(self.normalise(p) for p in packages)
+
+    def forget(self):
+        """Forget which packages are installed, so they're listed again."""
+
+        with self._lock:
+            self._installed = None
+
+
+def _first_words(output):
+    return (line.split()[0] for line in output.splitlines() if line.strip())
+
+
+def _brew_name(package):
+    # packages from taps, like 'user/tap/package', are listed by name alone
+    return package.rsplit('/', 1)[-1]
+
+
+def _pip_name(package):
+    # the name of a requirement like 'Some_Package[extra]>=1.0', normalised
+    name = re.match(r'[A-Za-z0-9._-]*', package.strip()).group()
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def _pip_installed(output):
+    return (_pip_name(line.split('==')[0]) for line in output.splitlines()
+            if line.strip())
+
+
+def _dpkg_installed(output):
+    return (line[3:].strip() for line in output.splitlines()
+            if line.startswith('ii'))
+
+
+def _apt_name(package):
+    return package.split('=')[0]
+
+
+package_managers = {
+    'brew': PackageManager('brew', [['brew', 'list', '--formula', '-1'],
+                                    ['brew', 'list', '--cask', '-1']],
+                           ['brew', 'install'], _first_words, _brew_name),
+    'pip': PackageManager('pip', [['pip', 'list', '--format=freeze']],
+                          ['pip', 'install'], _pip_installed, _pip_name),
+    'apt': PackageManager('apt', [['dpkg-query', '-W', '-f',
+                                   '${db:Status-Abbrev}${Package}\n']],
+                          ['apt-get', 'install', '-y'], _dpkg_installed,
+                          _apt_name),
+}
+
+
+def _package_step(manager):
+    def package_step(project, task, step, variables):
+        """
+        Run a package step, installing any of its packages which aren't
+        installed in one go.
+        """
+
+        import shlex
+
+        packages = step.args
+        if isinstance(packages, str):
+            packages = packages.split()
+
+        missing = manager.missing(packages)
+        if not missing:
+            return
+
+        command = manager.install_command + missing
+        yield from _run_command(' '.join(shlex.quote(c) for c in command))
+
+        manager.mark_installed(missing)
 
-    exit_code = subprocess.call(['brew', 'ls', '--versions', package],
-                                stdout=subprocess.PIPE)
+    return package_step
 
-    if exit_code == 0:
-        return
 
-    yield from _run_command(f'brew install {package}')
+for _manager in package_managers.values():
+    step(_package_step(_manager), name=_manager.name)
 
 
 @step(name='print')
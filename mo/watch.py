@@ -0,0 +1,580 @@
+"""
+Contains the watcher, which reruns tasks whenever the files they read
+change.
+"""
+
+from pathlib import Path, PurePath
+import os
+import select
+import struct
+import threading
+import time
+
+from . import events, mofile
+from .fingerprint import STATE_DIRECTORY
+from .project import NoSuchTaskError
+from .runner import Runner
+
+
+def _absolute(path):
+    return Path(os.path.abspath(path))
+
+
+def glob_base(pattern):
+    """
+    Get the directory a glob matches files beneath.
+
+    Returns
+    -------
+    tuple
+        The directory, and whether files may be matched in its
+        subdirectories too.
+    """
+
+    parts = PurePath(pattern).parts
+
+    for i, part in enumerate(parts):
+        if any(character in part for character in '*?['):
+            return Path(*parts[:i]), i < len(parts) - 1
+
+    return Path(*parts[:-1]), False
+
+
+class PollingWatcher:
+    """
+    A watcher which looks for changes by regularly checking the modification
+    time and size of every file matching some globs.
+
+    Parameters
+    ----------
+    project_path : Path
+        The directory the globs are relative to.
+    patterns : list
+        The globs to watch.
+    files : list
+        Any other files to watch.
+    """
+
+    interval = 0.5
+
+    def __init__(self, project_path, patterns, files=()):
+        self.project_path = _absolute(project_path)
+        self.patterns = patterns
+        self.files = [_absolute(path) for path in files]
+
+        self._stats = self._stat_all()
+
+    def _stat_all(self):
+        paths = set(self.files)
+
+        for pattern in self.patterns:
+            paths.update(self.project_path.glob(pattern))
+
+        stats = {}
+
+        for path in paths:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+
+            stats[path] = (stat.st_mtime_ns, stat.st_size)
+
+        return stats
+
+    def changes(self, timeout):
+        """
+        Wait for files to change.
+
+        Returns
+        -------
+        set
+            The paths which changed, empty if nothing changed before the
+            timeout.
+        """
+
+        deadline = time.monotonic() + timeout
+
+        while True:
+            stats = self._stat_all()
+
+            changed = {
+                path for path in stats.keys() | self._stats.keys()
+                if stats.get(path) != self._stats.get(path)
+            }
+
+            self._stats = stats
+
+            remaining = deadline - time.monotonic()
+            if changed or remaining <= 0:
+                return changed
+
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    A watcher which is told about changes by the kernel, using Linux's
+    inotify through ctypes.
+
+    The directories that the globs could match files in are watched, so
+    changes to other files in them are reported too.
+
+    Parameters
+    ----------
+    project_path : Path
+        The directory the globs are relative to.
+    patterns : list
+        The globs to watch.
+    files : list
+        Any other files to watch.
+
+    Raises
+    ------
+    OSError
+        If inotify isn't available.
+    """
+
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+
+    mask = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+            IN_MOVED_TO | IN_CREATE | IN_DELETE)
+
+    ignored_directories = {'.git', STATE_DIRECTORY}
+
+    _header = struct.Struct('iIII')
+
+    def __init__(self, project_path, patterns, files=()):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+        try:
+            self._add_watch = libc.inotify_add_watch
+            fd = libc.inotify_init1(self.IN_CLOEXEC)
+        except AttributeError:
+            raise OSError('inotify is not available')
+
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self._ctypes = ctypes
+        self.fd = fd
+        self.project_path = _absolute(project_path)
+
+        # mapping watch descriptor to (directory, whether it is recursive)
+        self._watches = {}
+
+        try:
+            for path in files:
+                self._watch(_absolute(path).parent, False)
+
+            for pattern in patterns:
+                base, recursive = glob_base(pattern)
+                self._watch(self.project_path / base, recursive)
+        except OSError:
+            self.close()
+            raise
+
+    def _watch(self, directory, recursive):
+        if not directory.is_dir():
+            return
+
+        wd = self._add_watch(self.fd, os.fsencode(directory), self.mask)
+        if wd < 0:
+            errno = self._ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(directory))
+
+        # a directory may be watched both with and without its subdirectories
+        recursive = recursive or self._watches.get(wd, (None, False))[1]
+        self._watches[wd] = (directory, recursive)
+
+        if recursive:
+            for child in os.scandir(directory):
+                if (child.is_dir(follow_symlinks=False) and
+                        child.name not in self.ignored_directories):
+                    self._watch(Path(child.path), True)
+
+    def changes(self, timeout):
+        """
+        Wait for files to change.
+
+        Returns
+        -------
+        set
+            The paths which changed, empty if nothing changed before the
+            timeout.
+        """
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        offset = 0
+
+        while offset < len(data):
+            wd, mask, cookie, length = self._header.unpack_from(data, offset)
+            offset += self._header.size
+
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            if mask & self.IN_Q_OVERFLOW:
+                # events were lost, so say everything changed
+                changed.update(self._everything())
+                continue
+
+            try:
+                directory, recursive = self._watches[wd]
+            except KeyError:
+                continue
+
+            path = directory / os.fsdecode(name)
+            changed.add(path)
+
+            if mask & self.IN_ISDIR and mask & self.IN_CREATE and recursive:
+                try:
+                    self._watch(path, True)
+                except OSError:
+                    pass
+
+        return changed
+
+    def _everything(self):
+        for directory, recursive in list(self._watches.values()):
+            if recursive:
+                yield from (_absolute(p) for p in directory.rglob('*'))
+            else:
+                yield from directory.iterdir()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def create_watcher(project_path, patterns, files=()):
+    """
+    Create a watcher, using inotify if possible and otherwise falling back to
+    polling.
+    """
+
+    try:
+        return InotifyWatcher(project_path, patterns, files)
+    except OSError:
+        return PollingWatcher(project_path, patterns, files)
+
+
+class Watch:
+    """
+    Runs tasks, then waits for the files they read to change and reruns the
+    tasks which are affected, for as long as it is iterated over.
+
+    The project and runner are kept between runs, so tasks whose inputs
+    haven't changed aren't run again. If files change while tasks are
+    running, the run is cancelled and started again once they settle.
+    Changing the task file, or any file it includes, reloads the project and
+    reruns everything.
+
+    Parameters
+    ----------
+    filename : str
+        The task file.
+    variables : dict
+        Mapping variable name to the value.
+    jobs : int
+        The maximum number of independent tasks to run at once.
+    tasks : list
+        The names of the tasks to run.
+    cache : LocalCache or HttpCache
+        Where to share the outputs of tasks, if anywhere.
+    """
+
+    debounce = 0.2
+    """How long to wait for files to stop changing before running, in
+    seconds."""
+
+    watcher_timeout = 0.5
+
+    def __init__(self, filename, variables, jobs, tasks, cache=None):
+        self.filename = _absolute(filename)
+        self.variables = variables
+        self.jobs = jobs
+        self.tasks = tasks
+        self.cache = cache
+
+        self.runner = None
+
+        self._condition = threading.Condition()
+        self._changed = set()
+        self._last_change = 0
+        self._running = False
+        self._stopped = False
+
+        self._graph = {}
+        self._inputs = {}
+        self._files = set()
+
+    def stop(self):
+        """Stop watching, from another thread."""
+
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def __iter__(self):
+        while not self._stopped:
+            try:
+                project = mofile.load(self.filename)
+            except FileNotFoundError:
+                yield events.invalid_mofile(str(self.filename))
+                project = None
+            except mofile.InvalidMofileFormat as e:
+                yield events.invalid_mofile(str(self.filename), str(e))
+                project = None
+
+            yield from self._watch(project)
+
+    def _watch(self, project):
+        if project is None:
+            patterns = []
+            self._graph = {}
+        else:
+            self.runner = Runner(project, self.variables, self.jobs,
+                                 self.cache)
+            self._graph = self._dependencies(project)
+            patterns = [pattern for task in self._graph.values()
+                        for pattern in task.inputs]
+
+        self._inputs = {}
+
+        self._files = {self.filename}
+        if project is not None:
+            self._files.update(_absolute(path) for path in project.files)
+
+        watcher = create_watcher(self.filename.parent, patterns, self._files)
+
+        closed = threading.Event()
+        thread = threading.Thread(target=self._monitor,
+                                  args=(watcher, closed),
+                                  name='mo-watch', daemon=True)
+        thread.start()
+
+        try:
+            while True:
+                if project is not None:
+                    yield from self._run()
+
+                    inputs = self._expand_inputs()
+                    with self._condition:
+                        self._inputs = inputs
+
+                    files = set().union(*self._inputs.values())
+                    yield events.watching(len(files) + 1)
+
+                changed = self._wait()
+                if changed is None:
+                    return
+
+                yield events.files_changed(sorted(str(p) for p in changed))
+
+                if changed & self._files:
+                    return
+
+                self._forget(self._affected(changed))
+        finally:
+            closed.set()
+            thread.join()
+            watcher.close()
+
+    def _run(self):
+        with self._condition:
+            self._running = True
+
+        cancelled = False
+
+        try:
+            for event in self.runner.run_tasks(self.tasks):
+                with self._condition:
+                    cancelled = not self._running
+
+                if not cancelled:
+                    yield event
+        finally:
+            with self._condition:
+                cancelled = not self._running
+                self._running = False
+
+        if cancelled:
+            yield events.run_cancelled()
+
+    def _monitor(self, watcher, closed):
+        while not closed.is_set():
+            changed = watcher.changes(self.watcher_timeout)
+            if not changed:
+                continue
+
+            changed = {_absolute(path) for path in changed}
+
+            # a run which starts after this sees the changes anyway, so only
+            # a running one needs checking, and it may have just finished
+            matching = self._matching(changed) if self._running else None
+
+            with self._condition:
+                self._changed |= changed
+                self._last_change = time.monotonic()
+                self._condition.notify_all()
+
+                outdated = (self._running and
+                            self._relevant(changed, matching))
+                if outdated:
+                    self._running = False
+
+            if outdated:
+                self.runner.cancel()
+
+    def _wait(self):
+        """
+        Wait for relevant files to change, and then stop changing.
+
+        Returns
+        -------
+        set
+            The relevant files which changed, or ``None`` if stopped.
+        """
+
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return None
+                changed = set(self._changed)
+
+            matching = self._matching(changed)
+
+            with self._condition:
+                if self._stopped:
+                    return None
+
+                # files which changed while globbing are checked next time
+                relevant = self._relevant(changed, matching)
+
+                if not relevant:
+                    self._changed -= changed
+                    if not self._changed:
+                        self._condition.wait()
+                    continue
+
+                quiet = time.monotonic() - self._last_change
+                if quiet >= self.debounce:
+                    self._changed -= changed
+                    return relevant
+
+                self._condition.wait(self.debounce - quiet)
+
+    def _dependencies(self, project):
+        # the tasks to run and all of their dependencies, by name
+        graph = {}
+        names = list(self.tasks)
+
+        while names:
+            try:
+                task = project.find_task(names.pop())
+            except NoSuchTaskError:
+                continue
+
+            if task.name not in graph:
+                graph[task.name] = task
+                names.extend(task.dependencies)
+
+        return graph
+
+    def _expand(self, patterns):
+        return {
+            _absolute(path)
+            for path in self.runner.fingerprints.expand(patterns)
+        }
+
+    def _expand_inputs(self):
+        return {
+            name: self._expand(task.inputs)
+            for name, task in self._graph.items() if task.inputs
+        }
+
+    def _matching(self, changed):
+        # the files the inputs and outputs of the tasks match now, if they're
+        # needed to tell whether the changes are relevant, which is globbed
+        # without holding the lock
+        if not changed or changed & self._files or not self._graph:
+            return None
+
+        inputs = set().union(*self._expand_inputs().values())
+        outputs = self._expand([pattern for task in self._graph.values()
+                                for pattern in task.outputs])
+
+        return inputs, outputs
+
+    def _relevant(self, changed, matching):
+        # files which were, or are now, the inputs of a task, ignoring those
+        # written by tasks
+        if not changed:
+            return set()
+
+        if changed & self._files:
+            return changed & self._files
+
+        if matching is None:
+            return set()
+
+        inputs, outputs = matching
+        inputs = inputs.union(*self._inputs.values())
+
+        return (changed & inputs) - outputs
+
+    def _affected(self, changed):
+        # the tasks with changed inputs, and every task which depends on them
+        current = self._expand_inputs()
+
+        affected = {
+            name for name in self._graph
+            if changed & (self._inputs.get(name, set()) |
+                          current.get(name, set()))
+        }
+
+        dependents = {name: set() for name in self._graph}
+        for name, task in self._graph.items():
+            for dependency in task.dependencies:
+                try:
+                    dependency = self.runner.find_task(dependency).name
+                except NoSuchTaskError:
+                    continue
+                dependents.setdefault(dependency, set()).add(name)
+
+        pending = list(affected)
+        while pending:
+            for dependent in dependents.get(pending.pop(), ()):
+                if dependent not in affected:
+                    affected.add(dependent)
+                    pending.append(dependent)
+
+        return affected
+
+    def _forget(self, names):
+        # forget that tasks were run, so they're run again
+        self.runner.tasks_run = [
+            name for name in self.runner.tasks_run if name not in names
+        ]
@@ -15,6 +15,7 @@ setup(
     author='Thomas Leese',
     author_email='thomas@leese.io',
     packages=find_packages(exclude=['docs', 'tests']),
+    python_requires='>=3.8',
     entry_points={
         'console_scripts': ['mo = mo.cli:main']
     },
@@ -0,0 +1,19 @@
+import pytest
+
+from mo.project import Project
+
+
+@pytest.fixture
+def chdir(tmp_path, monkeypatch):
+    # commands are run in the current directory, and runs keep their
+    # history, fingerprints and logs there, so keep them out of the way
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def make_project(tmp_path):
+    def make_project(tasks, path=None):
+        return Project({'tasks': tasks}, tmp_path if path is None else path)
+
+    return make_project
@@ -0,0 +1,92 @@
+from mo import events
+from mo.bus import EventBus, Subscriber
+from mo.frontends import Frontend
+
+
+class Recorder(Frontend):
+    def __init__(self):
+        super().__init__()
+        self.events = []
+
+    def output(self, event):
+        self.events.append(event)
+
+
+def publish_lines(policy, count):
+    frontend = Recorder()
+    subscriber = Subscriber(frontend, maxsize=2, policy=policy)
+
+    # publish before the writer starts, so the queue is sure to overflow
+    for i in range(count):
+        subscriber.publish(events.command_output('stdout', str(i).encode()))
+
+    subscriber.start()
+    subscriber.publish(events.running_command('done'))
+    subscriber.close()
+
+    return frontend.events
+
+
+def test_block():
+    frontend = Recorder()
+
+    with EventBus([Subscriber(frontend, maxsize=2, policy='block')]) as bus:
+        for i in range(100):
+            bus.publish(events.command_output('stdout', str(i).encode()))
+
+    received = [e.args['output'] for e in frontend.events]
+    assert received == [str(i).encode() for i in range(100)]
+
+
+def test_drop():
+    received = publish_lines('drop', 100)
+
+    assert received[-1].name == 'RunningCommand'
+    assert any(e.name == 'DroppedOutput' for e in received)
+
+    dropped = sum(e.args['count'] for e in received
+                  if e.name == 'DroppedOutput')
+    lines = [e for e in received if e.name == 'CommandOutput']
+    assert len(lines) + dropped == 100
+
+
+def test_coalesce():
+    received = publish_lines('coalesce', 100)
+
+    output = b'\n'.join(e.args['output'] for e in received
+                        if e.name == 'CommandOutput')
+    assert output.split(b'\n') == [str(i).encode() for i in range(100)]
+    assert received[-1].name == 'RunningCommand'
+
+
+def test_coalesce_is_capped():
+    import time
+
+    frontend = Recorder()
+    subscriber = Subscriber(frontend, maxsize=4, policy='coalesce')
+    subscriber.max_coalesced = 10000
+
+    start = time.monotonic()
+    for i in range(40000):
+        subscriber.publish(events.command_output('stdout', b'x' * 80))
+    assert time.monotonic() - start < 5
+
+    subscriber.start()
+    subscriber.close()
+
+    lines = [e for e in frontend.events if e.name == 'CommandOutput']
+    assert all(len(e.output) <= 10000 for e in lines)
+
+    dropped = sum(e.count for e in frontend.events
+                  if e.name == 'DroppedOutput')
+    merged = sum(e.output.count(b'\n') + 1 for e in lines)
+    assert merged + dropped == 40000
+
+
+def test_fan_out():
+    frontends = [Recorder(), Recorder()]
+
+    with EventBus([Subscriber(f) for f in frontends]) as bus:
+        bus.publish(events.running_command('make'))
+
+    assert frontends[0].events == frontends[1].events
@@ -0,0 +1,150 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import os
+import tarfile
+import threading
+
+import pytest
+
+from mo import mofile
+from mo.cache import CacheError, HttpCache, LocalCache, restore
+from mo.runner import Runner
+
+
+pytestmark = pytest.mark.usefixtures('chdir')
+
+
+TASKS = {
+    'build': {
+        'description': 'Build.',
+        'inputs': ['input.txt'],
+        'outputs': ['build/**/*'],
+        'steps': ['mkdir -p build/nested',
+                  'cp input.txt build/nested/output.txt'],
+    },
+}
+
+
+@pytest.fixture
+def run(make_project):
+    def run(path, cache):
+        (path / 'input.txt').write_text('hello')
+        os.chdir(path)
+        runner = Runner(make_project(TASKS, path), {}, cache=cache)
+        return [e.name for e in runner.run_task('build')]
+
+    return run
+
+
+class StandIn(BaseHTTPRequestHandler):
+    archives = {}
+
+    def do_GET(self):
+        try:
+            body = self.archives[self.path]
+        except KeyError:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        length = int(self.headers['Content-Length'])
+        self.archives[self.path] = self.rfile.read(length)
+        self.send_response(201)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}/cache'
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+@pytest.mark.parametrize('backend', ['local', 'http'])
+def test_outputs_are_restored(tmp_path, server, backend, run):
+    if backend == 'local':
+        cache = LocalCache(tmp_path / 'cache')
+    else:
+        cache = HttpCache(server)
+
+    first, second = tmp_path / 'first', tmp_path / 'second'
+    first.mkdir()
+    second.mkdir()
+
+    assert 'StoredInCache' in run(first, cache)
+
+    names = run(second, cache)
+    assert 'RestoredFromCache' in names
+    assert 'RunningStep' not in names
+
+    output = second / 'build' / 'nested' / 'output.txt'
+    assert output.read_text() == 'hello'
+
+    # restoring brings the task up to date
+    assert 'UpToDate' in run(second, cache)
+
+
+def write_included(path):
+    (path / 'app').mkdir(parents=True)
+    (path / 'shared').mkdir()
+    (path / 'shared' / 'input.txt').write_text('shared')
+
+    (path / 'app' / 'Mofile').write_text('include: [../shared/Mofile]\n')
+    (path / 'shared' / 'Mofile').write_text(
+        'tasks:\n'
+        '  build:\n'
+        '    description: Build.\n'
+        '    inputs: input.txt\n'
+        '    outputs: out/*\n'
+        '    steps: mkdir -p out && cp input.txt out/output.txt\n'
+    )
+
+    project = mofile.load(path / 'app' / 'Mofile', cache=False)
+    return Runner(project, {}, cache=LocalCache(path.parent / 'cache'))
+
+
+def test_included_outputs_outside_root_are_restored(tmp_path):
+    first = write_included(tmp_path / 'first')
+    assert 'StoredInCache' in [e.name for e in first.run_task('shared:build')]
+
+    second = write_included(tmp_path / 'second')
+    names = [e.name for e in second.run_task('shared:build')]
+    assert 'RestoredFromCache' in names
+
+    output = tmp_path / 'second' / 'shared' / 'out' / 'output.txt'
+    assert output.read_text() == 'shared'
+
+
+def test_unavailable_cache_runs_task(tmp_path, run):
+    names = run(tmp_path, HttpCache('http://127.0.0.1:1', timeout=1))
+
+    assert 'CacheUnavailable' in names
+    assert 'FinishedTask' in names
+
+
+def test_restore_refuses_paths_outside_root(tmp_path):
+    file = io.BytesIO()
+    with tarfile.open(fileobj=file, mode='w:gz') as tar:
+        info = tarfile.TarInfo('../escaped')
+        tar.addfile(info, io.BytesIO())
+    file.seek(0)
+
+    with pytest.raises(CacheError):
+        restore(file, tmp_path)
+
+    assert not (tmp_path.parent / 'escaped').exists()
@@ -1,4 +1,9 @@
-from mo import cli
+from argparse import Namespace
+import json
+import subprocess
+import sys
+
+from mo import cli, events
 
 
 def test_parse_variables():
@@ -7,3 +12,61 @@ def test_parse_variables():
     assert variables['a'] == 'var'
     assert variables['b'] == 'var'
     assert variables['c'] == 'var=blah'
+
+
+def test_lazy_imports():
+    code = (
+        'import sys\n'
+        'from mo import cli\n'
+        'sys.argv = ["mo", "-f", "tests/examples/mofile.json", '
+        '"--frontend", "json"]\n'
+        'cli.main()\n'
+        'print(" ".join(sys.modules), file=sys.stderr)\n'
+    )
+
+    result = subprocess.run([sys.executable, '-c', code],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+
+    modules = result.stderr.split()
+
+    for module in ('yaml', 'toml', 'colorama', 'asyncio', 'difflib'):
+        assert module not in modules
+
+
+def test_cli_imports_runner_lazily():
+    code = 'import sys\nfrom mo import cli\nprint(" ".join(sys.modules))\n'
+
+    result = subprocess.run([sys.executable, '-c', code],
+                            stdout=subprocess.PIPE, universal_newlines=True,
+                            check=True)
+
+    modules = result.stdout.split()
+
+    for module in ('mo.runner', 'mo.cache'):
+        assert module not in modules
+
+
+def test_json_frontend(capsys):
+    frontend = cli.get_frontend('json')
+
+    frontend.begin()
+    frontend.output(events.command_output('stdout', 'hello'))
+    assert capsys.readouterr().out == ''
+    frontend.end()
+
+    assert json.loads(capsys.readouterr().out) == {
+        'name': 'CommandOutput', 'kind': 'output', 'task': None,
+        'args': {'pipe': 'stdout', 'output': 'hello'},
+    }
+
+
+def test_overflow_policy():
+    def policy(frontend, overflow=None):
+        return cli.overflow_policy(Namespace(frontend=frontend,
+                                             overflow=overflow))
+
+    assert policy('live') == 'coalesce'
+    assert policy('json') == 'block'
+    assert policy('json-framed') == 'block'
+    assert policy('json', 'drop') == 'drop'
@@ -0,0 +1,85 @@
+from argparse import Namespace
+import json
+import os
+import socket
+import stat
+import threading
+
+import pytest
+
+from mo import daemon
+
+
+def test_run_through_daemon(tmp_path):
+    mofile = tmp_path / 'Mofile'
+    mofile.write_text('tasks:\n  test:\n    steps:\n      - print: hello\n')
+
+    socket_path = str(tmp_path / 'mo.sock')
+
+    server = daemon.Daemon(socket_path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    try:
+        args = Namespace(file=str(mofile), variables=None, jobs=1,
+                         tasks=['test'])
+
+        events = [json.loads(line)
+                  for line in daemon.request(args, socket_path)]
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    outputs = [e['args']['output'] for e in events
+               if e['name'] == 'CommandOutput']
+    assert outputs == ['hello']
+
+
+def test_project_cache_reloads(tmp_path):
+    mofile = tmp_path / 'Mofile'
+    mofile.write_text('tasks:\n  test:\n    steps: echo one\n')
+
+    cache = daemon.ProjectCache()
+
+    project = cache.load(mofile)
+    assert cache.load(mofile) is project
+
+    mofile.write_text('tasks:\n  test:\n    steps: echo three\n')
+    assert cache.load(mofile) is not project
+
+
+def test_socket_is_only_for_its_user(tmp_path):
+    socket_path = str(tmp_path / 'mo.sock')
+
+    with daemon.Daemon(socket_path):
+        assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+
+
+def test_only_stale_sockets_are_removed(tmp_path):
+    socket_path = tmp_path / 'mo.sock'
+
+    socket_path.write_text('not a socket')
+    with pytest.raises(FileExistsError):
+        daemon.Daemon(str(socket_path))
+    assert socket_path.read_text() == 'not a socket'
+    socket_path.unlink()
+
+    with daemon.Daemon(str(socket_path)):
+        with pytest.raises(OSError, match='already listening'):
+            daemon.Daemon(str(socket_path))
+
+    # left behind, as if by a daemon which was killed
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(socket_path))
+    stale.close()
+
+    with daemon.Daemon(str(socket_path)):
+        pass
+
+
+def test_peer_uid():
+    a, b = socket.socketpair()
+
+    with a, b:
+        assert daemon._peer_uid(a) in (os.getuid(), None)
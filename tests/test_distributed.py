@@ -0,0 +1,86 @@
+from pathlib import Path
+import os
+import subprocess
+import sys
+
+import pytest
+
+from mo import mofile
+from mo.distributed import Coordinator, DistributedRunner, parse_address
+
+
+MOFILE = '''
+variables:
+  greeting:
+    description: The greeting.
+    default: hello
+tasks:
+  first:
+    description: First.
+    steps: echo {greeting} first
+  second:
+    description: Second.
+    steps: echo {greeting} second
+  flaky:
+    description: Kills the worker running it, the first time.
+    steps: if [ ! -e marker ]; then touch marker; kill -9 $PPID; fi
+  all:
+    description: All.
+    after: [first, second, flaky]
+    steps: echo done
+'''
+
+
+def start_worker(coordinator, token):
+    host, port = coordinator.address
+    env = {**os.environ, 'PYTHONPATH': str(Path(__file__).parents[1])}
+
+    return subprocess.Popen([sys.executable, '-m', 'mo', '--file', 'Mofile',
+                             '--worker', f'{host}:{port}', '--token', token],
+                            env=env, stderr=subprocess.DEVNULL)
+
+
+@pytest.fixture
+def coordinator(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'Mofile').write_text(MOFILE)
+
+    with Coordinator(('127.0.0.1', 0), 'secret') as coordinator:
+        workers = [start_worker(coordinator, 'secret') for _ in range(2)]
+
+        try:
+            yield coordinator
+        finally:
+            coordinator.close()
+            for worker in workers:
+                worker.wait(5)
+
+
+def test_parse_address():
+    assert parse_address('localhost:8000') == ('localhost', 8000)
+    assert parse_address(':8000') == ('127.0.0.1', 8000)
+
+
+def test_tasks_run_on_workers(coordinator):
+    project = mofile.load(Path('Mofile'))
+    runner = DistributedRunner(project, {'greeting': 'hi'}, 2, coordinator)
+
+    events = list(runner.run_task('all'))
+    names = [e.name for e in events]
+
+    output = sorted(e.output for e in events if e.name == 'CommandOutput')
+    assert output == ['done', 'hi first', 'hi second']
+    assert names.count('SentToWorker') == 5
+    assert names.count('WorkerLost') == 1
+    assert sorted(runner.tasks_run) == ['all', 'first', 'flaky', 'second']
+
+
+def test_workers_need_the_token(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'Mofile').write_text(MOFILE)
+
+    with Coordinator(('127.0.0.1', 0), 'secret') as coordinator:
+        worker = start_worker(coordinator, 'guess')
+
+        assert worker.wait(10) != 0
+        assert coordinator.acquire(0.1) is None
@@ -0,0 +1,63 @@
+import asyncio
+
+from mo.executor import Executor, LineSplitter
+
+
+def test_run_command():
+    process = Executor().run('echo out; echo err >&2; exit 3')
+
+    lines = sorted(process)
+
+    assert lines == [('stderr', b'err'), ('stdout', b'out')]
+    assert process.returncode == 3
+
+
+def test_run_many_commands():
+    executor = Executor()
+
+    processes = [executor.run(f'echo {i}') for i in range(20)]
+
+    for i, process in enumerate(processes):
+        assert list(process) == [('stdout', str(i).encode())]
+        assert process.returncode == 0
+
+
+def test_scripts_without_shebang_run_through_shell(tmp_path):
+    script = tmp_path / 'build.sh'
+    script.write_text('echo built\n')
+    script.chmod(0o755)
+
+    process = Executor().run('./build.sh', str(tmp_path), ['./build.sh'])
+
+    assert list(process) == [('stdout', b'built')]
+    assert process.returncode == 0
+
+
+def test_commands_which_cannot_be_run_fail(monkeypatch):
+    async def denied(*args, **kwargs):
+        raise PermissionError(13, 'Permission denied')
+
+    monkeypatch.setattr(asyncio, 'create_subprocess_exec', denied)
+
+    process = Executor().run('true', argv=['true'])
+
+    assert list(process) == [('stderr', b'true: Permission denied')]
+    assert process.returncode == 126
+
+
+def test_long_lines_are_split():
+    process = Executor(max_line_length=1000).run(
+        'head -c 2500 /dev/zero | tr "\\0" x; echo; echo done'
+    )
+
+    lines = [line for pipe, line in process]
+
+    assert [len(line) for line in lines] == [1000, 1000, 500, 4]
+
+
+def test_line_splitter():
+    splitter = LineSplitter(4)
+
+    assert splitter.feed(b'ab\ncd') == [b'ab']
+    assert splitter.feed(b'efghi\nj') == [b'cdef', b'ghi']
+    assert splitter.flush() == [b'j']
@@ -0,0 +1,34 @@
+from mo.runner import Runner
+
+
+TASKS = {
+    'build': {
+        'description': 'Build.',
+        'inputs': ['src/*.txt'],
+        'outputs': 'out.txt',
+        'steps': ['cat src/*.txt > out.txt'],
+    },
+}
+
+
+def run(project):
+    runner = Runner(project, {})
+    runner.queue_task('build')
+    return [event.name for event in runner.run()]
+
+
+def test_up_to_date(tmp_path, chdir, make_project):
+    (tmp_path / 'src').mkdir()
+    (tmp_path / 'src' / 'a.txt').write_text('a')
+
+    project = make_project(TASKS)
+
+    assert 'RunningCommand' in run(project)
+    assert 'UpToDate' in run(project)
+
+    (tmp_path / 'src' / 'a.txt').write_text('b')
+    assert 'RunningCommand' in run(project)
+
+    (tmp_path / 'out.txt').unlink()
+    assert 'RunningCommand' in run(project)
+    assert 'UpToDate' in run(project)
@@ -0,0 +1,125 @@
+import io
+import json
+
+from mo import events
+from mo.frontends import Live, Trace
+from mo.profile import Timing
+from mo.project import Task
+
+
+class Terminal(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def isatty(self):
+        return True
+
+    def write(self, data):
+        self.writes += 1
+        return super().write(data)
+
+
+def run(stream, outputs, failed, kept_output=1000):
+    frontend = Live(stream)
+    frontend.refresh_rate = 1
+    frontend.kept_output = kept_output
+
+    frontend.begin()
+    frontend.output(events.running_command('make')._replace(task='a'))
+    for i in range(outputs):
+        event = events.command_output('stdout', f'line {i}'.encode())
+        frontend.output(event._replace(task='a'))
+    if failed:
+        frontend.output(events.command_failed('make', 1, '')._replace(task='a'))
+    else:
+        frontend.output(events.running_command('true')._replace(task='a'))
+    frontend.end()
+
+
+def test_live_frontend_writes_per_frame():
+    stream = Terminal()
+    run(stream, 1000, failed=False)
+
+    assert stream.writes < 10
+    assert 'line 999' not in stream.getvalue()
+
+
+def test_live_frontend_shows_all_output_on_failure():
+    stream = io.StringIO()
+    run(stream, 1000, failed=True)
+
+    output = stream.getvalue()
+    assert 'line 0' in output
+    assert 'line 999' in output
+
+
+def test_live_frontend_keeps_output_tail_on_failure():
+    stream = io.StringIO()
+    run(stream, 1000, failed=True, kept_output=10)
+
+    output = stream.getvalue()
+    assert 'Dropped 990 lines of output' in output
+    assert 'line 989' not in output
+    assert 'line 990' in output
+    assert 'line 999' in output
+
+
+def test_live_frontend_keeps_text_output_tail():
+    stream = io.StringIO()
+    frontend = Live(stream)
+    frontend.kept_output = 10
+
+    for i in range(20):
+        event = events.command_output('stdout', f'line {i}\nmore')
+        frontend.output(event._replace(task='a'))
+    frontend.output(events.command_failed('make', 1, '')._replace(task='a'))
+    frontend.end()
+
+    output = stream.getvalue()
+    assert 'Dropped 20 lines of output' in output
+    assert 'line 19' in output
+
+
+def test_live_frontend_shows_tail():
+    stream = Terminal()
+    frontend = Live(stream)
+
+    frontend.output(events.running_command('make')._replace(task='a'))
+    for i in range(100):
+        event = events.command_output('stdout', f'line {i}'.encode())
+        frontend.output(event._replace(task='a'))
+    frontend.redraw()
+
+    output = stream.getvalue()
+    assert 'line 99' in output
+    assert 'line 94' not in output
+
+
+def test_trace_puts_concurrent_tasks_on_separate_rows():
+    stream = io.StringIO()
+    frontend = Trace(stream)
+
+    for name, start in (('a', 0.0), ('b', 0.5), ('c', 2.0)):
+        task = Task(name, '', None, None, None, None, None)
+        timing = Timing(start, 1.0, 0.0, 0.0, 0.0)
+        frontend.output(events.task_timing(task, timing)._replace(task=name))
+
+    frontend.end()
+
+    trace_events = json.loads(stream.getvalue())['traceEvents']
+    rows = {e['name']: e['tid'] for e in trace_events}
+    assert rows == {'a': 0, 'b': 1, 'c': 0}
+
+
+def test_human_decorations_are_looked_up_by_tag():
+    from mo.frontends import Human
+
+    frontend = Human(io.StringIO())
+    event = events.running_command('make')
+
+    assert frontend._decorations[event.tag] == (
+        frontend.get_character_style(event), frontend.get_character(event),
+        frontend.get_text_style(event),
+    )
+    assert frontend._decorations[event.tag][1] == '>'
@@ -0,0 +1,74 @@
+from mo.history import Duration, History
+
+
+def tasks(command='true'):
+    return {
+        'build': {'description': 'Build.', 'steps': [command]},
+        'test': {'description': 'Test.', 'steps': ['true']},
+    }
+
+
+def test_duration():
+    duration = Duration()
+    for seconds in (1, 2, 3):
+        duration.add(seconds)
+
+    assert duration.count == 3
+    assert duration.mean == 2
+    assert duration.stdev == 1
+
+
+def test_duration_is_rolling():
+    duration = Duration()
+    for _ in range(100):
+        duration.add(1)
+    for _ in range(100):
+        duration.add(5)
+
+    assert duration.count == duration.window
+    assert abs(duration.mean - 5) < 0.1
+
+
+def test_estimate(tmp_path, make_project):
+    project = make_project(tasks())
+    build = project.tasks['build']
+
+    history = History(tmp_path)
+    assert history.estimate(build) is None
+
+    history.record(build, None, 2.0)
+    history.record(build, 0, 2.0)
+    history.save()
+    history.record(build, None, 4.0)
+    history.save()
+
+    history = History(tmp_path)
+    assert history.estimate(build) == 3.0
+    assert history.estimate(project.tasks['test']) is None
+
+    statistics = history.statistics()
+    assert [(s.task, s.runs, s.mean) for s in statistics] == [('build', 2, 3)]
+
+
+def test_estimate_falls_back_to_previous_revision(tmp_path, make_project):
+    history = History(tmp_path)
+    history.record(make_project(tasks()).tasks['build'], None, 2.0)
+    history.save()
+
+    changed = make_project(tasks('false')).tasks['build']
+    assert History(tmp_path).estimate(changed) == 2.0
+
+
+def test_old_revisions_are_removed(tmp_path, make_project):
+    history = History(tmp_path)
+    for i in range(history.revisions + 2):
+        history.record(make_project(tasks(f'echo {i}')).tasks['build'],
+                       None, i)
+        history.save()
+
+    with history._connect() as connection:
+        revisions = connection.execute(
+            'SELECT COUNT(DISTINCT revision) FROM durations'
+        ).fetchone()[0]
+
+    assert revisions == history.revisions
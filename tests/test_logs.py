@@ -0,0 +1,93 @@
+import pytest
+
+from mo import events
+from mo.logs import RunLog, read_index, search
+from mo.runner import Runner
+
+
+pytestmark = pytest.mark.usefixtures('chdir')
+
+
+TASKS = {
+    'build': {'description': 'Build.',
+              'steps': ['echo compiling', 'echo warning: old >&2']},
+    'test': {'description': 'Test.', 'steps': ['echo passed'],
+             'after': ['build']},
+}
+
+
+def test_runs_are_logged_by_task_and_step(make_project):
+    project = make_project(TASKS)
+    list(Runner(project, {}).run_task('test'))
+
+    found = [(entry.task, entry.step, pipe, output)
+             for entry, pipe, output in search(project.path)]
+    assert found == [
+        ('build', 0, 'stdout', 'compiling'),
+        ('build', 1, 'stderr', 'warning: old'),
+        ('test', 0, 'stdout', 'passed'),
+    ]
+
+    found = [output for _, _, output in search(project.path, task='test')]
+    assert found == ['passed']
+
+
+def test_logs_task(make_project):
+    project = make_project(TASKS)
+    list(Runner(project, {}).run_task('test'))
+
+    runner = Runner(project, {'task': 'build', 'grep': '^warn'})
+    logged = [e for e in runner.run_task('logs') if e.name == 'LoggedOutput']
+
+    assert [(e.source, e.step, e.output) for e in logged] == \
+        [('build', 1, 'warning: old')]
+
+
+def test_oldest_segments_are_removed(tmp_path):
+    log = RunLog(tmp_path, tmp_path / 'logs')
+    log.block_size = 1
+    log.segment_size = 200
+    log.max_size = 600
+
+    for number in range(100):
+        event = events.command_output('stdout', f'line {number:03}')
+        log.write(event._replace(task='build'))
+    log.close()
+
+    # the indexes count towards the size too
+    files = list((tmp_path / 'logs').glob('*.log')) + \
+        list((tmp_path / 'logs').glob('*.idx'))
+    assert sum(path.stat().st_size for path in files) <= 600
+
+    found = [output for _, _, output in
+             search(tmp_path, directory=tmp_path / 'logs')]
+    assert found[-1] == 'line 099'
+    assert 'line 000' not in found
+    assert len(found) == len(read_index(tmp_path / 'logs'))
+
+
+def test_search_skips_segments_without_the_task(tmp_path, monkeypatch):
+    import mmap
+
+    log = RunLog(tmp_path, tmp_path / 'logs')
+    log.block_size = 1
+    log.segment_size = 200
+
+    for task in ('build', 'test'):
+        for number in range(20):
+            event = events.command_output('stdout', f'{task} {number}')
+            log.write(event._replace(task=task))
+    log.close()
+
+    mapped = []
+    real_mmap = mmap.mmap
+    monkeypatch.setattr(mmap, 'mmap', lambda *args, **kwargs: (
+        mapped.append(args) or real_mmap(*args, **kwargs)
+    ))
+
+    found = [output for _, _, output in
+             search(tmp_path, task='test', directory=tmp_path / 'logs')]
+    assert found == [f'test {number}' for number in range(20)]
+
+    segments = list((tmp_path / 'logs').glob('*.log'))
+    assert 0 < len(mapped) < len(segments)
@@ -29,3 +29,125 @@ def test_invalid_format():
 def test_load_non_existent():
     with pytest.raises(FileNotFoundError):
         mofile.load('Mofile.does.not.exist')
+
+
+def test_load_cached(tmp_path):
+    path = tmp_path / 'Mofile'
+    path.write_text('tasks:\n  test:\n    steps: echo one\n')
+
+    assert mofile.load(path).tasks['test'].steps[0].args == 'echo one'
+    assert (tmp_path / '.mo' / 'cache' / 'Mofile.json').exists()
+    assert mofile.load(path).tasks['test'].steps[0].args == 'echo one'
+
+    path.write_text('tasks:\n  test:\n    steps: echo two\n')
+    assert mofile.load(path).tasks['test'].steps[0].args == 'echo two'
+
+
+def test_load_ignores_invalid_cache(tmp_path):
+    path = tmp_path / 'Mofile'
+    path.write_text('tasks:\n  test:\n    steps: echo one\n')
+    mofile.load(path)
+
+    cache = tmp_path / '.mo' / 'cache' / 'Mofile.json'
+    key = cache.read_bytes().splitlines()[0]
+
+    for value in (b'[[], {"tasks": {"test"', b'[[], "not a config"]', b'{}'):
+        cache.write_bytes(key + b'\n' + value + b'\n')
+        assert mofile.load(path).tasks['test'].steps[0].args == 'echo one'
+
+
+def write_monorepo(tmp_path):
+    (tmp_path / 'api').mkdir()
+    (tmp_path / 'Mofile').write_text(
+        'include:\n'
+        '  - api/Mofile\n'
+        'tasks:\n'
+        '  all:\n'
+        '    description: All.\n'
+        '    after: [api:test]\n'
+        '    steps: echo all\n'
+    )
+    (tmp_path / 'api' / 'Mofile').write_text(
+        'tasks:\n'
+        '  build:\n'
+        '    description: Build.\n'
+        '    inputs: src/*.c\n'
+        '    steps: make\n'
+        '  test:\n'
+        '    description: Test.\n'
+        '    after: [build]\n'
+        '    steps: make test\n'
+    )
+
+
+def test_include(tmp_path):
+    write_monorepo(tmp_path)
+
+    project = mofile.load(tmp_path / 'Mofile')
+
+    assert project.tasks['all'].dependencies == ['api:test']
+
+    build = project.tasks['api:build']
+    assert build.inputs == ['api/src/*.c']
+    assert build.directory == 'api'
+    assert project.tasks['api:test'].dependencies == ['api:build']
+
+
+def test_include_default_descriptions(tmp_path):
+    write_monorepo(tmp_path)
+    path = tmp_path / 'api' / 'Mofile'
+    path.write_text(path.read_text().replace('    description: Test.\n', ''))
+
+    project = mofile.load(tmp_path / 'Mofile')
+
+    assert project.tasks['api:test'].description == 'Run the tests.'
+
+
+def test_include_only_parses_changed_files(tmp_path, monkeypatch):
+    write_monorepo(tmp_path)
+    mofile.load(tmp_path / 'Mofile')
+
+    parsed = []
+    parse = mofile.parse
+    monkeypatch.setattr(mofile, 'parse', lambda data, format: (
+        parsed.append(data) or parse(data, format)
+    ))
+
+    path = tmp_path / 'api' / 'Mofile'
+    path.write_text(path.read_text().replace('make test', 'make check'))
+
+    project = mofile.load(tmp_path / 'Mofile')
+
+    assert project.tasks['api:test'].steps[0].args == 'make check'
+    assert len(parsed) == 1
+
+
+def test_include_cycle(tmp_path):
+    write_monorepo(tmp_path)
+    with (tmp_path / 'api' / 'Mofile').open('a') as file:
+        file.write('include: [../Mofile]\n')
+
+    with pytest.raises(mofile.IncludeError, match='cycle'):
+        mofile.load(tmp_path / 'Mofile')
+
+
+def test_include_duplicate_task(tmp_path):
+    write_monorepo(tmp_path)
+    with (tmp_path / 'Mofile').open('a') as file:
+        file.write('  api:test:\n    description: Test.\n')
+
+    with pytest.raises(mofile.IncludeError, match='already defined'):
+        mofile.load(tmp_path / 'Mofile')
+
+
+def test_include_duplicate_namespace(tmp_path):
+    for name in ('a', 'b'):
+        (tmp_path / name / 'lib').mkdir(parents=True)
+        (tmp_path / name / 'lib' / 'Mofile').write_text(
+            f'tasks:\n  {name}:\n    description: {name}.\n    steps: make\n'
+        )
+
+    (tmp_path / 'Mofile').write_text('include: [a/lib/Mofile, b/lib/Mofile]\n')
+
+    with pytest.raises(mofile.IncludeError, match='both named lib'):
+        mofile.load(tmp_path / 'Mofile')
@@ -0,0 +1,29 @@
+from difflib import SequenceMatcher
+import random
+import string
+
+from mo.project import TaskIndex
+
+
+def similar(name, names):
+    return [n for n in names if SequenceMatcher(None, name, n).ratio() >= 0.75]
+
+
+def test_index_finds_same_tasks_as_full_scan():
+    rng = random.Random(0)
+    alphabet = string.ascii_lowercase[:6] + ':'
+
+    names = list({
+        ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 12)))
+        for _ in range(300)
+    })
+
+    index = TaskIndex(names)
+
+    for name in names[:50]:
+        typo = list(name)
+        typo[rng.randrange(len(typo))] = rng.choice(alphabet)
+        typo = ''.join(typo)
+
+        assert index.search(typo) == similar(typo, names)
+        assert index.search(name) == similar(name, names)
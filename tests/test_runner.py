@@ -0,0 +1,256 @@
+from pathlib import Path
+import io
+import re
+
+import pytest
+
+from mo.frontends import Human
+from mo.project import Project
+from mo.runner import Runner
+from mo.scheduler import Scheduler
+
+
+pytestmark = pytest.mark.usefixtures('chdir')
+
+
+TASKS = {
+    'bootstrap': {'steps': [{'print': 'bootstrap'}]},
+    'test': {'steps': [{'print': 'test'}], 'after': ['bootstrap']},
+    'docs': {'steps': [{'print': 'docs'}], 'after': ['bootstrap']},
+}
+
+
+@pytest.fixture
+def run(make_project):
+    def run(jobs, *tasks):
+        runner = Runner(make_project(TASKS), {}, jobs)
+        for task in tasks:
+            runner.queue_task(task)
+        return list(runner.run())
+
+    return run
+
+
+def finished(events):
+    return [e.task for e in events if e.name == 'FinishedTask']
+
+
+def test_run_sequentially(run):
+    events = run(1, 'test', 'docs')
+    assert finished(events) == ['bootstrap', 'test', 'docs']
+
+
+def test_run_concurrently(run):
+    events = run(4, 'test', 'docs')
+    order = finished(events)
+    assert order[0] == 'bootstrap'
+    assert sorted(order[1:]) == ['docs', 'test']
+
+
+def test_events_are_tagged_with_task(run):
+    events = run(4, 'test', 'docs')
+    for event in events:
+        if event.name == 'CommandOutput':
+            assert event.task == event.args['output']
+
+
+def test_task_not_found(run):
+    events = run(4, 'nothing')
+    assert events[-1].name == 'TaskNotFound'
+
+
+def test_timing_events(run):
+    events = run(1, 'test')
+
+    timed = [(e.name, e.task) for e in events if e.name.endswith('Timing')]
+    assert timed == [
+        ('StepTiming', 'bootstrap'), ('TaskTiming', 'bootstrap'),
+        ('StepTiming', 'test'), ('TaskTiming', 'test'),
+    ]
+
+    for event in events:
+        if event.name.endswith('Timing'):
+            assert event.timing.wall >= 0
+
+
+def test_longest_tasks_are_started_first(make_project):
+    project = make_project(TASKS)
+    graph = {
+        name: (project.tasks[name], [])
+        for name in ('bootstrap', 'test', 'docs')
+    }
+    estimates = {'bootstrap': 1, 'test': 5, 'docs': 3}
+
+    scheduler = Scheduler(graph, lambda task: iter([]), 2, estimates)
+    started = [e.task for e in scheduler.run() if e.name == 'RunningTask']
+
+    assert started[:2] == ['test', 'docs']
+
+
+def test_critical_paths():
+    graph = {
+        'bootstrap': (None, []),
+        'test': (None, ['bootstrap']),
+        'docs': (None, ['bootstrap']),
+    }
+    estimates = {'bootstrap': 1, 'test': 5, 'docs': None}
+
+    scheduler = Scheduler(graph, None, 2, estimates)
+    lengths = scheduler.critical_paths(
+        {'bootstrap': ['test', 'docs'], 'test': [], 'docs': []}
+    )
+
+    assert lengths == {'bootstrap': 6, 'test': 5, 'docs': 0}
+
+
+def test_cancel():
+    import threading
+    import time
+
+    project = Project({
+        'tasks': {'slow': {'description': 'Slow.', 'steps': ['sleep 10']}},
+    }, Path('.'))
+    runner = Runner(project, {})
+    runner.queue_task('slow')
+
+    received = []
+    thread = threading.Thread(target=lambda: received.extend(runner.run()))
+    thread.start()
+
+    time.sleep(0.5)
+    start = time.monotonic()
+    runner.cancel()
+    thread.join(5)
+
+    assert time.monotonic() - start < 2
+    assert 'FinishedTask' not in [e.name for e in received]
+    assert runner.tasks_run == []
+
+
+def test_dependency_cycle_is_found_before_running():
+    project = Project({
+        'tasks': {
+            'a': {'description': 'A.', 'steps': ['echo a'], 'after': ['b']},
+            'b': {'description': 'B.', 'steps': ['echo b'], 'after': ['a']},
+        }
+    }, Path('.'))
+
+    events = list(Runner(project, {}).run_task('a'))
+
+    assert [e.name for e in events if e.kind.value == 'error'] == \
+        ['DependencyCycle']
+    assert events[-1].tasks == ['a', 'b', 'a']
+    assert 'RunningTask' not in [e.name for e in events]
+
+
+def test_templates_are_checked_before_running():
+    project = Project({
+        'tasks': {
+            'first': {'description': 'First.', 'steps': ['echo first']},
+            'second': {'description': 'Second.', 'steps': ['echo {missing}'],
+                       'after': ['first']},
+        }
+    }, Path('.'))
+
+    events = list(Runner(project, {}).run_task('second'))
+
+    assert events[-1].name == 'InvalidStep'
+    assert 'RunningTask' not in [e.name for e in events]
+
+
+def test_plan():
+    project = Project({
+        'variables': {'name': {'description': 'A name.', 'default': 'x'}},
+        'tasks': {
+            'bootstrap': {'description': 'Bootstrap.',
+                          'steps': ['echo {name}']},
+            'test': {'description': 'Test.', 'steps': ['pytest {name}'],
+                     'after': ['bootstrap']},
+        }
+    }, Path('.'))
+
+    events = list(Runner(project, {'name': 'mo'}).plan(['test']))
+
+    plan = events[-1].tasks
+    assert [(p.name, p.dependencies) for p in plan] == \
+        [('bootstrap', []), ('test', ['bootstrap'])]
+    assert [step.args for step in plan[1].steps] == ['pytest mo']
+
+
+def parallel_project(delay, **options):
+    return Project({
+        'variables': {'delay': {'description': 'Delay.', 'default': delay}},
+        'tasks': {
+            'lint': {
+                'description': 'Lint.',
+                'steps': [{'parallel': {'steps': [
+                    'sleep {delay}; echo slow', 'exit 1', 'echo fast',
+                ], **options}}],
+            },
+        }
+    }, Path('.'))
+
+
+def test_parallel_step_fails_fast():
+    import time
+
+    start = time.monotonic()
+    events = list(Runner(parallel_project(5), {}).run_task('lint'))
+
+    assert time.monotonic() - start < 2
+    assert [e.command for e in events if e.name == 'CommandFailed'] == \
+        ['[2] exit 1']
+    assert 'FinishedTask' not in [e.name for e in events]
+
+    stream = io.StringIO()
+    frontend = Human(stream)
+    for event in events:
+        frontend.output(event)
+    assert re.search(r'failed with exit code 1: .*\[2\] exit 1',
+                     stream.getvalue())
+
+
+def test_parallel_step_collects_failures():
+    project = parallel_project(0.5, fail_fast=False, jobs=2)
+    events = list(Runner(project, {}).run_task('lint'))
+
+    output = [e.output for e in events if e.name == 'CommandOutput']
+    assert output == [b'[3] fast', b'[1] slow']
+    assert 'FinishedTask' not in [e.name for e in events]
+
+
+def shell_project(*steps):
+    return Project({
+        'tasks': {
+            'build': {'description': 'Build.', 'shell': 'persistent',
+                      'steps': list(steps)},
+        }
+    }, Path('.'))
+
+
+def test_persistent_shell_keeps_state():
+    project = shell_project('mkdir -p out && cd out', 'export NAME=mo',
+                            'echo "$NAME in $(basename "$PWD")"')
+    events = list(Runner(project, {}).run_task('build'))
+
+    assert [e.output for e in events if e.name == 'CommandOutput'] == \
+        [b'mo in out']
+    assert events[-1].name == 'FinishedTask'
+
+
+def test_persistent_shell_failure():
+    project = shell_project('echo oops >&2; exit 3', 'echo never')
+    events = list(Runner(project, {}).run_task('build'))
+
+    assert [(e.pipe, e.output) for e in events if e.name == 'CommandOutput'] \
+        == [('stderr', b'oops')]
+    assert [e.code for e in events if e.name == 'CommandFailed'] == [3]
+    assert 'FinishedTask' not in [e.name for e in events]
+
+
+def test_persistent_shell_syntax_error():
+    project = shell_project("echo 'abc", 'echo after')
+    events = list(Runner(project, {}).run_task('build'))
+
+    assert [e.code for e in events if e.name == 'CommandFailed'] == [2]
+    assert 'FinishedTask' not in [e.name for e in events]
@@ -0,0 +1,144 @@
+from pathlib import Path
+
+import pytest
+
+from mo.project import Project
+from mo.runner import Runner
+from mo.steps import _pip_name, package_managers
+
+
+STUB = '''#!/bin/sh
+echo "$@" >> "{log}"
+if [ "$1" = list ] && [ "$2" = --cask ]; then
+    echo firefox
+elif [ "$1" = list ]; then
+    cat "{installed}"
+elif [ "$1" = install ]; then
+    shift
+    for package in "$@"; do echo "$package" >> "{installed}"; done
+fi
+'''
+
+
+@pytest.fixture
+def brew(tmp_path, monkeypatch):
+    log, installed = tmp_path / 'log', tmp_path / 'installed'
+    installed.write_text('git\n')
+
+    bin = tmp_path / 'bin'
+    bin.mkdir()
+    stub = bin / 'brew'
+    stub.write_text(STUB.format(log=log, installed=installed))
+    stub.chmod(0o755)
+
+    monkeypatch.setenv('PATH', f'{bin}:{Path("/bin")}:{Path("/usr/bin")}')
+    monkeypatch.chdir(tmp_path)
+
+    manager = package_managers['brew']
+    manager.forget()
+    yield log
+    manager.forget()
+
+
+def test_packages_are_listed_once_and_installed_together(brew):
+    project = Project({
+        'tasks': {
+            'bootstrap': {'steps': [{'brew': ['git', 'jq', 'ripgrep']}]},
+            'setup': {'steps': [{'brew': 'jq git'}], 'after': ['bootstrap']},
+        }
+    }, Path('.'))
+
+    events = list(Runner(project, {}).run_task('setup'))
+
+    assert [e.name for e in events].count('FinishedTask') == 2
+    assert brew.read_text().splitlines() == [
+        'list --formula -1',
+        'list --cask -1',
+        'install jq ripgrep',
+    ]
+
+
+def test_casks_and_tapped_packages_are_seen_as_installed(brew):
+    project = Project({
+        'tasks': {'setup': {'steps': [{'brew': 'firefox user/tap/git'}]}}
+    }, Path('.'))
+
+    list(Runner(project, {}).run_task('setup'))
+
+    assert 'install' not in brew.read_text()
+
+
+def test_packages_are_listed_again_each_run(brew):
+    project = Project({
+        'tasks': {'setup': {'steps': [{'brew': 'jq'}]}}
+    }, Path('.'))
+
+    for _ in range(2):
+        list(Runner(project, {}).run_task('setup'))
+
+    assert brew.read_text().splitlines() == [
+        'list --formula -1',
+        'list --cask -1',
+        'install jq',
+        'list --formula -1',
+        'list --cask -1',
+    ]
+
+
+def test_installed_packages_are_parsed():
+    assert _pip_name('Some_Package[extra]>=1.0') == 'some-package'
+    assert set(package_managers['pip'].parse('Foo.Bar==1.0\nbaz==2\n')) == \
+        {'foo-bar', 'baz'}
+
+    output = 'ii curl\nrc removed\nii git\n'
+    assert set(package_managers['apt'].parse(output)) == {'curl', 'git'}
+
+
+def test_commands_without_shell_features_are_split():
+    from mo.steps import CommandLine, split_command
+
+    command = split_command('echo "hello world"')
+    assert isinstance(command, CommandLine)
+    assert command.argv == ['echo', 'hello world']
+
+    for needs_shell in ('echo $HOME', 'make && make install', 'cd docs',
+                        'FOO=1 make', 'ls *.py', 'echo "unterminated'):
+        assert not isinstance(split_command(needs_shell), CommandLine)
+
+
+def test_commands_run_without_shell(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    project = Project({
+        'tasks': {
+            'test': {'steps': ['echo "hello  world"', 'no-such-command']},
+        }
+    }, Path('.'))
+
+    events = list(Runner(project, {}).run_task('test'))
+
+    output = [e.output for e in events if e.name == 'CommandOutput']
+    assert output == [b'hello  world', b'no-such-command: not found']
+    failed = [e for e in events if e.name == 'CommandFailed']
+    assert [e.code for e in failed] == [127]
+
+
+def test_relative_commands_run_in_task_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    script = tmp_path / 'sub' / 'run.sh'
+    script.parent.mkdir()
+    script.write_text('#!/bin/sh\necho ran\n')
+    script.chmod(0o755)
+
+    project = Project({
+        'tasks': {
+            'test': {'directory': 'sub', 'steps': ['./run.sh', './missing']},
+        }
+    }, Path('.'))
+
+    events = list(Runner(project, {}).run_task('test'))
+
+    output = [e.output for e in events if e.name == 'CommandOutput']
+    assert output[0] == b'ran'
+    assert [e.code for e in events if e.name == 'CommandFailed'] == [127]
@@ -0,0 +1,139 @@
+from pathlib import Path
+import threading
+import time
+
+import pytest
+
+from mo import watch
+from mo.watch import InotifyWatcher, PollingWatcher, Watch, glob_base
+
+
+def test_glob_base():
+    assert glob_base('src/*.py') == (Path('src'), False)
+    assert glob_base('src/**/*.py') == (Path('src'), True)
+    assert glob_base('*.py') == (Path(), False)
+    assert glob_base('setup.py') == (Path(), False)
+
+
+def make_watcher(cls, path):
+    try:
+        return cls(path, ['src/*.txt'], [path / 'Mofile'])
+    except OSError:
+        pytest.skip('inotify is not available')
+
+
+@pytest.mark.parametrize('cls', [PollingWatcher, InotifyWatcher])
+def test_watcher(tmp_path, cls):
+    (tmp_path / 'src').mkdir()
+    (tmp_path / 'src' / 'a.txt').write_text('a\n')
+    (tmp_path / 'Mofile').write_text('')
+
+    watcher = make_watcher(cls, tmp_path)
+
+    try:
+        assert watcher.changes(0.1) == set()
+
+        (tmp_path / 'src' / 'a.txt').write_text('changed')
+        assert tmp_path / 'src' / 'a.txt' in watcher.changes(2)
+
+        (tmp_path / 'src' / 'b.txt').write_text('b\n')
+        assert tmp_path / 'src' / 'b.txt' in watcher.changes(2)
+    finally:
+        watcher.close()
+
+
+def test_watch_reruns_affected_tasks(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(watch.PollingWatcher, 'interval', 0.05)
+
+    (tmp_path / 'src').mkdir()
+    (tmp_path / 'src' / 'a.txt').write_text('a\n')
+    (tmp_path / 'Mofile').write_text(
+        'tasks:\n'
+        '  build:\n'
+        '    description: Build.\n'
+        '    inputs: src/*.txt\n'
+        '    outputs: out.txt\n'
+        '    steps: cat src/*.txt > out.txt\n'
+        '  other:\n'
+        '    description: Other.\n'
+        '    steps: echo other\n'
+        '  all:\n'
+        '    description: All.\n'
+        '    after: [build, other]\n'
+        '    steps: cat out.txt\n'
+    )
+
+    watcher = Watch('Mofile', {}, 1, ['all'])
+    watcher.debounce = 0.05
+    received = []
+
+    # globbing is done without holding the lock
+    globbed_with_lock = []
+    expand = Watch._expand
+    monkeypatch.setattr(Watch, '_expand', lambda self, patterns: (
+        globbed_with_lock.append(self._condition._is_owned()) or
+        expand(self, patterns)
+    ))
+
+    def run():
+        for event in watcher:
+            received.append(event)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+
+    def wait_for_watching(count):
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            if sum(e.name == 'Watching' for e in received) >= count:
+                return
+            time.sleep(0.01)
+        raise AssertionError('timed out')
+
+    try:
+        wait_for_watching(1)
+        (tmp_path / 'src' / 'b.txt').write_text('b\n')
+        wait_for_watching(2)
+    finally:
+        watcher.stop()
+        thread.join()
+
+    second_run = received[[e.name for e in received].index('Watching'):]
+    names = [(e.name, e.task) for e in second_run]
+
+    assert ('RunningTask', 'build') in names
+    assert ('RunningTask', 'all') in names
+    assert ('SkippingTask', None) in names
+    assert ('RunningTask', 'other') not in names
+
+    output = [e.output for e in second_run if e.name == 'CommandOutput']
+    assert output == [b'a', b'b']
+
+    assert globbed_with_lock and not any(globbed_with_lock)
+
+
+def test_watch_uses_cache(tmp_path, monkeypatch):
+    from mo.cache import LocalCache
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'Mofile').write_text(
+        'tasks:\n'
+        '  build:\n'
+        '    description: Build.\n'
+        '    inputs: input.txt\n'
+        '    outputs: output.txt\n'
+        '    steps: cp input.txt output.txt\n'
+    )
+    (tmp_path / 'input.txt').write_text('input')
+
+    cache = LocalCache(tmp_path / 'cache')
+    watcher = Watch('Mofile', {}, 1, ['build'], cache)
+
+    names = []
+    for event in watcher:
+        names.append(event.name)
+        if event.name == 'Watching':
+            watcher.stop()
+
+    assert 'StoredInCache' in names